@@ -1,4 +1,5 @@
 #! /bin/bash
+# before submitting, write the partition of the targets: python compute_all_to_all_stats.py partition 64
 #SBATCH -n 1
 #SBATCH -t 04:00:00
 #SBATCH --mem-per-cpu=2500M
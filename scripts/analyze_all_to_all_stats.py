@@ -1,5 +1,3 @@
-import fnmatch
-import pickle
 import os
 
 import matplotlib
@@ -8,13 +6,15 @@ import matplotlib.pyplot as plt
 from matplotlib.ticker import ScalarFormatter
 from scipy.stats import binned_statistic
 
-from util import get_data_or_compute
+import plot_settings
+from stats_store import AllToAllStatsStore
 
 import settings
 from gtfspy.routing.node_profile_analyzer_time_and_veh_legs import NodeProfileAnalyzerTimeAndVehLegs
 
 to_vectors = NodeProfileAnalyzerTimeAndVehLegs.all_measures_and_names_as_lists()
 ALL_TO_ALL_STATS_DIR = os.path.join(settings.RESULTS_DIRECTORY, "all_to_all_stats")
+ALL_TO_ALL_STATS_STORE_DIR = os.path.join(ALL_TO_ALL_STATS_DIR, "store")
 
 from matplotlib import rc
 rc('text', usetex=True)
@@ -25,25 +25,16 @@ See the main block (at the end) for an entry point to this script.
 """
 
 
-def _get_raw_stats_filenames():
-    filenames = [os.path.join(ALL_TO_ALL_STATS_DIR, fname)
-                 for fname in os.listdir(ALL_TO_ALL_STATS_DIR)
-                 if fnmatch.fnmatch(fname, "*all_to_all_stats_target_*.pkl")]
-    filenames = list(sorted(filenames, key=lambda fname: (len(fname), fname)))
-    return filenames
-
-
 def compute_observable_name_matrix(observable_name, limit=None):
-    fnames = _get_raw_stats_filenames()
-    values = []
+    """
+    Read the (targets x origins) matrix of one observable from the consolidated all-to-all store.
+    Only rows of completed targets are included.
+    """
+    store = AllToAllStatsStore(ALL_TO_ALL_STATS_STORE_DIR)
+    _, matrix = store.read_observable_matrix(observable_name)
     if limit:
-        fnames = fnames[:limit]
-    for fname in fnames:
-        print(fname)
-        with open(fname, 'rb') as f:
-            data = pickle.load(f)
-            values.append(data['stats'][observable_name])
-    return numpy.array(values)
+        matrix = matrix[:limit]
+    return numpy.array(matrix)
 
 
 def _plot_2d_pdf(xvalues, yvalues, xbins, ybins, aspect='equal', ax=None):
@@ -100,13 +91,7 @@ def _load_data():
     numpy.random.seed(seed=10)
     rands = numpy.unique(numpy.random.randint(1, 5000, size=100))
     for observable in observables:
-        matrix = get_data_or_compute(
-            os.path.join(ALL_TO_ALL_STATS_DIR, observable + "_matrix.pkl"),
-            compute_observable_name_matrix,
-            observable,
-            recompute=False,
-            limit=None
-        )
+        matrix = compute_observable_name_matrix(observable)
         # Uncomment below for faster testing of this plotting script.
         # print("Taking only a small sample for faster plot development!")
         # matrix = matrix[rands]
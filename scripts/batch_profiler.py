@@ -0,0 +1,193 @@
+"""
+A time-only profile connection scan over a block of targets at once.
+
+Computes the same profiles as gtfspy's ConnectionScanProfiler (one run per target), but the connections
+are scanned only once per block of targets: all per-stop and per-trip state is stored as vectors
+with one element per target.
+"""
+
+import bisect
+import heapq
+
+import numpy
+
+from gtfspy.routing.abstract_routing_algorithm import AbstractRoutingAlgorithm
+from gtfspy.routing.label import LabelTimeSimple
+from gtfspy.routing.node_profile_simple import NodeProfileSimple
+
+
+class BatchConnectionScanProfiler(AbstractRoutingAlgorithm):
+    """
+    Batched version of gtfspy.routing.connection_scan_profile.ConnectionScanProfiler.
+
+    The profile of each stop is stored as an append-only list of entries (departure_time, arrival_times)
+    in decreasing order of departure time, where arrival_times[j] is the earliest arrival time at the j'th target
+    among all labels departing at or after departure_time.
+    Labels created by footpaths (departing earlier than the connection being scanned)
+    are kept in a heap until the scan reaches their departure time, which keeps the entries ordered.
+    """
+
+    def __init__(self, connections, targets, transfer_margin=0, walk_network=None, walk_speed=1.5, verbose=False):
+        """
+        Parameters
+        ----------
+        connections: connection_store.ConnectionStore
+            ordered by DECREASING departure time
+        targets: list[int]
+        transfer_margin: int, optional
+        walk_network: walk_network.CSRWalkNetwork, optional
+        walk_speed: float, optional
+            walking speed between stops in meters / second
+        verbose: bool, optional
+        """
+        AbstractRoutingAlgorithm.__init__(self)
+        self._connections = connections
+        self._targets = list(targets)
+        self._transfer_margin = transfer_margin
+        self._walk_network = walk_network
+        self._walk_speed = float(walk_speed)
+        self._verbose = verbose
+
+        n_targets = len(self._targets)
+        max_stop_I = max([int(numpy.max(connections.from_stop_I, initial=0)),
+                          int(numpy.max(connections.to_stop_I, initial=0))] + [int(t) for t in self._targets])
+        if walk_network is not None and len(walk_network) > 0:
+            max_stop_I = max(max_stop_I, int(walk_network.nodes_array[-1]))
+        n_trips = int(numpy.max(connections.trip_I, initial=0)) + 1
+
+        # walking durations to each target (as in ConnectionScanProfiler, neighbors of a target override it):
+        self._walk_to_target_durations = numpy.full((max_stop_I + 1, n_targets), float("inf"))
+        for j, target in enumerate(self._targets):
+            self._walk_to_target_durations[target, j] = 0
+            if walk_network is not None and target in walk_network:
+                neighbors, d_walks, _ = walk_network.neighbor_arrays(target)
+                self._walk_to_target_durations[neighbors, j] = d_walks / self._walk_speed
+        self._trip_min_arrival_times = numpy.full((n_trips, n_targets), float("inf"))
+        self._inf_vector = numpy.full(n_targets, float("inf"))
+
+        # profile entries: per stop, negated departure times (for bisect) and running minimum arrival times
+        self._stop_negative_dep_times = [[] for _ in range(max_stop_I + 1)]
+        self._stop_min_arrival_times = [[] for _ in range(max_stop_I + 1)]
+        # labels departing before the current scan time: (-departure_time, counter, stop, arrival_times)
+        self._pending_labels = []
+        # all non-dominated labels: stop, departure_time, arrival_times (inf for targets without a new label)
+        self._label_stops = []
+        self._label_dep_times = []
+        self._label_arrival_times = []
+
+    def _add_entry(self, stop, dep_time, arrival_times):
+        negative_dep_times = self._stop_negative_dep_times[stop]
+        min_arrival_times = self._stop_min_arrival_times[stop]
+        if min_arrival_times:
+            arrival_times = numpy.minimum(min_arrival_times[-1], arrival_times)
+        negative_dep_times.append(-dep_time)
+        min_arrival_times.append(arrival_times)
+
+    def _evaluate(self, stop, dep_time):
+        """
+        Earliest arrival times at targets for labels departing from stop at or after dep_time.
+        """
+        n_valid = bisect.bisect_right(self._stop_negative_dep_times[stop], -dep_time)
+        if n_valid == 0:
+            return self._inf_vector
+        return self._stop_min_arrival_times[stop][n_valid - 1]
+
+    def _add_pending_labels(self, current_dep_time):
+        pending = self._pending_labels
+        while pending and -pending[0][0] >= current_dep_time:
+            negative_dep_time, _, stop, arrival_times = heapq.heappop(pending)
+            self._add_entry(stop, -negative_dep_time, arrival_times)
+
+    def _run(self):
+        connections = self._connections
+        columns = [connections.from_stop_I.tolist(), connections.to_stop_I.tolist(),
+                   connections.dep_time_ut.tolist(), connections.arr_time_ut.tolist(), connections.trip_I.tolist()]
+        n_connections = len(connections)
+        walk_to_target_durations = self._walk_to_target_durations
+        trip_min_arrival_times = self._trip_min_arrival_times
+        counter = 0
+        for i, (dep_stop, arr_stop, dep_time, arr_time, trip_I) in enumerate(zip(*columns)):
+            if self._verbose and i % 10000 == 0:
+                print(i, "/", n_connections)
+            self._add_pending_labels(dep_time)
+
+            arrival_times_via_transfer = numpy.minimum(
+                arr_time + walk_to_target_durations[arr_stop],
+                self._evaluate(arr_stop, arr_time + self._transfer_margin)
+            )
+            min_arrival_times = numpy.minimum(trip_min_arrival_times[trip_I], arrival_times_via_transfer)
+            trip_min_arrival_times[trip_I] = min_arrival_times
+
+            # labels not dominated by the direct walk, or by labels departing at the same time or later:
+            is_new = (min_arrival_times < dep_time + walk_to_target_durations[dep_stop]) & \
+                     (min_arrival_times < self._evaluate(dep_stop, dep_time))
+            if not is_new.any():
+                continue
+            new_arrival_times = numpy.where(is_new, min_arrival_times, float("inf"))
+            self._add_entry(dep_stop, dep_time, new_arrival_times)
+            self._label_stops.append(dep_stop)
+            self._label_dep_times.append(dep_time)
+            self._label_arrival_times.append(new_arrival_times)
+
+            # footpaths to the departure stop:
+            if self._walk_network is None:
+                continue
+            neighbors, d_walks, _ = self._walk_network.neighbor_arrays(dep_stop)
+            for neighbor, d_walk in zip(neighbors.tolist(), d_walks.tolist()):
+                neighbor_dep_time = dep_time - d_walk / self._walk_speed
+                self._label_stops.append(neighbor)
+                self._label_dep_times.append(neighbor_dep_time)
+                self._label_arrival_times.append(new_arrival_times)
+                if neighbor_dep_time >= dep_time:
+                    self._add_entry(neighbor, neighbor_dep_time, new_arrival_times)
+                else:
+                    counter += 1
+                    heapq.heappush(self._pending_labels, (-neighbor_dep_time, counter, neighbor, new_arrival_times))
+
+    @property
+    def stop_profiles(self):
+        """
+        Returns
+        -------
+        target_to_stop_profiles: dict
+            mapping from target to a dict[int, NodeProfileSimple]
+            (containing stops with at least one label or within walking distance of the target)
+        """
+        assert self._has_run
+        target_to_stop_profiles = {target: {} for target in self._targets}
+        walk_to_target_durations = self._walk_to_target_durations
+        for j, target in enumerate(self._targets):
+            for stop in numpy.nonzero(walk_to_target_durations[:, j] < float("inf"))[0].tolist():
+                target_to_stop_profiles[target][stop] = NodeProfileSimple(walk_to_target_durations[stop, j])
+        if not self._label_stops:
+            return target_to_stop_profiles
+
+        stops = numpy.array(self._label_stops)
+        dep_times = numpy.array(self._label_dep_times, dtype=float)
+        arrival_times = numpy.array(self._label_arrival_times)
+        # Pareto-optimal labels of each stop and target, in decreasing order of departure time:
+        order = numpy.lexsort((-dep_times, stops))
+        stops, dep_times, arrival_times = stops[order], dep_times[order], arrival_times[order]
+        group_starts = numpy.nonzero(numpy.concatenate([[True], (stops[1:] != stops[:-1]) |
+                                                        (dep_times[1:] != dep_times[:-1])]))[0]
+        stops, dep_times = stops[group_starts], dep_times[group_starts]
+        arrival_times = numpy.minimum.reduceat(arrival_times, group_starts, axis=0)
+        stop_starts = numpy.nonzero(numpy.concatenate([[True], stops[1:] != stops[:-1], [True]]))[0]
+        for start, end in zip(stop_starts[:-1], stop_starts[1:]):
+            stop = int(stops[start])
+            stop_arrival_times = arrival_times[start:end]
+            previous_min = numpy.vstack([self._inf_vector,
+                                         numpy.minimum.accumulate(stop_arrival_times, axis=0)[:-1]])
+            is_pareto_optimal = (stop_arrival_times < previous_min) & \
+                                (stop_arrival_times < dep_times[start:end, numpy.newaxis] +
+                                 walk_to_target_durations[stop])
+            for j in numpy.nonzero(is_pareto_optimal.any(axis=0))[0].tolist():
+                target = self._targets[j]
+                profile = target_to_stop_profiles[target].get(stop)
+                if profile is None:
+                    profile = NodeProfileSimple(walk_to_target_durations[stop, j])
+                    target_to_stop_profiles[target][stop] = profile
+                for k in numpy.nonzero(is_pareto_optimal[:, j])[0].tolist():
+                    profile.update_pareto_optimal_tuples(
+                        LabelTimeSimple(dep_times[start + k], stop_arrival_times[k, j]))
+        return target_to_stop_profiles
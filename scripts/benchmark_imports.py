@@ -0,0 +1,122 @@
+"""
+Import time benchmark of the script modules.
+
+Each module is imported in a fresh python process (so that nothing is imported already), and the duration of
+the import and the heavy (plotting, mapping and data frame) libraries loaded by it are recorded.
+The computations (e.g. compute.py, compute_all_to_all_stats.py) should not load any of these libraries until
+they are used, whereas the plotting scripts load them through plot_settings.py.
+The results are written as json into results/benchmarks/.
+
+Usage:
+    python benchmark_imports.py [module ...]
+    python benchmark_imports.py compare <old_results.json> <new_results.json>
+"""
+
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import numpy
+
+from benchmark_routing import BENCHMARK_RESULTS_DIRECTORY, get_environment_info
+
+DEFAULT_MODULES = ["settings", "util", "extracts", "profile_stats", "compute", "compute_all_to_all_stats",
+                   "stats_server", "plot_profiles_on_a_map"]
+
+HEAVY_MODULES = ["matplotlib", "smopy", "pytz", "networkx", "pandas", "scipy"]
+
+_IMPORT_TIMING_CODE = """
+import importlib, json, sys, time
+n_modules_before = len(sys.modules)
+start_time = time.perf_counter()
+importlib.import_module(sys.argv[1])
+import_time = time.perf_counter() - start_time
+print(json.dumps({"import_time": import_time, "n_modules": len(sys.modules) - n_modules_before,
+                  "heavy_modules": [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+
+def time_import(module_name):
+    """
+    Import a module in a new python process.
+
+    Returns
+    -------
+    result: dict
+        "import_time" (in seconds), "n_modules" (number of modules loaded by the import)
+        and "heavy_modules" (the modules of HEAVY_MODULES loaded by the import)
+    """
+    output = subprocess.check_output([sys.executable, "-c", _IMPORT_TIMING_CODE, module_name] + HEAVY_MODULES,
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def run_import_benchmarks(module_names=None, n_repeats=5, output_fname=None):
+    """
+    Parameters
+    ----------
+    module_names: list[str], optional
+        by default DEFAULT_MODULES
+    n_repeats: int, optional
+    output_fname: str, optional
+        by default a time-stamped file in BENCHMARK_RESULTS_DIRECTORY
+
+    Returns
+    -------
+    output_fname: str
+    """
+    if module_names is None:
+        module_names = DEFAULT_MODULES
+    if output_fname is None:
+        if not os.path.exists(BENCHMARK_RESULTS_DIRECTORY):
+            os.makedirs(BENCHMARK_RESULTS_DIRECTORY)
+        time_stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_fname = os.path.join(BENCHMARK_RESULTS_DIRECTORY, "imports_" + time_stamp + ".json")
+    results = {
+        "created": datetime.datetime.now().isoformat(),
+        "environment": get_environment_info(),
+        "n_repeats": n_repeats,
+        "modules": {}
+    }
+    print("module                          median (s)  modules  heavy modules")
+    for module_name in module_names:
+        repeats = [time_import(module_name) for _ in range(n_repeats)]
+        results["modules"][module_name] = {
+            "import_times": [repeat["import_time"] for repeat in repeats],
+            "n_modules": repeats[-1]["n_modules"],
+            "heavy_modules": repeats[-1]["heavy_modules"]
+        }
+        print("%-30s %11.3f %8d  %s" % (module_name, numpy.median(results["modules"][module_name]["import_times"]),
+                                        repeats[-1]["n_modules"], ", ".join(repeats[-1]["heavy_modules"])))
+    with open(output_fname, "w") as f:
+        json.dump(results, f, indent=1)
+    print("Wrote import benchmark results to " + output_fname)
+    return output_fname
+
+
+def compare_import_benchmark_results(old_fname, new_fname):
+    """
+    Print the median import times of two benchmark results and their ratios (new / old).
+    """
+    with open(old_fname) as f:
+        old_results = json.load(f)
+    with open(new_fname) as f:
+        new_results = json.load(f)
+    print("module                            old (s)     new (s)    new / old")
+    for module_name, new_result in new_results["modules"].items():
+        old_result = old_results["modules"].get(module_name)
+        if old_result is None:
+            print("%-30s (not in the old results)" % module_name)
+            continue
+        old_time = numpy.median(old_result["import_times"])
+        new_time = numpy.median(new_result["import_times"])
+        print("%-30s %10.3f  %10.3f  %10.2f" % (module_name, old_time, new_time, new_time / old_time))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        compare_import_benchmark_results(sys.argv[2], sys.argv[3])
+    else:
+        run_import_benchmarks(sys.argv[1:] or None)
@@ -0,0 +1,215 @@
+"""
+Routing benchmarks on synthetic temporal networks (see synthetic_network.py) of several sizes.
+
+For each scale, a network is generated and written as csv extracts, and the durations of the stages of
+computing the profiles towards one target (the stop with the most departures) are measured:
+    ingest           reading the extracts (compute.read_routing_inputs, without the input cache)
+    profiler_init    creating the MultiObjectivePseudoCSAProfiler (incl. the pseudo connections)
+    profiler_run     MultiObjectivePseudoCSAProfiler.run
+    statistics       profile_stats.compute_profile_statistics for all stops
+    serialization    writing the profiles with profile_store.write_profile_store
+    deserialization  reading all profiles back from the profile store
+The results are written as json into results/benchmarks/, so that the durations (and their scaling with the
+network size) can be compared between versions.
+
+Usage:
+    python benchmark_routing.py [layout] [scale ...]
+    python benchmark_routing.py compare <old_results.json> <new_results.json>
+"""
+
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+from compute import read_routing_inputs, _get_new_csp, _fill_default_params, _get_params
+from profile_stats import compute_profile_statistics
+from profile_store import ProfileStore, write_profile_store
+from settings import RESULTS_DIRECTORY
+from synthetic_network import generate_synthetic_network, write_synthetic_network, DEFAULT_START_TIME_UT
+
+BENCHMARK_RESULTS_DIRECTORY = os.path.join(RESULTS_DIRECTORY, "benchmarks")
+
+# parameters of generate_synthetic_network for each scale:
+SCALES = {
+    "small": {"n_stops": 100, "n_routes": 4, "headway": 600},
+    "medium": {"n_stops": 400, "n_routes": 8, "headway": 450},
+    "large": {"n_stops": 1600, "n_routes": 16, "headway": 300},
+    "xlarge": {"n_stops": 6400, "n_routes": 32, "headway": 300},
+}
+DEFAULT_SCALES = ["small", "medium", "large"]
+
+STAGES = ["ingest", "profiler_init", "profiler_run", "statistics", "serialization", "deserialization"]
+
+# routing from one hour after the start of service, as with the Helsinki extracts:
+_ROUTING_START_TIME_DEP = DEFAULT_START_TIME_UT + 3600
+_ANALYSIS_DURATION = 3600
+_ROUTING_DURATION = 3 * 3600
+
+
+def _get_git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_environment_info():
+    return {
+        "git_revision": _get_git_revision(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "hostname": socket.gethostname()
+    }
+
+
+def _get_busiest_stop_I(connections):
+    return int(numpy.argmax(numpy.bincount(connections["from_stop_I"].values)))
+
+
+def benchmark_scale(layout, scale_params, work_directory, n_repeats=1):
+    """
+    Run the benchmark stages on one synthetic network.
+
+    Returns
+    -------
+    result: dict
+        "network" (the parameters of generate_synthetic_network), "sizes" (numbers of stops, connections,
+        walking transfers and final profile labels) and "durations" (mapping from stage to the durations,
+        in seconds, of each repeat)
+    """
+    network_params = dict(scale_params, layout=layout)
+    network = generate_synthetic_network(**network_params)
+    fnames = write_synthetic_network(network, work_directory)
+    target = _get_busiest_stop_I(network["connections"])
+    stop_Is = network["nodes"]["stop_I"].values
+    params = _fill_default_params(_get_params([target], routing_start_time_dep=_ROUTING_START_TIME_DEP,
+                                              routing_end_time_dep=_ROUTING_START_TIME_DEP + _ROUTING_DURATION))
+
+    durations = {stage: [] for stage in STAGES}
+    n_labels = None
+    for _ in range(n_repeats):
+        start_time = time.perf_counter()
+        connections, net = read_routing_inputs(params["routing_start_time_dep"], params["routing_end_time_dep"],
+                                               params["max_walk_distance"], events_fname=fnames["connections"],
+                                               transfers_fname=fnames["transfers"], use_cache=False)
+        durations["ingest"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        csp = _get_new_csp(connections, net, [target], params, verbose=False)
+        durations["profiler_init"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        csp.run()
+        durations["profiler_run"].append(time.perf_counter() - start_time)
+        profiles = csp.stop_profiles
+
+        start_time = time.perf_counter()
+        compute_profile_statistics(profiles, stop_Is, params["routing_start_time_dep"],
+                                   params["routing_start_time_dep"] + _ANALYSIS_DURATION)
+        durations["statistics"].append(time.perf_counter() - start_time)
+
+        store_directory = os.path.join(work_directory, "profiles")
+        start_time = time.perf_counter()
+        write_profile_store(store_directory, profiles, {"targets": [target]})
+        durations["serialization"].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        ProfileStore(store_directory).get_profiles()
+        durations["deserialization"].append(time.perf_counter() - start_time)
+        shutil.rmtree(store_directory)
+        n_labels = sum(len(profile.get_final_optimal_labels()) for profile in profiles.values())
+
+    sizes = {
+        "n_stops": len(stop_Is),
+        "n_connections": len(connections),
+        "n_walk_edges": len(network["transfers"]),
+        "n_final_labels": n_labels
+    }
+    return {"network": network_params, "sizes": sizes, "durations": durations}
+
+
+def run_benchmarks(layout="grid", scales=None, n_repeats=1, output_fname=None):
+    """
+    Parameters
+    ----------
+    layout: str, optional
+        see synthetic_network.generate_synthetic_network
+    scales: list[str], optional
+        keys of SCALES, by default DEFAULT_SCALES
+    n_repeats: int, optional
+    output_fname: str, optional
+        by default a time-stamped file in BENCHMARK_RESULTS_DIRECTORY
+
+    Returns
+    -------
+    output_fname: str
+    """
+    if scales is None:
+        scales = DEFAULT_SCALES
+    if output_fname is None:
+        if not os.path.exists(BENCHMARK_RESULTS_DIRECTORY):
+            os.makedirs(BENCHMARK_RESULTS_DIRECTORY)
+        time_stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_fname = os.path.join(BENCHMARK_RESULTS_DIRECTORY, "routing_" + layout + "_" + time_stamp + ".json")
+    results = {
+        "created": datetime.datetime.now().isoformat(),
+        "environment": get_environment_info(),
+        "layout": layout,
+        "n_repeats": n_repeats,
+        "scales": {}
+    }
+    work_directory = tempfile.mkdtemp(prefix="benchmark_routing_")
+    try:
+        for scale in scales:
+            print("Benchmarking the " + scale + " " + layout + " network")
+            results["scales"][scale] = benchmark_scale(layout, SCALES[scale], os.path.join(work_directory, scale),
+                                                       n_repeats)
+            durations = results["scales"][scale]["durations"]
+            print("  " + ", ".join("%s %.3f s" % (stage, min(durations[stage])) for stage in STAGES))
+    finally:
+        shutil.rmtree(work_directory)
+    with open(output_fname, "w") as f:
+        json.dump(results, f, indent=1)
+    print("Wrote benchmark results to " + output_fname)
+    return output_fname
+
+
+def compare_benchmark_results(old_fname, new_fname):
+    """
+    Print the ratios of the (minimum) stage durations of two benchmark results (new / old).
+    """
+    with open(old_fname) as f:
+        old_results = json.load(f)
+    with open(new_fname) as f:
+        new_results = json.load(f)
+    print("scale     stage               old (s)     new (s)    new / old")
+    for scale, new_result in new_results["scales"].items():
+        old_result = old_results["scales"].get(scale)
+        if old_result is None or old_result["network"] != new_result["network"]:
+            print("%-9s (not comparable)" % scale)
+            continue
+        for stage in STAGES:
+            old_duration = min(old_result["durations"][stage])
+            new_duration = min(new_result["durations"][stage])
+            print("%-9s %-16s %10.3f  %10.3f  %10.2f" % (scale, stage, old_duration, new_duration,
+                                                         new_duration / old_duration if old_duration else float("nan")))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        compare_benchmark_results(sys.argv[2], sys.argv[3])
+    else:
+        layout = sys.argv[1] if len(sys.argv) > 1 else "grid"
+        scales = sys.argv[2:] if len(sys.argv) > 2 else None
+        run_benchmarks(layout, scales)
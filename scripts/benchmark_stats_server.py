@@ -0,0 +1,89 @@
+"""
+Load test of stats_server.py: starts a server on a free local port, and reports the latency percentiles
+of random queries of each type, sent by n_clients concurrent clients.
+
+Usage:
+    python benchmark_stats_server.py [n_queries_per_type] [n_clients] [store_directory]
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import numpy
+
+from stats_server import StatsServer
+from settings import ALL_TO_ALL_STATS_STORE_DIRECTORY
+
+
+def _get_query_urls(base_url, observable_names, stop_Is, target_Is, n_queries):
+    urls = {"point": [], "to_target": [], "from_origin": [], "top_k": []}
+    for _ in range(n_queries):
+        observable = random.choice(observable_names)
+        origin, target = random.choice(stop_Is), random.choice(target_Is)
+        urls["point"].append("%s/point?observable=%s&origin=%d&target=%d" % (base_url, observable, origin, target))
+        urls["to_target"].append("%s/to_target?observable=%s&target=%d" % (base_url, observable, target))
+        urls["from_origin"].append("%s/from_origin?observable=%s&origin=%d" % (base_url, observable, origin))
+        urls["top_k"].append("%s/top_k?observable=%s&origin=%d&k=10" % (base_url, observable, origin))
+    return urls
+
+
+def _run_client(urls, latencies):
+    for url in urls:
+        start_time = time.perf_counter()
+        try:
+            with urlopen(url) as response:
+                response.read()
+        except HTTPError:
+            pass
+        latencies.append(time.perf_counter() - start_time)
+
+
+def run_benchmark(n_queries=1000, n_clients=4, directory=ALL_TO_ALL_STATS_STORE_DIRECTORY):
+    """
+    Returns
+    -------
+    query_type_to_latencies: dict
+        mapping from query type to the latencies (in seconds) of its queries
+    """
+    server = StatsServer(0, directory)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    base_url = "http://%s:%d" % server.server_address
+    try:
+        store = server.queries.reload_if_changed()
+        target_Is = store.get_completed_target_Is().tolist()
+        assert target_Is, "no completed targets in " + directory
+        with urlopen(base_url + "/observables") as response:
+            observable_names = json.loads(response.read().decode("utf-8"))["observables"]
+        query_type_to_urls = _get_query_urls(base_url, observable_names, store.stop_Is.tolist(), target_Is,
+                                             n_queries)
+        query_type_to_latencies = {}
+        for query_type, urls in query_type_to_urls.items():
+            latencies = []
+            clients = [threading.Thread(target=_run_client, args=(urls[i::n_clients], latencies))
+                       for i in range(n_clients)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            query_type_to_latencies[query_type] = numpy.array(latencies)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return query_type_to_latencies
+
+
+if __name__ == "__main__":
+    n_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n_clients = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    directory = sys.argv[3] if len(sys.argv) > 3 else ALL_TO_ALL_STATS_STORE_DIRECTORY
+    query_type_to_latencies = run_benchmark(n_queries, n_clients, directory)
+    print("query type      p50 (ms)   p95 (ms)   p99 (ms)")
+    for query_type, latencies in query_type_to_latencies.items():
+        p50, p95, p99 = numpy.percentile(latencies * 1000, [50, 95, 99])
+        print("%-14s %9.2f  %9.2f  %9.2f" % (query_type, p50, p95, p99))
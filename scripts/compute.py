@@ -1,21 +1,43 @@
 from __future__ import print_function
 
+import glob
+import hashlib
+import json
+import multiprocessing
 import os
 import pickle
+import shutil
+import socket
+import tempfile
+import time
 
-import networkx
 import numpy
-import pandas
-import csv
 
-from gtfspy.routing.node_profile_analyzer_time_and_veh_legs import NodeProfileAnalyzerTimeAndVehLegs
-from gtfspy.routing.node_profile_multiobjective import NodeProfileMultiObjective
-from gtfspy.routing.connection import Connection
+from batch_profiler import BatchConnectionScanProfiler
+from connection_store import ConnectionStore, CONNECTION_ARRAY_NAMES
+from instrumentation import stage
+from extracts import read_extract_columns, read_nodes, read_array_directory, write_array_directory
+from profile_stats import compute_profile_statistics, compute_profile_statistics_for_windows, \
+    compute_time_profile_statistics, get_analysis_windows
+from profile_store import ProfileStore, write_profile_store
+from sampled_profiler import SampledConnectionScan, compute_sampled_arrival_times, \
+    compute_sampled_profile_statistics, get_sample_departure_times, SAMPLED_OBSERVABLE_NAMES
+from scenario import get_changed_trip_Is, find_possibly_affected_targets
+from stats_store import AllToAllStatsStore
+from walk_network import CSRWalkNetwork
+from util import file_fingerprint, evict_least_recently_used_files, get_data_or_compute_cached, get_cache_key, \
+    split_into_balanced_parts
 
-from gtfspy.routing.multi_objective_pseudo_connection_scan_profiler import MultiObjectivePseudoCSAProfiler
+from settings import HELSINKI_DATA_BASEDIR, ROUTING_START_TIME_DEP, ROUTING_END_TIME_DEP, \
+    ANALYSIS_START_TIME_DEP, ANALYSIS_END_TIME_DEP, HELSINKI_TRANSIT_CONNECTIONS_FNAME, HELSINKI_TRANSFERS_FNAME, \
+    INPUT_CACHE_DIRECTORY, INPUT_CACHE_MAX_BYTES, DAY_START, DAY_END, HELSINKI_NODES_FNAME, \
+    RESULT_CACHE_DIRECTORY, RESULT_CACHE_MAX_BYTES, ALL_TO_ALL_STATS_DIRECTORY, ALL_TO_ALL_STATS_STORE_DIRECTORY
 
-from settings import HELSINKI_DATA_BASEDIR, RESULTS_DIRECTORY, ROUTING_START_TIME_DEP, ROUTING_END_TIME_DEP, \
-    ANALYSIS_START_TIME_DEP, HELSINKI_NODES_FNAME, ANALYSIS_END_TIME_DEP, HELSINKI_TRANSIT_CONNECTIONS_FNAME
+# Increase, if the contents of the input cache files change:
+INPUT_CACHE_VERSION = 1
+
+# the input files of routing (and of the statistics), whose fingerprints are part of the result cache keys
+ROUTING_INPUT_FNAMES = [HELSINKI_TRANSIT_CONNECTIONS_FNAME, HELSINKI_TRANSFERS_FNAME, HELSINKI_NODES_FNAME]
 
 
 def target_list_to_str(targets):
@@ -23,44 +45,157 @@ def target_list_to_str(targets):
     return targets_str
 
 
-def get_profile_data(targets=None, recompute=False, **kwargs):
+def get_cached_result(comp_func, *args, recompute=False, key_params=None, **kwargs):
+    """
+    Get the result of comp_func(*args, **kwargs) from the result cache, or compute (and cache) it.
+
+    The cache key covers comp_func, all arguments, key_params and the fingerprints of the input extracts,
+    see util.get_data_or_compute_cached.
+    """
+    return get_data_or_compute_cached(RESULT_CACHE_DIRECTORY, comp_func, *args,
+                                      recompute=recompute,
+                                      key_params=key_params,
+                                      input_fnames=ROUTING_INPUT_FNAMES,
+                                      max_cache_bytes=RESULT_CACHE_MAX_BYTES,
+                                      **kwargs)
+
+
+def _get_resolved_params(targets, **kwargs):
     """
-    Get node profiles from disk, or alternatively compute them based using _compute_profile_data.
+    The full set of routing parameters (including the defaults) that _compute_profile_data(targets, **kwargs) uses.
+    """
+    param_names = ["track_vehicle_legs", "track_time", "routing_start_time_dep", "routing_end_time_dep",
+                   "max_temporal_distance"]
+    params = _get_params(targets, **{name: kwargs[name] for name in param_names if name in kwargs})
+    return _fill_default_params(params)
+
+
+def get_profile_data(targets=None, recompute=False, stop_Is=None, **kwargs):
+    """
+    Get node profiles from the result cache, or alternatively compute them based using _compute_profile_data.
+
+    Profiles with time and boarding count labels are cached in the binary format of profile_store.py,
+    from which only the profiles of stop_Is are loaded.
+
+    Parameters
+    ----------
+    targets: list, optional
+    recompute: bool, optional
+    stop_Is: list, optional
+        stops for which the profiles are returned, by default all
+    kwargs:
+        keyword arguments to be passed to _compute_profile_data
+
+    Returns
+    -------
+    profile_data: dict
+        with keys "params" and "profiles" (mapping from stop_I to NodeProfileMultiObjective)
     """
     if targets is None:
         targets = [115]
-    node_profiles_fname = os.path.join(RESULTS_DIRECTORY, "node_profile_" + target_list_to_str(targets) + ".pickle")
-    if not recompute and os.path.exists(node_profiles_fname):
-        print("Loading precomputed data")
-        profiles = pickle.load(open(node_profiles_fname, 'rb'))
-        print(profiles)
-        print("Loaded precomputed data")
-    else:
-        print("Recomputing profiles")
-        profiles = _compute_profile_data(targets, return_profiler=False, **kwargs)
-        pickle.dump(profiles, open(node_profiles_fname, 'wb'), -1)
-        print("Recomputing profiles")
-    return profiles
+    kwargs["return_profiler"] = False
+    params = _get_resolved_params(targets, **kwargs)
+    if kwargs.get("n_departure_time_samples") is not None:
+        # (approximate statistics instead of profiles, see _compute_sampled_profile_data)
+        return get_cached_result(_compute_profile_data, targets, recompute=recompute, key_params=params, **kwargs)
+    if not (params["track_vehicle_legs"] and params["track_time"]):
+        profile_data = get_cached_result(_compute_profile_data, targets, recompute=recompute, key_params=params,
+                                         **kwargs)
+        return _select_profiles(profile_data, stop_Is)
+
+    key = get_cache_key(_compute_profile_data, [targets], kwargs, params, ROUTING_INPUT_FNAMES)
+    store_directory = os.path.join(RESULT_CACHE_DIRECTORY, "profiles_" + key)
+    if not recompute and os.path.exists(store_directory):
+        print("Loading cached profiles from " + store_directory)
+        with stage("profile_store_read") as record:
+            store = ProfileStore(store_directory)
+            os.utime(store_directory, None)  # mark as recently used
+            profiles = store.get_profiles(stop_Is)
+            record["n_profiles"] = len(profiles)
+        return {"params": store.params, "profiles": profiles}
+
+    profile_data = _compute_profile_data(targets, **kwargs)
+    header_params = dict(profile_data["params"])
+    header_params["targets"] = [int(target) for target in targets]
+    with stage("profile_store_write", n_profiles=len(profile_data["profiles"])):
+        write_profile_store(store_directory, profile_data["profiles"], header_params)
+    evict_least_recently_used_files(RESULT_CACHE_DIRECTORY, RESULT_CACHE_MAX_BYTES)
+    return _select_profiles(profile_data, stop_Is)
+
+
+def _select_profiles(profile_data, stop_Is):
+    if stop_Is is not None:
+        profile_data["profiles"] = {stop_I: profile_data["profiles"][stop_I] for stop_I in stop_Is
+                                    if stop_I in profile_data["profiles"]}
+    return profile_data
 
 
 def get_node_profile_statistics(targets, recompute=False, recompute_profiles=False):
     """
-    Get node profile statistics from pickle cache, or alternatively compute them based on (possibly) existing profiles.
+    Get node profile statistics from the result cache, or alternatively compute them based on (possibly) existing
+    profiles.
     """
-    profile_statistics_fname = os.path.join(RESULTS_DIRECTORY, "node_profile_statistics_" +
-                                            target_list_to_str(targets) + ".pickle")
     if recompute_profiles:
+        get_profile_data(targets, recompute=True)
         recompute = True
-    if not recompute and os.path.exists(profile_statistics_fname):
-        print("Loading precomputed statistics")
-        observable_name_to_data = pickle.load(open(profile_statistics_fname, 'rb'))
-        print("Loaded precomputed statistics")
-    else:
-        print("Recomputing statistics")
-        observable_name_to_data = _compute_node_profile_statistics(targets, recompute_profiles)
-        pickle.dump(observable_name_to_data, open(profile_statistics_fname, 'wb'), -1)
-        print("Recomputed statistics")
-    return observable_name_to_data
+    key_params = {
+        "params": _get_resolved_params(targets),
+        "analysis_start_time_dep": ANALYSIS_START_TIME_DEP,
+        "analysis_end_time_dep": ANALYSIS_END_TIME_DEP
+    }
+    return get_cached_result(_compute_node_profile_statistics, targets, recompute=recompute, key_params=key_params)
+
+
+def get_approximate_node_profile_statistics(targets, n_departure_time_samples=60, departure_time_sampling="grid",
+                                            random_seed=0, recompute=False):
+    """
+    Approximate node profile statistics (temporal distance measures only) from earliest arrival journeys
+    at sampled departure times within the analysis window, see _compute_sampled_profile_data.
+
+    Returns
+    -------
+    observable_name_to_data: dict
+        mapping from observable name to a numpy array (one value per stop, in the order of the nodes extract)
+    observable_name_to_error: dict
+        estimated absolute errors of the temporal distance measures, see
+        sampled_profiler.compute_sampled_profile_statistics
+    """
+    profile_data = get_profile_data(targets, recompute=recompute,
+                                    n_departure_time_samples=n_departure_time_samples,
+                                    departure_time_sampling=departure_time_sampling,
+                                    random_seed=random_seed)
+    return profile_data["statistics"], profile_data["errors"]
+
+
+def get_node_profile_statistics_for_windows(targets, windows=None, recompute=False):
+    """
+    Compute node profile statistics for several analysis windows (by default each hour of the day)
+    from one day-long profile run.
+
+    Parameters
+    ----------
+    targets: list
+    windows: list[tuple], optional
+        (start_time_dep, end_time_dep) pairs, by default the hours from DAY_START to two hours before DAY_END
+        (the last two hours of routing cover journeys departing after the end of each window)
+    recompute: bool, optional
+
+    Returns
+    -------
+    data: numpy.ndarray
+        shape (n_windows, n_stops, n_observables), stops in the order of the nodes extract
+    observable_names: list[str]
+    windows: list[tuple]
+    """
+    if windows is None:
+        windows = get_analysis_windows(DAY_START, DAY_END - 2 * 3600, 3600)
+    profile_data = get_profile_data(targets, recompute=recompute,
+                                    routing_start_time_dep=DAY_START,
+                                    routing_end_time_dep=DAY_END)
+    stop_Is = read_nodes()['stop_I'].values
+    with stage("statistics", n_stops=len(stop_Is), n_windows=len(windows)):
+        data, observable_names = compute_profile_statistics_for_windows(profile_data["profiles"], stop_Is, windows)
+    return data, observable_names, windows
 
 
 def read_connections_pandas(events_fname=HELSINKI_TRANSIT_CONNECTIONS_FNAME,
@@ -68,17 +203,18 @@ def read_connections_pandas(events_fname=HELSINKI_TRANSIT_CONNECTIONS_FNAME,
                             routing_end_time_dep=ROUTING_END_TIME_DEP):
     """
     Read events from a csv file, and create a list of Connection objects.
+    (Now equivalent to read_connections_csv, which only reads the routing window if a sorted sidecar exists.)
     """
-    events = pandas.read_csv(events_fname)
-    events = events[events["dep_time_ut"] >= routing_start_time_dep]
-    time_filtered_events = events[events["dep_time_ut"] <= routing_end_time_dep]
-    time_filtered_events.sort_values("dep_time_ut", ascending=False, inplace=True)
+    return read_connections_csv(events_fname, routing_start_time_dep, routing_end_time_dep)
 
-    connections = [
-        Connection(int(e.from_stop_I), int(e.to_stop_I), int(e.dep_time_ut), int(e.arr_time_ut), int(e.trip_I), int(e.seq))
-        for e in time_filtered_events.itertuples()
-        ]
-    return connections
+
+def read_connection_store(events_fname=HELSINKI_TRANSIT_CONNECTIONS_FNAME,
+                          routing_start_time_dep=ROUTING_START_TIME_DEP,
+                          routing_end_time_dep=ROUTING_END_TIME_DEP):
+    """
+    Read events from a csv file into a ConnectionStore (connections sorted by decreasing departure time).
+    """
+    return ConnectionStore.from_csv(events_fname, routing_start_time_dep, routing_end_time_dep)
 
 
 def read_connections_csv(events_fname=HELSINKI_TRANSIT_CONNECTIONS_FNAME,
@@ -86,57 +222,103 @@ def read_connections_csv(events_fname=HELSINKI_TRANSIT_CONNECTIONS_FNAME,
                          routing_end_time_dep=ROUTING_END_TIME_DEP):
     """
     Read events from a csv file, and create a list of Connection objects.
-    Uses the built-in
-    """
-    # header: from_stop_I, to_stop_I, dep_time_ut, arr_time_ut, route_type, trip_I, seq, route_I
-    from_node_index = 0
-    to_node_index = 1
-    dep_time_index = 2
-    arr_time_index = 3
-    trip_I_index = 5
-    seq_index = 6
-    connections = []
-    with open(events_fname, 'r') as csvfile:
-        events_reader = csv.reader(csvfile, delimiter=',')
-        for _row in events_reader:
-            break
-        for row in events_reader:
-            dep_time = int(row[dep_time_index])
-            if routing_start_time_dep <= dep_time <= routing_end_time_dep:
-                connections.append(
-                    Connection(int(row[from_node_index]), int(row[to_node_index]), int(row[dep_time_index]),
-                               int(row[arr_time_index]), int(row[trip_I_index]), int(row[seq_index])))
-    connections = sorted(connections, key=lambda conn: -conn.departure_time)
-    return connections
+    (Sorted by decreasing departure time.)
+    """
+    return read_connection_store(events_fname, routing_start_time_dep, routing_end_time_dep).to_connections()
 
 
 def _read_transfers_pandas(max_walk_distance=1000):
-    import pandas
-    transfers = pandas.read_csv(HELSINKI_DATA_BASEDIR + "main.day.transfers.csv")
-    filtered_transfers = transfers[transfers["d_walk"] <= max_walk_distance]
-    net = networkx.Graph()
-    for row in filtered_transfers.itertuples():
-        net.add_edge(int(row.from_stop_I), int(row.to_stop_I), {"d_walk": row.d_walk})
-    return net
+    return read_transfers_csv(HELSINKI_DATA_BASEDIR + "main.day.transfers.csv", max_walk_distance)
 
 
 def read_transfers_csv(fname=None, max_walk_distance=1000):
+    """
+    Read walking transfers from a csv file (or from its binary sidecar, if one exists).
+
+    Returns
+    -------
+    net: CSRWalkNetwork
+        usable as a (networkx.Graph) walk_network in the gtfspy routing algorithms
+    """
     # "from_stop_I,to_stop_I,d,d_walk"
-    from_node_index = 0
-    to_node_index = 1
-    d_walk_index = 3
-    net = networkx.Graph()
     if fname is None:
-        fname = HELSINKI_DATA_BASEDIR + "main.day.transfers.csv"
-    with open(fname, 'r') as csv_file:
-        transfers_reader = csv.reader(csv_file, delimiter=',')
-        for _row in transfers_reader:
-            break
-        for row in transfers_reader:
-            d_walk = int(row[d_walk_index])
-            if d_walk <= max_walk_distance:
-                net.add_edge(int(row[from_node_index]), int(row[to_node_index]), {"d_walk": int(row[d_walk_index])})
-    return net
+        fname = HELSINKI_TRANSFERS_FNAME
+    columns = read_extract_columns(fname, ["from_stop_I", "to_stop_I", "d_walk"])
+    valids = columns["d_walk"] <= max_walk_distance
+    return CSRWalkNetwork(columns["from_stop_I"][valids], columns["to_stop_I"][valids], columns["d_walk"][valids])
+
+
+def _get_input_cache_fname(events_fname, transfers_fname, routing_start_time_dep, routing_end_time_dep,
+                           max_walk_distance):
+    key = {
+        "version": INPUT_CACHE_VERSION,
+        "events": file_fingerprint(events_fname),
+        "transfers": file_fingerprint(transfers_fname),
+        "routing_start_time_dep": int(routing_start_time_dep),
+        "routing_end_time_dep": int(routing_end_time_dep),
+        "max_walk_distance": max_walk_distance
+    }
+    key_hash = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+    return os.path.join(INPUT_CACHE_DIRECTORY, "routing_inputs_" + key_hash + ".npz")
+
+
+def read_routing_inputs(routing_start_time_dep, routing_end_time_dep, max_walk_distance,
+                        events_fname=HELSINKI_TRANSIT_CONNECTIONS_FNAME, transfers_fname=HELSINKI_TRANSFERS_FNAME,
+                        use_cache=True, max_cache_bytes=INPUT_CACHE_MAX_BYTES):
+    """
+    Read the connections and the walk network used for routing, using a persistent cache
+    keyed by the fingerprints of the input files and the filtering parameters.
+
+    Parameters
+    ----------
+    routing_start_time_dep: int
+    routing_end_time_dep: int
+    max_walk_distance: int
+    events_fname: str, optional
+    transfers_fname: str, optional
+    use_cache: bool, optional
+    max_cache_bytes: int, optional
+        least recently used cache entries are removed once the cache grows larger than this
+
+    Returns
+    -------
+    connections: ConnectionStore
+    net: CSRWalkNetwork
+    """
+    cache_fname = None
+    if use_cache:
+        cache_fname = _get_input_cache_fname(events_fname, transfers_fname, routing_start_time_dep,
+                                             routing_end_time_dep, max_walk_distance)
+        if os.path.exists(cache_fname):
+            try:
+                with stage("read_cached_routing_inputs") as record, numpy.load(cache_fname) as cached:
+                    connections = ConnectionStore(*[cached[name] for name in CONNECTION_ARRAY_NAMES],
+                                                  is_sorted=True)
+                    net = CSRWalkNetwork.from_csr_arrays(cached["nodes_array"], cached["indptr"],
+                                                         cached["indices"], cached["d_walk"])
+                    record["n_connections"] = len(connections)
+                os.utime(cache_fname, None)  # mark as recently used
+                return connections, net
+            except (IOError, OSError, ValueError, KeyError) as e:
+                print("Could not read cached routing inputs, recomputing: " + str(e))
+
+    with stage("read_connections") as record:
+        connections = read_connection_store(events_fname, routing_start_time_dep, routing_end_time_dep)
+        record["n_connections"] = len(connections)
+    with stage("read_transfers") as record:
+        net = read_transfers_csv(transfers_fname, max_walk_distance)
+        record["n_walk_edges"] = net.number_of_edges()
+
+    if use_cache:
+        if not os.path.exists(INPUT_CACHE_DIRECTORY):
+            os.makedirs(INPUT_CACHE_DIRECTORY)
+        name_to_array = connections.arrays()
+        name_to_array.update(net.csr_arrays())
+        tmp_fname = cache_fname + ".tmp" + str(os.getpid()) + ".npz"
+        numpy.savez(tmp_fname, **name_to_array)
+        os.replace(tmp_fname, cache_fname)
+        evict_least_recently_used_files(INPUT_CACHE_DIRECTORY, max_cache_bytes, "routing_inputs_*.npz")
+    return connections, net
 
 
 def _get_new_csp_with_default_settings(targets=None, params=None, verbose=True):
@@ -155,23 +337,29 @@ def _get_new_csp_with_default_settings(targets=None, params=None, verbose=True):
     params: dict
         The parameters used for csp
     """
-    if "routing_start_time_dep" not in params or params["routing_start_time_dep"] is None:
-        params["routing_start_time_dep"] = ROUTING_START_TIME_DEP
-    if "routing_end_time_dep" not in params or params["routing_end_time_dep"] is None:
-        params['routing_end_time_dep'] = ROUTING_END_TIME_DEP
-
-    connections = read_connections_csv(
-        HELSINKI_TRANSIT_CONNECTIONS_FNAME,
+    params = _fill_default_params(params)
+    connections, net = read_routing_inputs(
         params["routing_start_time_dep"],
-        params["routing_end_time_dep"]
+        params["routing_end_time_dep"],
+        params["max_walk_distance"]
     )
     if targets is None:
-        targets = [connections[0].departure_stop]
+        targets = [int(connections.from_stop_I[0])]
+    csp = _get_new_csp(connections, net, targets, params, verbose)
+    return csp, params
 
+
+def _fill_default_params(params):
+    """
+    Fill in the default values of the routing parameters missing from params (modifies params in place).
+    """
+    if "routing_start_time_dep" not in params or params["routing_start_time_dep"] is None:
+        params["routing_start_time_dep"] = ROUTING_START_TIME_DEP
+    if "routing_end_time_dep" not in params or params["routing_end_time_dep"] is None:
+        params['routing_end_time_dep'] = ROUTING_END_TIME_DEP
     if "max_walk_distance" not in params:
         print("resetting max walk distance to default (1000m)")
         params["max_walk_distance"] = 1000
-    net = read_transfers_csv(None, params["max_walk_distance"])
     if "track_time" not in params:
         print("setting time tracking on")
         params["track_time"] = True
@@ -184,42 +372,175 @@ def _get_new_csp_with_default_settings(targets=None, params=None, verbose=True):
     if "walking_speed" not in params:
         print("resetting walking speed to default value of 70m/60s:")
         params["walking_speed"] = 70 / 60.0
+    if "max_temporal_distance" not in params:
+        params["max_temporal_distance"] = None
+    return params
 
-    print(params)
-    csp = MultiObjectivePseudoCSAProfiler(
-        connections,
-        targets,
-        walk_network=net,
-        walk_speed=params["walking_speed"],
-        track_vehicle_legs=params["track_vehicle_legs"],
-        track_time=params["track_time"],
-        verbose=verbose,
-        transfer_margin=params["transfer_margin"]
-    )
-    return csp, params
 
+def get_travel_time_lower_bound_graph(connections, net, walking_speed):
+    """
+    The reversed graph of the shortest in-vehicle time of each stop pair and the walking durations, used by
+    compute_travel_time_lower_bounds (it does not depend on the targets, so it can be reused for all of them).
 
-def _compute_profile_data(targets=[115], track_vehicle_legs=True, track_time=True,
-                          routing_start_time_dep=None, routing_end_time_dep=None,
-                          csp=None, verbose=True, return_profiler=False):
+    Parameters
+    ----------
+    connections: ConnectionStore
+    net: CSRWalkNetwork
+    walking_speed: float
+
+    Returns
+    -------
+    graph: scipy.sparse.csr_matrix
+        weights from arrival stop to departure stop, indexed by stop_I
     """
-    Given a target, compute node profiles (i.e. Pareto-optimal Journey alternatives).
+    from scipy.sparse import coo_matrix
+
+    n_stops = 1 + max(int(numpy.max(connections.from_stop_I, initial=0)),
+                      int(numpy.max(connections.to_stop_I, initial=0)),
+                      int(numpy.max(net.nodes_array, initial=0)))
+    walk_from_stop_I = numpy.repeat(net.nodes_array, numpy.diff(net.indptr))
+    walk_durations = (net.d_walk / float(walking_speed)).astype(numpy.int64)
+    # reversed edges (from arrival stop to departure stop), parallel edges keep the minimum weight:
+    rows = numpy.concatenate([connections.to_stop_I, net.indices]).astype(numpy.int64)
+    cols = numpy.concatenate([connections.from_stop_I, walk_from_stop_I]).astype(numpy.int64)
+    weights = numpy.concatenate([connections.arr_time_ut - connections.dep_time_ut, walk_durations]).astype(float)
+    order = numpy.lexsort((weights, cols, rows))
+    rows, cols, weights = rows[order], cols[order], weights[order]
+    is_first = numpy.concatenate([[True], (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])])
+    # (zero weights would be dropped by the sparse matrix)
+    weights = numpy.maximum(weights[is_first], 1e-9)
+    return coo_matrix((weights, (rows[is_first], cols[is_first])), shape=(n_stops, n_stops)).tocsr()
+
+
+def compute_travel_time_lower_bounds(connections, net, targets, walking_speed, graph=None):
+    """
+    Compute a lower bound for the travel time from each stop to the closest target,
+    using the shortest in-vehicle time of each stop pair and walking durations (waiting times and
+    transfer margins are ignored).
 
     Parameters
     ----------
-    targets
-    track_vehicle_legs
-    track_time
-    routing_start_time_dep
-    routing_end_time_dep
-    csp: connection scan profiler instance
-        targets are used to reset it
+    connections: ConnectionStore
+    net: CSRWalkNetwork
+    targets: list
+    walking_speed: float
+    graph: scipy.sparse.csr_matrix, optional
+        get_travel_time_lower_bound_graph(connections, net, walking_speed), computed if not given
 
     Returns
     -------
-    profiles: dict
-    csp: MultiObjectivePseudoCSAProfiler
-        Returned only if return_profiler equals True
+    lower_bounds: numpy.ndarray
+        indexed by stop_I, numpy.inf for stops from which no target can be reached
+    """
+    from scipy.sparse.csgraph import dijkstra
+
+    if graph is None:
+        graph = get_travel_time_lower_bound_graph(connections, net, walking_speed)
+    # (targets without any connections or walking transfers can only be reached from themselves)
+    lower_bounds = numpy.full(max(graph.shape[0], 1 + max(int(target) for target in targets)), numpy.inf)
+    lower_bounds[[int(target) for target in targets]] = 0
+    targets_in_graph = numpy.array([target for target in targets if target < graph.shape[0]], dtype=int)
+    if len(targets_in_graph):
+        lower_bounds[:graph.shape[0]] = dijkstra(graph, directed=True, indices=targets_in_graph, min_only=True)
+    # (undo the zero weight adjustment)
+    return numpy.floor(lower_bounds + 1e-6)
+
+
+def prune_connections_by_max_temporal_distance(connections, net, targets, max_temporal_distance, walking_speed,
+                                               graph=None):
+    """
+    Remove connections that can not be part of any journey reaching a target within max_temporal_distance.
+
+    The Pareto-optimal journeys with duration at most max_temporal_distance are not affected,
+    so the temporal distance profiles stay exactly the same where they are within max_temporal_distance.
+    All connections may be removed (e.g. when the cutoff is shorter than any trip to the targets).
+
+    Parameters
+    ----------
+    graph: scipy.sparse.csr_matrix, optional
+        see compute_travel_time_lower_bounds
+
+    Returns
+    -------
+    connections: ConnectionStore
+    """
+    lower_bounds = compute_travel_time_lower_bounds(connections, net, targets, walking_speed, graph)
+    min_durations = (connections.arr_time_ut - connections.dep_time_ut) + lower_bounds[connections.to_stop_I]
+    valids = min_durations <= max_temporal_distance
+    print("pruned", len(connections) - numpy.count_nonzero(valids), "of", len(connections),
+          "connections (max temporal distance " + str(max_temporal_distance) + " s)")
+    return ConnectionStore(*[getattr(connections, name)[valids] for name in CONNECTION_ARRAY_NAMES], is_sorted=True)
+
+
+def _csp_can_be_reset(params):
+    """
+    Whether a profiler can be reused for other targets, i.e. its connections do not depend on the targets.
+
+    With max_temporal_distance, the connections are pruned for each target, so a new profiler (incl. its
+    pseudo connections) is constructed for each target: the pruning itself only takes a shortest path search
+    (see ProfilingWorker, which reuses the lower bound graph), but the construction of the profiler is
+    proportional to the number of remaining connections (see estimate_all_to_all_target_costs).
+    """
+    return params.get("max_temporal_distance") is None
+
+
+def _get_new_csp(connections, net, targets, params, verbose=True, lower_bound_graph=None):
+    """
+    Parameters
+    ----------
+    connections: ConnectionStore
+    net: CSRWalkNetwork
+    targets: list
+    params: dict
+        routing parameters, see _fill_default_params
+    verbose: bool
+    lower_bound_graph: scipy.sparse.csr_matrix, optional
+        used for pruning with max_temporal_distance, see get_travel_time_lower_bound_graph
+
+    Returns
+    -------
+    csp: CSRMultiObjectivePseudoCSAProfiler
+    """
+    # (imported here, as it imports networkx and pandas, which are not needed by the other computations)
+    from csr_profiler import CSRMultiObjectivePseudoCSAProfiler
+    net.set_walking_speed(params["walking_speed"])
+    print(params)
+    start_time_ut = end_time_ut = None
+    if params.get("max_temporal_distance") is not None:
+        # the time range of the profiler is that of all connections (as without pruning), so that the same
+        # pseudo connections are created, and the profiler can be created even if no connections remain
+        if len(connections):
+            start_time_ut = int(numpy.min(connections.dep_time_ut))
+            end_time_ut = int(numpy.max(connections.dep_time_ut))
+        else:
+            start_time_ut, end_time_ut = params["routing_start_time_dep"], params["routing_end_time_dep"]
+        with stage("connection_pruning", n_connections=len(connections), n_targets=len(targets)):
+            connections = prune_connections_by_max_temporal_distance(connections, net, targets,
+                                                                     params["max_temporal_distance"],
+                                                                     params["walking_speed"], lower_bound_graph)
+    with stage("profiler_construction", n_connections=len(connections), n_targets=len(targets)):
+        csp = CSRMultiObjectivePseudoCSAProfiler(
+            connections.to_connections(),
+            targets,
+            start_time_ut=start_time_ut,
+            end_time_ut=end_time_ut,
+            walk_network=net,
+            walk_speed=params["walking_speed"],
+            track_vehicle_legs=params["track_vehicle_legs"],
+            track_time=params["track_time"],
+            verbose=verbose,
+            transfer_margin=params["transfer_margin"]
+        )
+    return csp
+
+
+def _get_params(targets, track_vehicle_legs=True, track_time=True,
+                routing_start_time_dep=None, routing_end_time_dep=None, max_temporal_distance=None):
+    """
+    The routing parameters used for the analyses.
+
+    max_temporal_distance (in seconds) enables pruning of journeys longer than that (off by default):
+    temporal distances above it become unreliable (but remain above it), while all below it are exact.
     """
     max_walk_distance = 1000
     walking_speed = 70 / 60.0
@@ -232,16 +553,65 @@ def _compute_profile_data(targets=[115], track_vehicle_legs=True, track_time=Tru
         "routing_start_time_dep": routing_start_time_dep,
         "routing_end_time_dep": routing_end_time_dep,
         "max_walk_distance": max_walk_distance,
+        "max_temporal_distance": max_temporal_distance,
         "targets": targets
     }
+    return params
+
+
+def _compute_profile_data(targets=[115], track_vehicle_legs=True, track_time=True,
+                          routing_start_time_dep=None, routing_end_time_dep=None,
+                          csp=None, verbose=True, return_profiler=False, max_temporal_distance=None,
+                          n_departure_time_samples=None, departure_time_sampling="grid", random_seed=0):
+    """
+    Given a target, compute node profiles (i.e. Pareto-optimal Journey alternatives).
+
+    With n_departure_time_samples, the profiles are not computed: the node profile statistics are instead
+    approximated from earliest arrival journeys at sampled departure times (see _compute_sampled_profile_data).
+
+    Parameters
+    ----------
+    targets
+    track_vehicle_legs
+    track_time
+    routing_start_time_dep
+    routing_end_time_dep
+    csp: connection scan profiler instance
+        targets are used to reset it (unless max_temporal_distance is given)
+    max_temporal_distance: int, optional
+        see _get_params
+    n_departure_time_samples: int, optional
+        number of sampled departure times of the approximate mode (off by default)
+    departure_time_sampling: str, optional
+        "grid" or "random", see sampled_profiler.get_sample_departure_times
+    random_seed: int, optional
+        seed of random departure time sampling
+
+    Returns
+    -------
+    profiles: dict
+        in the approximate mode, the statistics instead of the profiles
+    csp: MultiObjectivePseudoCSAProfiler
+        Returned only if return_profiler equals True (None in the approximate mode)
+    """
+    params = _get_params(targets, track_vehicle_legs, track_time, routing_start_time_dep, routing_end_time_dep,
+                         max_temporal_distance)
 
-    if csp is None:
+    if n_departure_time_samples is not None:
+        profile_data = _compute_sampled_profile_data(targets, params, n_departure_time_samples,
+                                                     departure_time_sampling, random_seed)
+        if return_profiler:
+            return profile_data, None
+        return profile_data
+
+    if csp is None or not _csp_can_be_reset(params):
         csp, params = _get_new_csp_with_default_settings(targets=targets, params=params, verbose=verbose)
     else:
         csp.reset(targets)
 
     print("CSA Profiler running...")
-    csp.run()
+    with stage("profiler_run", n_targets=len(targets)):
+        csp.run()
     print("CSA profiler finished")
 
     profiles = {"params": params,
@@ -252,6 +622,171 @@ def _compute_profile_data(targets=[115], track_vehicle_legs=True, track_time=Tru
     return profiles
 
 
+def _compute_sampled_profile_data(targets, params, n_departure_time_samples, departure_time_sampling="grid",
+                                  random_seed=0):
+    """
+    Approximate the node profile statistics of all stops (towards targets) within the analysis window
+    from earliest arrival journeys at sampled departure times (see sampled_profiler.py).
+
+    Returns
+    -------
+    profile_data: dict
+        "params", "stop_Is" (in the order of the nodes extract), "departure_times",
+        "statistics" (mapping from observable name to a numpy array with one value per stop, nan for the measures
+        that can not be estimated) and "errors" (estimated absolute errors of the temporal distance measures)
+    """
+    params = _fill_default_params(params)
+    params["n_departure_time_samples"] = n_departure_time_samples
+    params["departure_time_sampling"] = departure_time_sampling
+    connections, net = read_routing_inputs(params["routing_start_time_dep"],
+                                           params["routing_end_time_dep"],
+                                           params["max_walk_distance"])
+    stop_Is = read_nodes()['stop_I'].values
+    departure_times = get_sample_departure_times(ANALYSIS_START_TIME_DEP, ANALYSIS_END_TIME_DEP,
+                                                 n_departure_time_samples, departure_time_sampling, random_seed)
+    scan = SampledConnectionScan(connections, targets, params["transfer_margin"], net, params["walking_speed"])
+    print("Sampled connection scan running...")
+    with stage("sampled_scan_run", n_stops=len(stop_Is), n_departure_times=len(departure_times)):
+        arrival_times = compute_sampled_arrival_times(scan, stop_Is, departure_times)
+    print("Sampled connection scan finished")
+    with stage("statistics", n_stops=len(stop_Is)):
+        statistics, errors = compute_sampled_profile_statistics(departure_times, arrival_times,
+                                                                departure_time_sampling)
+    # (as in NodeProfileAnalyzerTimeAndVehLegs, the temporal distances of the targets themselves are inf)
+    is_target = numpy.isin(stop_Is, targets)
+    for observable_name in SAMPLED_OBSERVABLE_NAMES:
+        statistics[observable_name][is_target] = float("inf")
+        errors[observable_name][is_target] = float("nan")
+    return {"params": params,
+            "stop_Is": stop_Is,
+            "departure_times": departure_times,
+            "statistics": statistics,
+            "errors": errors}
+
+
+# parameters that determine the routing inputs, and the parameters that determine the profiler:
+_ROUTING_INPUT_PARAM_NAMES = ["routing_start_time_dep", "routing_end_time_dep", "max_walk_distance"]
+_PROFILER_PARAM_NAMES = ["walking_speed", "transfer_margin", "track_vehicle_legs", "track_time",
+                         "max_temporal_distance"]
+
+
+class ProfilingWorker:
+    """
+    A long-lived profiler for computing profiles towards many targets (one submit at a time).
+
+    The routing inputs and the profiler are kept across submits, and the profiler is only reset for new targets
+    (it is recreated only if the parameters of a submit require it, see _csp_can_be_reset).
+    A failing target (AssertionError) does not invalidate this state.
+    The duration and status of each submit are recorded in self.timings.
+    """
+
+    def __init__(self, params=None, connections=None, net=None, verbose=False):
+        """
+        Parameters
+        ----------
+        params: dict, optional
+            default routing parameters of submits, see _get_params (defaults are filled in)
+        connections: ConnectionStore, optional
+        net: CSRWalkNetwork, optional
+            if not given, the routing inputs are read with read_routing_inputs
+        verbose: bool, optional
+        """
+        self.params = _fill_default_params(dict(params) if params is not None else _get_params(None))
+        self.verbose = verbose
+        self.timings = []
+        self._csp = None
+        self._csp_params = None
+        self._lower_bound_graph = None
+        self._lower_bound_graph_walking_speed = None
+        if connections is None or net is None:
+            connections, net = read_routing_inputs(self.params["routing_start_time_dep"],
+                                                   self.params["routing_end_time_dep"],
+                                                   self.params["max_walk_distance"])
+        self._connections = connections
+        self._net = net
+        self._input_params = {name: self.params[name] for name in _ROUTING_INPUT_PARAM_NAMES}
+
+    def _prepare(self, targets, params):
+        input_params = {name: params[name] for name in _ROUTING_INPUT_PARAM_NAMES}
+        if input_params != self._input_params:
+            self._csp = None
+            self._lower_bound_graph = None
+            self._connections, self._net = read_routing_inputs(params["routing_start_time_dep"],
+                                                               params["routing_end_time_dep"],
+                                                               params["max_walk_distance"])
+            self._input_params = input_params
+        csp_params = {name: params[name] for name in _PROFILER_PARAM_NAMES}
+        if self._csp is None or csp_params != self._csp_params or not _csp_can_be_reset(params):
+            self._csp = None  # release the previous profiler before creating a new one
+            self._csp = _get_new_csp(self._connections, self._net, targets, params, self.verbose,
+                                     self._get_lower_bound_graph(params))
+            self._csp_params = csp_params
+        else:
+            self._csp.reset(targets)
+
+    def _get_lower_bound_graph(self, params):
+        """
+        The lower bound graph for pruning with max_temporal_distance (None without it), computed once.
+        """
+        if params.get("max_temporal_distance") is None:
+            return None
+        if self._lower_bound_graph is None or self._lower_bound_graph_walking_speed != params["walking_speed"]:
+            self._lower_bound_graph = get_travel_time_lower_bound_graph(self._connections, self._net,
+                                                                        params["walking_speed"])
+            self._lower_bound_graph_walking_speed = params["walking_speed"]
+        return self._lower_bound_graph
+
+    def submit(self, targets, params=None):
+        """
+        Compute the profiles towards targets.
+
+        Parameters
+        ----------
+        targets: list
+        params: dict, optional
+            routing parameters overriding self.params for this submit
+
+        Returns
+        -------
+        profile_data: dict or None
+            "params" and "profiles" (the live profiles of the profiler, valid until the next submit),
+            None if the computation failed with an AssertionError
+        """
+        targets = list(targets)
+        submit_params = dict(self.params)
+        if params is not None:
+            submit_params.update(params)
+        submit_params["targets"] = targets
+        start_time = time.time()
+        try:
+            self._prepare(targets, submit_params)
+            with stage("profiler_run", n_targets=len(targets)):
+                self._csp.run()
+        except AssertionError as e:
+            print("Profiling targets " + str(targets) + " failed (AssertionError: " + str(e) + ")")
+            self.timings.append((targets, TARGET_SKIPPED_ASSERTION, time.time() - start_time))
+            return None
+        self.timings.append((targets, TARGET_DONE, time.time() - start_time))
+        return {"params": submit_params, "profiles": self._csp.stop_profiles}
+
+    def get_timing_summary(self):
+        """
+        Returns
+        -------
+        summary: dict
+            number of submits, number of failed submits, and the total, mean and median duration
+            (in seconds) of the successful submits
+        """
+        durations = numpy.array([duration for _, status, duration in self.timings if status == TARGET_DONE])
+        return {
+            "n_submits": len(self.timings),
+            "n_failed": len(self.timings) - len(durations),
+            "total_duration": float(durations.sum()),
+            "mean_duration": float(durations.mean()) if len(durations) else float("nan"),
+            "median_duration": float(numpy.median(durations)) if len(durations) else float("nan")
+        }
+
+
 def _compute_node_profile_statistics(targets, recompute_profiles=False):
     profile_data = get_profile_data(targets, recompute=recompute_profiles)['profiles']
     return __compute_profile_stats_from_profiles(profile_data)
@@ -268,73 +803,677 @@ def __compute_profile_stats_from_profiles(profile_data):
     Returns
     -------
     observable_name_to_data: dict
+        mapping from observable name to a numpy array (one value per stop, in the order of the nodes extract)
     """
-    profile_summary_methods, profile_observable_names = NodeProfileAnalyzerTimeAndVehLegs.all_measures_and_names_as_lists()
-    profile_summary_data = [[] for _ in range(len(profile_observable_names))]
+    stop_Is = read_nodes()['stop_I'].values
+    with stage("statistics", n_stops=len(stop_Is)):
+        return compute_profile_statistics(profile_data, stop_Is, ANALYSIS_START_TIME_DEP, ANALYSIS_END_TIME_DEP)
 
-    observable_name_to_method = dict(zip(profile_observable_names, profile_summary_methods))
-    observable_name_to_data = dict(zip(profile_observable_names, profile_summary_data))
 
-    nodes = pandas.read_csv(HELSINKI_NODES_FNAME, sep=";")
-    for stop_I in nodes['stop_I'].values:
-        try:
-            profile = profile_data[stop_I]
-        except KeyError:
-            profile = NodeProfileMultiObjective()
-            profile.finalize()
-        profile_analyzer = NodeProfileAnalyzerTimeAndVehLegs(profile, ANALYSIS_START_TIME_DEP, ANALYSIS_END_TIME_DEP)
-        for observable_name in profile_observable_names:
-            method = observable_name_to_method[observable_name]
-            observable_value = method(profile_analyzer)
-            if observable_value is None:
-                print(observable_name, stop_I)
-            _assert_results_are_positive_or_infs_or_nans(numpy.array([observable_value]))
-            observable_name_to_data[observable_name].append(observable_value)
-    return observable_name_to_data
+# (the store (ALL_TO_ALL_STATS_STORE_DIRECTORY), manifest and claims of the default routing parameters,
+# see get_all_to_all_directory)
+ALL_TO_ALL_TIME_STATS_STORE_DIRECTORY = os.path.join(ALL_TO_ALL_STATS_DIRECTORY, "store_time_only")
+ALL_TO_ALL_MANIFEST_DIRECTORY = os.path.join(ALL_TO_ALL_STATS_DIRECTORY, "manifest")
+ALL_TO_ALL_CLAIMS_DIRECTORY = os.path.join(ALL_TO_ALL_STATS_DIRECTORY, "claims")
+ALL_TO_ALL_SCENARIOS_DIRECTORY = os.path.join(ALL_TO_ALL_STATS_DIRECTORY, "scenarios")
+# the static partition of the targets between slurm array tasks, see write_all_to_all_partition
+ALL_TO_ALL_PARTITION_FNAME = os.path.join(ALL_TO_ALL_STATS_DIRECTORY, "partition.json")
+
+# statuses of targets in the all-to-all manifest:
+TARGET_DONE = "done"
+TARGET_SKIPPED_ASSERTION = "skipped_assertion"
+FINISHED_TARGET_STATUSES = {TARGET_DONE, TARGET_SKIPPED_ASSERTION}
+
 
+# the stores of the current process (directory -> AllToAllStatsStore), see _get_all_to_all_stats_store
+_all_to_all_stats_stores = {}
 
-def _assert_results_are_positive_or_infs_or_nans(array):
+
+def get_all_to_all_directory(params=None):
     """
+    The directory of the all-to-all results (store, manifest and claims) computed with params.
+
+    Results computed with other than the default routing parameters (e.g. with max_temporal_distance,
+    above which the results are not exact) are kept in a subdirectory named after the differing parameters,
+    so that they are never mixed with the results of the default parameters.
 
     Parameters
     ----------
-    array:
+    params: dict, optional
+        routing parameters (defaults are filled in), by default the default parameters
 
     Returns
     -------
-    None
+    directory: str
+        ALL_TO_ALL_STATS_DIRECTORY for the default parameters, otherwise
+        e.g. ALL_TO_ALL_STATS_DIRECTORY/max_temporal_distance_3600
+    """
+    if params is None:
+        return ALL_TO_ALL_STATS_DIRECTORY
+    params = _fill_default_params(dict(params))
+    default_params = _fill_default_params(_get_params(None))
+    differing_names = sorted(name for name in set(params) | set(default_params)
+                             if name != "targets" and params.get(name) != default_params.get(name))
+    if not differing_names:
+        return ALL_TO_ALL_STATS_DIRECTORY
+    return os.path.join(ALL_TO_ALL_STATS_DIRECTORY,
+                        "_".join(name + "_" + str(params.get(name)) for name in differing_names))
+
+
+def _get_store_params(params):
+    """
+    The routing parameters as stored in (and read from) the json header of a statistics store.
+    """
+    return json.loads(json.dumps({key: value for key, value in params.items() if key != "targets"}))
+
+
+def _get_all_to_all_stats_store(params, directory=None, observable_names=None):
+    """
+    Open (and create, if needed) a consolidated all-to-all statistics store for writing.
+
+    Parameters
+    ----------
+    params: dict
+    directory: str, optional
+        by default the store of params in get_all_to_all_directory(params)
+    observable_names: list, optional
+        defaults to the measures of NodeProfileAnalyzerTimeAndVehLegs
 
-    Raises:
+    Raises
     ------
-    AssertionError
-        if some of the results results are not positive or infs or nans
+    ValueError
+        if the store has been created with other parameters
+    """
+    if directory is None:
+        directory = os.path.join(get_all_to_all_directory(params), "store")
+    store_params = _get_store_params(params)
+    if directory not in _all_to_all_stats_stores:
+        parent_directory = os.path.dirname(os.path.abspath(directory))
+        if not os.path.exists(parent_directory):
+            os.makedirs(parent_directory, exist_ok=True)
+        if observable_names is None:
+            from gtfspy.routing.node_profile_analyzer_time_and_veh_legs import NodeProfileAnalyzerTimeAndVehLegs
+            _, observable_names = NodeProfileAnalyzerTimeAndVehLegs.all_measures_and_names_as_lists()
+        _all_to_all_stats_stores[directory] = AllToAllStatsStore.create(
+            directory, read_nodes()['stop_I'].values, observable_names, store_params)
+    store = _all_to_all_stats_stores[directory]
+    if store.params != store_params:
+        differing_names = sorted(name for name in set(store.params or {}) | set(store_params)
+                                 if (store.params or {}).get(name) != store_params.get(name))
+        raise ValueError("the all-to-all statistics store " + directory + " has been created with other routing "
+                         "parameters (differing: " + ", ".join(differing_names) + ")")
+    return store
+
+
+def _store_all_to_all_stats(target_I, params, obs_name_to_data):
+    """
+    Write the statistics of one target as a row of the consolidated store of params.
+    """
+    _get_all_to_all_stats_store(params).write_row(target_I, obs_name_to_data)
+
+
+def convert_all_to_all_pickles_to_store():
+    """
+    Copy results stored by earlier versions (one all_to_all_stats_target_{target}.pkl per target) to the store.
+    """
+    fnames = glob.glob(os.path.join(ALL_TO_ALL_STATS_DIRECTORY, "all_to_all_stats_target_*.pkl"))
+    for i, fname in enumerate(fnames):
+        print(fname, i, "/", len(fnames))
+        with open(fname, "rb") as f:
+            data = pickle.load(f)
+        _store_all_to_all_stats(data["target"], data["params"], data["stats"])
+        _record_all_to_all_status(data["target"], TARGET_DONE, float("nan"), data["params"])
+
+
+def _get_all_to_all_manifest_directory(params=None, scenario_name=None):
+    if scenario_name is not None:
+        return os.path.join(get_all_to_all_directory(params), "scenarios", scenario_name, "manifest")
+    return os.path.join(get_all_to_all_directory(params), "manifest")
+
+
+def _record_all_to_all_status(target_I, status, duration, params=None, scenario_name=None):
+    """
+    Append the status and computation time of one target to this process' own manifest file
+    (of the results of params, see get_all_to_all_directory, or of the deltas of a scenario).
+    For TARGET_DONE, this must be called only after the results have been stored.
+    """
+    manifest_directory = _get_all_to_all_manifest_directory(params, scenario_name)
+    if not os.path.exists(manifest_directory):
+        os.makedirs(manifest_directory, exist_ok=True)
+    fname = os.path.join(manifest_directory,
+                         "manifest_{host}_{pid}.csv".format(host=socket.gethostname(), pid=os.getpid()))
+    with open(fname, "a") as f:
+        f.write("{target},{status},{duration:.3f}\n".format(target=int(target_I), status=status, duration=duration))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_all_to_all_manifest(params=None, scenario_name=None):
+    """
+    Parameters
+    ----------
+    params: dict, optional
+        routing parameters of the results, see get_all_to_all_directory
+    scenario_name: str, optional
+        read the manifest of the deltas of a scenario (see compute_all_to_all_scenario_deltas)
+
+    Returns
+    -------
+    target_to_status: dict
+        mapping from target stop_I to a (status, duration_in_seconds) tuple (the latest recorded one)
+    """
+    target_to_status = {}
+    for fname in sorted(glob.glob(os.path.join(_get_all_to_all_manifest_directory(params, scenario_name),
+                                               "manifest_*.csv"))):
+        with open(fname, "r") as f:
+            for line in f:
+                try:
+                    target, status, duration = line.strip().split(",")
+                    target_to_status[int(target)] = (status, float(duration))
+                except ValueError:
+                    continue  # e.g. a partially written last line of a killed process
+    return target_to_status
+
+
+def read_finished_all_to_all_targets(params=None, scenario_name=None):
+    """
+    Parameters
+    ----------
+    params: dict, optional
+        routing parameters of the results, see get_all_to_all_directory
+    scenario_name: str, optional
+        see read_all_to_all_manifest
+
+    Returns
+    -------
+    finished_target_Is: set
+        targets that have been completed (or skipped due to an AssertionError) by earlier runs
+    """
+    return {target_I for target_I, (status, _) in read_all_to_all_manifest(params, scenario_name).items()
+            if status in FINISHED_TARGET_STATUSES}
+
+
+def read_all_to_all_durations(params=None):
+    """
+    Parameters
+    ----------
+    params: dict, optional
+        routing parameters of the results, see get_all_to_all_directory
+
+    Returns
+    -------
+    target_to_duration: dict
+        mapping from target stop_I to the (latest recorded) computation time in seconds
+    """
+    return {target_I: duration for target_I, (_, duration) in read_all_to_all_manifest(params).items()
+            if not numpy.isnan(duration)}
+
+
+def estimate_all_to_all_target_costs(target_Is, params=None):
+    """
+    Estimate the relative computation cost of each target.
+
+    Recorded durations of previous runs are used when available.
+    Otherwise the cost is estimated by the number of connections arriving at the target or at stops
+    within walking distance of it (scaled to seconds using the targets with recorded durations, if any).
+    With max_temporal_distance, a profiler is constructed for each target from the connections remaining after
+    pruning (see _csp_can_be_reset), and both its construction and its run are roughly proportional to their
+    number, so the cost is instead estimated by the number of remaining connections.
+
+    Returns
+    -------
+    costs: numpy.ndarray
+    """
+    if params is None:
+        params = _fill_default_params(_get_params(None))
+    connections, net = read_routing_inputs(params["routing_start_time_dep"],
+                                           params["routing_end_time_dep"],
+                                           params["max_walk_distance"])
+    if params.get("max_temporal_distance") is None:
+        n_max = int(max(numpy.max(connections.to_stop_I, initial=0), numpy.max(net.nodes_array, initial=0),
+                        numpy.max(target_Is, initial=0))) + 1
+        n_arrivals = numpy.bincount(connections.to_stop_I, minlength=n_max).astype(float)
+        estimates = numpy.array([n_arrivals[target_I] + numpy.sum(n_arrivals[net.neighbor_arrays(target_I)[0]])
+                                 for target_I in target_Is]) + 1
+    else:
+        graph = get_travel_time_lower_bound_graph(connections, net, params["walking_speed"])
+        trip_durations = connections.arr_time_ut - connections.dep_time_ut
+        estimates = numpy.array([numpy.count_nonzero(
+            trip_durations + compute_travel_time_lower_bounds(connections, net, [target_I], params["walking_speed"],
+                                                              graph)[connections.to_stop_I]
+            <= params["max_temporal_distance"]) for target_I in target_Is], dtype=float) + 1
+
+    target_to_duration = read_all_to_all_durations(params)
+    recorded = numpy.array([target_I in target_to_duration for target_I in target_Is], dtype=bool)
+    costs = estimates
+    if recorded.any():
+        durations = numpy.array([target_to_duration.get(target_I, numpy.nan) for target_I in target_Is])
+        seconds_per_estimate_unit = numpy.median(durations[recorded] / estimates[recorded])
+        costs = estimates * seconds_per_estimate_unit
+        costs[recorded] = durations[recorded]
+    return costs
+
+
+def write_all_to_all_partition(n_parts, target_Is=None, fname=ALL_TO_ALL_PARTITION_FNAME,
+                               max_temporal_distance=None):
+    """
+    Split the targets that are not yet finished into n_parts parts of roughly equal estimated cost
+    (see estimate_all_to_all_target_costs), and write the parts to fname.
+
+    This is done once before submitting the array tasks, so that all tasks use the same partition:
+    the costs (and the finished targets) change while tasks are running, so partitions computed by the tasks
+    themselves at different times would overlap and leave targets out.
+
+    Parameters
+    ----------
+    n_parts: int
+    target_Is: list, optional
+        defaults to all stops
+    fname: str, optional
+    max_temporal_distance: int, optional
+        see _get_params (the targets finished and the costs of the targets depend on it)
+
+    Returns
+    -------
+    parts: list[list[int]]
+    """
+    params = _fill_default_params(_get_params(None, max_temporal_distance=max_temporal_distance))
+    if target_Is is None:
+        target_Is = read_nodes()['stop_I'].values
+    finished_target_Is = read_finished_all_to_all_targets(params)
+    target_Is = [int(target_I) for target_I in target_Is if int(target_I) not in finished_target_Is]
+    costs = estimate_all_to_all_target_costs(target_Is, params)
+    parts = split_into_balanced_parts(target_Is, costs, n_parts)
+    target_to_cost = dict(zip(target_Is, costs.tolist()))
+    partition = {
+        "n_parts": n_parts,
+        "n_finished_targets": len(finished_target_Is),
+        "part_costs": [sum(target_to_cost[target_I] for target_I in part) for part in parts],
+        "parts": parts
+    }
+    directory = os.path.dirname(os.path.abspath(fname))
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    tmp_fname = fname + ".tmp" + str(os.getpid())
+    with open(tmp_fname, "w") as f:
+        json.dump(partition, f)
+    os.replace(tmp_fname, fname)
+    return parts
+
+
+def read_all_to_all_partition_part(part_i, n_parts, fname=ALL_TO_ALL_PARTITION_FNAME):
+    """
+    Read the targets of one part of the partition written by write_all_to_all_partition.
+
+    Returns
+    -------
+    target_Is: list[int]
+    """
+    with open(fname, "r") as f:
+        partition = json.load(f)
+    if partition["n_parts"] != n_parts:
+        raise ValueError("the partition in " + fname + " has " + str(partition["n_parts"]) + " parts, not " +
+                         str(n_parts) + " (rewrite it with write_all_to_all_partition)")
+    return partition["parts"][part_i]
+
+
+def _claim_target(target_I, params=None):
+    """
+    Claim a target for this process (a simple work queue shared through the file system).
+
+    Returns
+    -------
+    claimed: bool
+        False, if some other process has already claimed the target
     """
-    is_nan = numpy.isnan(array)
-    is_inf = numpy.isinf(array)
-    is_not_negative = (array >= 0)
-    assert (is_nan or is_inf or is_not_negative).all()
+    claims_directory = os.path.join(get_all_to_all_directory(params), "claims")
+    if not os.path.exists(claims_directory):
+        os.makedirs(claims_directory, exist_ok=True)
+    fname = os.path.join(claims_directory, "target_{target}.claim".format(target=int(target_I)))
+    try:
+        fd = os.open(fname, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError:
+        return False
+    os.write(fd, "{host} {pid}\n".format(host=socket.gethostname(), pid=os.getpid()).encode("utf-8"))
+    os.close(fd)
+    return True
 
 
-def compute_all_to_all_profile_statistics_with_defaults(target_Is=None, verbose=False):
-    nodes = pandas.read_csv(HELSINKI_NODES_FNAME)
-    csp = None
+def compute_all_to_all_profile_statistics_with_defaults(target_Is=None, verbose=False, claim_targets=False,
+                                                         skip_finished=True, max_temporal_distance=None):
+    """
+    Compute and store profile statistics for each target (one target at a time).
+
+    Parameters
+    ----------
+    target_Is: list, optional
+        defaults to all stops
+    verbose: bool, optional
+    claim_targets: bool, optional
+        if True, target_Is are treated as a work queue shared with other processes:
+        a target is only computed if no other process has already claimed it
+        (claims are not released, so remove the claims directory (ALL_TO_ALL_CLAIMS_DIRECTORY for the default
+        parameters) before resubmitting a killed queue run)
+    skip_finished: bool, optional
+        if True, targets recorded as finished in the manifest (by earlier, possibly killed, runs) are skipped
+    max_temporal_distance: int, optional
+        see _get_params (the results are stored separately, see get_all_to_all_directory)
+    """
+    nodes = read_nodes()
     if target_Is is None:
         target_Is = nodes['stop_I']
+    params = _fill_default_params(_get_params(None, max_temporal_distance=max_temporal_distance))
+    _get_all_to_all_stats_store(params)  # (raises if the store has been created with other parameters)
+    finished_target_Is = read_finished_all_to_all_targets(params) if skip_finished else set()
+    worker = ProfilingWorker(params, verbose=verbose)
+    stop_Is = nodes['stop_I'].values
     for i, target_I in enumerate(target_Is):
+        if target_I in finished_target_Is:
+            continue
+        if claim_targets and not _claim_target(target_I, params):
+            continue
         print(target_I, i, "/", len(target_Is))
+        _compute_and_store_all_to_all_stats(worker, target_I, stop_Is)
+    print(worker.get_timing_summary())
+
+
+def _compute_and_store_all_to_all_stats(worker, target_I, stop_Is):
+    """
+    Compute the profiles towards target_I with worker, and store their statistics.
+
+    The statistics are computed directly from the live profiles of the profiler, and each profile is released
+    as soon as its statistics have been computed (no copy of the profiles is kept), so that the memory
+    of a process is bounded by the profiles of one target.
+
+    Parameters
+    ----------
+    worker: ProfilingWorker
+    target_I: int
+    stop_Is: numpy.ndarray
+        the origins (in the order of the store)
+
+    Returns
+    -------
+    success: bool
+        False if the profiler failed with an AssertionError
+    """
+    start_time = time.time()
+    profile_data = worker.submit([target_I])
+    if profile_data is None:
+        _record_all_to_all_status(target_I, TARGET_SKIPPED_ASSERTION, time.time() - start_time, worker.params)
+        return False
+    with stage("statistics", n_stops=len(stop_Is)):
+        obs_name_to_data = compute_profile_statistics(profile_data["profiles"], stop_Is,
+                                                      ANALYSIS_START_TIME_DEP, ANALYSIS_END_TIME_DEP,
+                                                      release_profiles=True)
+    _store_all_to_all_stats(target_I, profile_data["params"], obs_name_to_data)
+    _record_all_to_all_status(target_I, TARGET_DONE, time.time() - start_time, profile_data["params"])
+    return True
+
+
+# State of a worker process of compute_all_to_all_profile_statistics_in_parallel
+_all_to_all_worker_state = {}
+
+
+def _init_all_to_all_worker(shared_directory, params, verbose):
+    _, name_to_array = read_array_directory(shared_directory)
+    connections = ConnectionStore(*[name_to_array[name] for name in CONNECTION_ARRAY_NAMES], is_sorted=True)
+    net = CSRWalkNetwork.from_csr_arrays(name_to_array["nodes_array"],
+                                         name_to_array["indptr"],
+                                         name_to_array["indices"],
+                                         name_to_array["d_walk"])
+    _all_to_all_worker_state["worker"] = ProfilingWorker(params, connections, net, verbose)
+    _all_to_all_worker_state["stop_Is"] = read_nodes()['stop_I'].values
+
+
+def _compute_all_to_all_stats_in_worker(target_I):
+    state = _all_to_all_worker_state
+    return target_I, _compute_and_store_all_to_all_stats(state["worker"], target_I, state["stop_Is"])
+
+
+def compute_all_to_all_profile_statistics_in_parallel(target_Is=None, n_cpus="max", verbose=False,
+                                                      skip_finished=True, max_temporal_distance=None):
+    """
+    Compute all-to-all statistics on one machine using a pool of worker processes.
+
+    The connections and the walk network are read once, and published to the workers as memory-mapped
+    .npy files (under /dev/shm, if available), so that all workers share the same (read-only) pages.
+    Each worker creates its own profiler once, and then only resets it for each target.
+
+    Parameters
+    ----------
+    target_Is: list, optional
+        defaults to all stops
+    n_cpus: int, str
+        number of worker processes, or "max" for using all cpus
+    verbose: bool, optional
+    skip_finished: bool, optional
+        if True, targets recorded as finished in the manifest (by earlier, possibly killed, runs) are skipped
+    max_temporal_distance: int, optional
+        see _get_params (the results are stored separately, see get_all_to_all_directory)
+    """
+    if target_Is is None:
+        target_Is = read_nodes()['stop_I'].values
+    if n_cpus == "max":
+        n_cpus = multiprocessing.cpu_count()
 
+    params = _fill_default_params(_get_params(None, max_temporal_distance=max_temporal_distance))
+    # (created before starting the workers, raises if the store has been created with other parameters)
+    _get_all_to_all_stats_store(params)
+    finished_target_Is = read_finished_all_to_all_targets(params) if skip_finished else set()
+    target_Is = [int(target_I) for target_I in target_Is if int(target_I) not in finished_target_Is]
+    connections, net = read_routing_inputs(params["routing_start_time_dep"],
+                                           params["routing_end_time_dep"],
+                                           params["max_walk_distance"])
+    name_to_array = connections.arrays()
+    name_to_array.update(net.csr_arrays())
+
+    shared_memory_directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    tmp_directory = tempfile.mkdtemp(prefix="all_to_all_inputs_", dir=shared_memory_directory)
+    shared_directory = os.path.join(tmp_directory, "inputs")
+    try:
+        write_array_directory(shared_directory, name_to_array, {"columns": list(name_to_array.keys())})
+        del connections, net, name_to_array
+        pool = multiprocessing.Pool(processes=n_cpus,
+                                    initializer=_init_all_to_all_worker,
+                                    initargs=(shared_directory, params, verbose))
         try:
-            data, csp = _compute_profile_data([target_I], csp=csp, verbose=verbose, return_profiler=True)
-        except AssertionError as e:
-            continue
+            results = pool.imap_unordered(_compute_all_to_all_stats_in_worker, target_Is)
+            for i, (target_I, success) in enumerate(results):
+                print(target_I, i, "/", len(target_Is), "" if success else "(failed)")
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(tmp_directory)
 
-        obs_name_to_data = __compute_profile_stats_from_profiles(data["profiles"])
-        fname = os.path.join(RESULTS_DIRECTORY, "all_to_all_stats",
-                             "all_to_all_stats_target_{target}.pkl".format(target=str(target_I)))
-        to_store = {
-            "target": target_I,
-            "params": data["params"],
-            "stats": obs_name_to_data
-        }
-        with open(fname, "wb") as f:
-            pickle.dump(to_store, f, -1)
\ No newline at end of file
+
+def compute_all_to_all_time_statistics_batched(target_Is=None, block_size=32, verbose=False):
+    """
+    Compute time-only all-to-all statistics (measures of NodeProfileAnalyzerTime), scanning the connections
+    once per block of targets with BatchConnectionScanProfiler.
+    The results are stored to ALL_TO_ALL_TIME_STATS_STORE_DIRECTORY; targets already completed there are skipped.
+
+    Parameters
+    ----------
+    target_Is: list, optional
+        defaults to all stops
+    block_size: int, optional
+        number of targets per connection scan (memory use grows linearly with it)
+    verbose: bool, optional
+    """
+    nodes = read_nodes()
+    if target_Is is None:
+        target_Is = nodes['stop_I'].values
+    params = _fill_default_params(_get_params(None, track_vehicle_legs=False))
+    from gtfspy.routing.node_profile_analyzer_time import NodeProfileAnalyzerTime
+    _, observable_names = NodeProfileAnalyzerTime.all_measures_and_names_as_lists()
+    store = _get_all_to_all_stats_store(params, ALL_TO_ALL_TIME_STATS_STORE_DIRECTORY, observable_names)
+    completed_target_Is = set(store.get_completed_target_Is().tolist())
+    connections, net = read_routing_inputs(params["routing_start_time_dep"],
+                                           params["routing_end_time_dep"],
+                                           params["max_walk_distance"])
+    target_Is = [int(target_I) for target_I in target_Is if int(target_I) not in completed_target_Is]
+    for block_start in range(0, len(target_Is), block_size):
+        block = target_Is[block_start:block_start + block_size]
+        print(block_start, "/", len(target_Is))
+        profiler = BatchConnectionScanProfiler(connections, block,
+                                               transfer_margin=params["transfer_margin"],
+                                               walk_network=net,
+                                               walk_speed=params["walking_speed"],
+                                               verbose=verbose)
+        with stage("batch_profiler_run", n_targets=len(block)):
+            profiler.run()
+        with stage("statistics", n_stops=len(nodes), n_targets=len(block)):
+            for target_I, stop_profiles in profiler.stop_profiles.items():
+                obs_name_to_data = compute_time_profile_statistics(stop_profiles, nodes['stop_I'].values,
+                                                                   ANALYSIS_START_TIME_DEP, ANALYSIS_END_TIME_DEP)
+                store.write_row(target_I, obs_name_to_data)
+
+
+def get_scenario_delta_store_directory(scenario_name, params=None):
+    """
+    The directory of the delta store of a scenario, kept next to the baseline store of the same routing parameters
+    (see get_all_to_all_directory).
+    """
+    return os.path.join(get_all_to_all_directory(params), "scenarios", scenario_name, "delta")
+
+
+def _open_baseline_stats_store(params, stop_Is, observable_names):
+    """
+    Open the all-to-all store of params for reading baseline rows, checking that its rows are comparable.
+
+    Returns
+    -------
+    store: AllToAllStatsStore or None
+        None if the store does not exist
+
+    Raises
+    ------
+    ValueError
+        if the store has been computed with other parameters, stops or observables
+    """
+    directory = os.path.join(get_all_to_all_directory(params), "store")
+    if not os.path.exists(directory):
+        return None
+    store = AllToAllStatsStore(directory)
+    store_params = _get_store_params(params)
+    if store.params != store_params:
+        differing_names = sorted(name for name in set(store.params or {}) | set(store_params)
+                                 if (store.params or {}).get(name) != store_params.get(name))
+        raise ValueError("the baseline store " + directory + " has been computed with other routing parameters "
+                         "(differing: " + ", ".join(differing_names) + ")")
+    if not numpy.array_equal(store.stop_Is, stop_Is):
+        raise ValueError("the stops of the baseline store " + directory + " differ from the current stops")
+    missing_names = [name for name in observable_names if name not in store.observable_names]
+    if missing_names:
+        raise ValueError("the baseline store " + directory + " is missing observables " + ", ".join(missing_names))
+    return store
+
+
+def compute_all_to_all_scenario_deltas(scenario_name, scenario_events_fname, target_Is=None, params=None,
+                                       verbose=False):
+    """
+    Compute the differences (scenario - baseline) of the all-to-all statistics between a timetable scenario and the
+    baseline timetable, recomputing only the targets that may be affected by the changed trips.
+
+    The deltas are stored to get_scenario_delta_store_directory(scenario_name, params) (one store row per target,
+    unaffected targets have all-zero rows), whose header records the routing parameters and the scenario events file.
+    Baseline statistics are taken from the all-to-all store of the same routing parameters when available
+    (after checking its header). Equal values (including both infinite or both nan) have a zero delta.
+    The status of each recomputed target is recorded in the manifest of the scenario (see read_all_to_all_manifest),
+    and targets skipped due to an AssertionError are not recomputed by later runs.
+
+    Parameters
+    ----------
+    scenario_name: str
+    scenario_events_fname: str
+        connections of the scenario, in the format of HELSINKI_TRANSIT_CONNECTIONS_FNAME
+        (trip_Is of unchanged trips must equal those of the baseline)
+    target_Is: list, optional
+        defaults to all stops
+    params: dict, optional
+        routing parameters (defaults are filled in), by default the default parameters
+    verbose: bool, optional
+
+    Returns
+    -------
+    changed_trip_Is: set
+    affected_target_Is: set
+
+    Raises
+    ------
+    ValueError
+        if the baseline store or an earlier delta store of the scenario is not comparable with this run
+    """
+    nodes = read_nodes()
+    stop_Is = nodes['stop_I'].values
+    if target_Is is None:
+        target_Is = stop_Is
+    target_Is = [int(target_I) for target_I in target_Is]
+    if params is None:
+        params = _get_params(None)
+    params = _fill_default_params(dict(params))
+    baseline_connections, net = read_routing_inputs(params["routing_start_time_dep"],
+                                                    params["routing_end_time_dep"],
+                                                    params["max_walk_distance"])
+    scenario_connections, _ = read_routing_inputs(params["routing_start_time_dep"],
+                                                  params["routing_end_time_dep"],
+                                                  params["max_walk_distance"],
+                                                  events_fname=scenario_events_fname)
+    changed_trip_Is = get_changed_trip_Is(baseline_connections, scenario_connections)
+    affected_target_Is = find_possibly_affected_targets(baseline_connections, scenario_connections, net,
+                                                        changed_trip_Is, params["walking_speed"])
+    print(len(changed_trip_Is), "changed trips,", len(affected_target_Is & set(target_Is)), "/", len(target_Is),
+          "targets possibly affected")
+
+    delta_params = dict(params, scenario_events_fname=os.path.abspath(scenario_events_fname))
+    delta_store = _get_all_to_all_stats_store(delta_params, get_scenario_delta_store_directory(scenario_name, params))
+    baseline_store = _open_baseline_stats_store(params, stop_Is, delta_store.observable_names)
+    completed_target_Is = set(delta_store.get_completed_target_Is().tolist())
+    completed_target_Is |= read_finished_all_to_all_targets(params, scenario_name)
+    delta_store.mark_completed([target_I for target_I in target_Is if target_I not in affected_target_Is])
+    baseline_matrices = {}
+    if baseline_store is not None:
+        baseline_matrices = {name: baseline_store.read_observable_matrix(name, only_completed=False)[1]
+                             for name in delta_store.observable_names}
+    baseline_worker = ProfilingWorker(params, baseline_connections, net, verbose)
+    scenario_worker = ProfilingWorker(params, scenario_connections, net, verbose)
+
+    def compute_stats(worker, target_I):
+        profile_data = worker.submit([target_I])
+        if profile_data is None:
+            return None
+        with stage("statistics", n_stops=len(stop_Is)):
+            return compute_profile_statistics(profile_data["profiles"], stop_Is,
+                                              ANALYSIS_START_TIME_DEP, ANALYSIS_END_TIME_DEP, release_profiles=True)
+
+    target_Is = [target_I for target_I in target_Is if target_I in affected_target_Is
+                 and target_I not in completed_target_Is]
+    for i, target_I in enumerate(target_Is):
+        print(target_I, i, "/", len(target_Is))
+        start_time = time.time()
+        if baseline_store is not None and baseline_store.is_completed(target_I):
+            row = baseline_store.get_index(target_I)
+            baseline_stats = {name: matrix[row] for name, matrix in baseline_matrices.items()}
+        else:
+            baseline_stats = compute_stats(baseline_worker, target_I)
+        scenario_stats = compute_stats(scenario_worker, target_I)
+        if baseline_stats is None or scenario_stats is None:
+            print("Skipping target " + str(target_I) + " (the " + ("baseline" if baseline_stats is None else
+                                                                   "scenario") + " profiler failed)")
+            _record_all_to_all_status(target_I, TARGET_SKIPPED_ASSERTION, time.time() - start_time, params,
+                                      scenario_name)
+            continue
+        obs_name_to_delta = {}
+        for name in delta_store.observable_names:
+            # (compared at the precision of the store)
+            baseline_values = numpy.asarray(baseline_stats[name], dtype=numpy.float32)
+            scenario_values = numpy.asarray(scenario_stats[name], dtype=numpy.float32)
+            is_equal = (scenario_values == baseline_values) | (numpy.isnan(scenario_values) &
+                                                               numpy.isnan(baseline_values))
+            with numpy.errstate(invalid="ignore"):
+                obs_name_to_delta[name] = numpy.where(is_equal, 0, scenario_values - baseline_values)
+        delta_store.write_row(target_I, obs_name_to_delta)
+        _record_all_to_all_status(target_I, TARGET_DONE, time.time() - start_time, params, scenario_name)
+    return changed_trip_Is, affected_target_Is
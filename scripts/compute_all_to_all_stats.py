@@ -2,27 +2,55 @@ from __future__ import print_function
 
 import sys
 
-import pandas
+import numpy
 
-from compute import compute_all_to_all_profile_statistics_with_defaults
-from settings import HELSINKI_NODES_FNAME
-from util import split_into_equal_length_parts
+from compute import compute_all_to_all_profile_statistics_with_defaults, \
+    compute_all_to_all_profile_statistics_in_parallel, estimate_all_to_all_target_costs, \
+    compute_all_to_all_time_statistics_batched, write_all_to_all_partition, read_all_to_all_partition_part, \
+    ALL_TO_ALL_PARTITION_FNAME
+from extracts import read_nodes
 
 
 
 if __name__ == "__main__":
-    _, slurm_array_i, slurm_array_length = sys.argv
-    slurm_array_i = int(slurm_array_i)
-    slurm_array_length = int(slurm_array_length)
+    # Usage:
+    #   python compute_all_to_all_stats.py partition <slurm_array_length>
+    #       (run once before submitting: splits the unfinished targets into cost-balanced parts)
+    #   python compute_all_to_all_stats.py <slurm_array_i> <slurm_array_length>  (one part of that partition)
+    #   python compute_all_to_all_stats.py <slurm_array_i> <slurm_array_length> queue
+    #       (all array tasks pull targets, most costly first, from a work queue shared through the file system)
+    #   python compute_all_to_all_stats.py local [n_cpus]  (all targets, using all / n_cpus cores of this machine)
+    #   python compute_all_to_all_stats.py time_only [block_size]
+    #       (time-only statistics for all targets, scanning the connections once per block of targets)
+    if sys.argv[1] == "local":
+        n_cpus = "max"
+        if len(sys.argv) > 2:
+            n_cpus = int(sys.argv[2])
+        compute_all_to_all_profile_statistics_in_parallel(n_cpus=n_cpus)
+        sys.exit(0)
+    if sys.argv[1] == "partition":
+        parts = write_all_to_all_partition(int(sys.argv[2]))
+        print("Wrote", len(parts), "parts of", sum(len(part) for part in parts), "targets to",
+              ALL_TO_ALL_PARTITION_FNAME)
+        sys.exit(0)
+    if sys.argv[1] == "time_only":
+        block_size = 32
+        if len(sys.argv) > 2:
+            block_size = int(sys.argv[2])
+        compute_all_to_all_time_statistics_batched(block_size=block_size)
+        sys.exit(0)
+
+    slurm_array_i = int(sys.argv[1])
+    slurm_array_length = int(sys.argv[2])
+    use_queue = len(sys.argv) > 3 and sys.argv[3] == "queue"
 
     assert(slurm_array_i < slurm_array_length)
-    nodes = pandas.read_csv(HELSINKI_NODES_FNAME)['stop_I'].values
-    parts = split_into_equal_length_parts(nodes, slurm_array_length)
-    targets = parts[slurm_array_i]
-
-    compute_all_to_all_profile_statistics_with_defaults(targets)
-
-
-
-
-
+    if use_queue:
+        # (the order only affects the balance: each target is computed by the task that claims it first)
+        nodes = read_nodes()['stop_I'].values
+        costs = estimate_all_to_all_target_costs(nodes)
+        targets = [nodes[i] for i in numpy.argsort(-costs, kind="mergesort")]
+        compute_all_to_all_profile_statistics_with_defaults(targets, claim_targets=True)
+    else:
+        targets = read_all_to_all_partition_part(slurm_array_i, slurm_array_length)
+        compute_all_to_all_profile_statistics_with_defaults(targets)
@@ -0,0 +1,125 @@
+"""
+Columnar (numpy-backed) storage of transit connections.
+"""
+
+import numpy
+
+from gtfspy.routing.connection import Connection
+
+from extracts import read_extract_columns, read_extract_window
+
+# header of the temporal network extract:
+# from_stop_I, to_stop_I, dep_time_ut, arr_time_ut, route_type, trip_I, seq, route_I
+CONNECTION_ARRAY_NAMES = ["from_stop_I", "to_stop_I", "dep_time_ut", "arr_time_ut", "trip_I", "seq"]
+CONNECTION_ARRAY_DTYPES = {
+    "from_stop_I": numpy.int32,
+    "to_stop_I": numpy.int32,
+    "dep_time_ut": numpy.int64,
+    "arr_time_ut": numpy.int64,
+    "trip_I": numpy.int32,
+    "seq": numpy.int32
+}
+
+
+class ConnectionStore:
+    """
+    Transit connections stored as typed numpy arrays, ordered by DECREASING departure time.
+    (Ties are kept in their original order, as with a stable sort.)
+
+    Connection objects (as required by MultiObjectivePseudoCSAProfiler) are only created on demand.
+    """
+
+    def __init__(self, from_stop_I, to_stop_I, dep_time_ut, arr_time_ut, trip_I, seq, is_sorted=False):
+        """
+        Parameters
+        ----------
+        from_stop_I, to_stop_I, dep_time_ut, arr_time_ut, trip_I, seq: array-like
+            one element per connection
+        is_sorted: bool, optional
+            set to True, if the arrays are already in decreasing order of departure time
+        """
+        arrays = [from_stop_I, to_stop_I, dep_time_ut, arr_time_ut, trip_I, seq]
+        arrays = [numpy.asarray(array, dtype=CONNECTION_ARRAY_DTYPES[name])
+                  for name, array in zip(CONNECTION_ARRAY_NAMES, arrays)]
+        n_connections = len(arrays[0])
+        assert all(len(array) == n_connections for array in arrays)
+        if not is_sorted:
+            order = numpy.argsort(-arrays[2], kind="mergesort")
+            arrays = [array[order] for array in arrays]
+        self.from_stop_I, self.to_stop_I, self.dep_time_ut, self.arr_time_ut, self.trip_I, self.seq = arrays
+
+    @classmethod
+    def from_columns(cls, name_to_array, routing_start_time_dep, routing_end_time_dep):
+        """
+        Create a store from (unsorted) columns, keeping only connections
+        departing within [routing_start_time_dep, routing_end_time_dep].
+
+        Parameters
+        ----------
+        name_to_array: dict
+            mapping from CONNECTION_ARRAY_NAMES to arrays (e.g. memory-mapped ones)
+        """
+        dep_times = name_to_array["dep_time_ut"]
+        valids = (routing_start_time_dep <= dep_times) & (dep_times <= routing_end_time_dep)
+        return cls(*[name_to_array[name][valids] for name in CONNECTION_ARRAY_NAMES])
+
+    @classmethod
+    def from_csv(cls, events_fname, routing_start_time_dep, routing_end_time_dep):
+        """
+        Read connections departing within [routing_start_time_dep, routing_end_time_dep] from a csv file
+        (or from its binary sidecar, if one exists).
+        """
+        name_to_array = read_extract_window(events_fname, CONNECTION_ARRAY_NAMES, "dep_time_ut",
+                                            routing_start_time_dep, routing_end_time_dep)
+        if name_to_array is not None:
+            # sidecar is sorted by increasing departure time -> only the window is read, backwards
+            return cls(*[name_to_array[name][::-1] for name in CONNECTION_ARRAY_NAMES], is_sorted=True)
+        name_to_array = read_extract_columns(events_fname, CONNECTION_ARRAY_NAMES)
+        return cls.from_columns(name_to_array, routing_start_time_dep, routing_end_time_dep)
+
+    def arrays(self):
+        """
+        Returns
+        -------
+        name_to_array: dict
+            mapping from CONNECTION_ARRAY_NAMES to the (sorted) numpy arrays
+        """
+        return {name: getattr(self, name) for name in CONNECTION_ARRAY_NAMES}
+
+    def window(self, routing_start_time_dep, routing_end_time_dep):
+        """
+        Get a view of the connections departing within [routing_start_time_dep, routing_end_time_dep].
+
+        Returns
+        -------
+        store: ConnectionStore
+            the arrays of the new store are views to the arrays of this store (no copying)
+        """
+        negative_dep_times = -self.dep_time_ut
+        start = numpy.searchsorted(negative_dep_times, -routing_end_time_dep, side="left")
+        end = numpy.searchsorted(negative_dep_times, -routing_start_time_dep, side="right")
+        return ConnectionStore(*[getattr(self, name)[start:end] for name in CONNECTION_ARRAY_NAMES],
+                               is_sorted=True)
+
+    def __len__(self):
+        return len(self.dep_time_ut)
+
+    def __getitem__(self, index):
+        return Connection(int(self.from_stop_I[index]), int(self.to_stop_I[index]), int(self.dep_time_ut[index]),
+                          int(self.arr_time_ut[index]), int(self.trip_I[index]), int(self.seq[index]))
+
+    def __iter__(self):
+        columns = [getattr(self, name).tolist() for name in CONNECTION_ARRAY_NAMES]
+        for from_stop_I, to_stop_I, dep_time, arr_time, trip_I, seq in zip(*columns):
+            yield Connection(from_stop_I, to_stop_I, dep_time, arr_time, trip_I, seq)
+
+    def to_connections(self):
+        """
+        Materialize the connections as a list of Connection objects.
+
+        Returns
+        -------
+        connections: list[Connection]
+            ordered by decreasing departure time
+        """
+        return list(iter(self))
@@ -0,0 +1,36 @@
+"""
+MultiObjectivePseudoCSAProfiler reading the walking transfers of the final footpath scan from a CSRWalkNetwork.
+
+After the connection scan, the profiler joins the profile of each stop with the profiles of the stops within
+walking distance (_finalize_profiles). Here, the neighbors and the precomputed walk durations of each stop are
+read as slices of the CSR arrays, instead of through the networkx-compatible methods of CSRWalkNetwork
+(one edge lookup per neighbor). The results are identical to those of MultiObjectivePseudoCSAProfiler.
+
+The pseudo connections (computed once per profiler) and the walk durations to the targets (computed at each reset)
+are still computed by gtfspy through the networkx-compatible methods.
+"""
+
+from gtfspy.routing.multi_objective_pseudo_connection_scan_profiler import MultiObjectivePseudoCSAProfiler
+
+from walk_network import CSRWalkNetwork
+
+
+class CSRMultiObjectivePseudoCSAProfiler(MultiObjectivePseudoCSAProfiler):
+
+    def _finalize_profiles(self):
+        net = self._walk_network
+        if not isinstance(net, CSRWalkNetwork):
+            return MultiObjectivePseudoCSAProfiler._finalize_profiles(self)
+        if net.walking_speed != self._walk_speed:
+            net.set_walking_speed(self._walk_speed)
+        for stop, stop_profile in self._stop_profiles.items():
+            neighbor_label_bags = []
+            walk_durations_to_neighbors = []
+            departure_arrival_stop_pairs = []
+            if stop_profile.get_walk_to_target_duration() != 0:
+                neighbors, _, walk_durations = net.neighbor_arrays(stop)
+                for neighbor, walk_duration in zip(neighbors.tolist(), walk_durations.tolist()):
+                    neighbor_label_bags.append(self._stop_profiles[neighbor].get_labels_for_real_connections())
+                    walk_durations_to_neighbors.append(walk_duration)
+                    departure_arrival_stop_pairs.append((stop, neighbor))
+            stop_profile.finalize(neighbor_label_bags, walk_durations_to_neighbors, departure_arrival_stop_pairs)
@@ -0,0 +1,191 @@
+"""
+Binary (memory-mappable) sidecars for the csv extracts written by prepare.create_extracts.
+
+For each csv extract, e.g. main.day.temporal_network.csv, the sidecar is a directory
+main.day.temporal_network.bin/ containing one .npy file per csv column and a small json header.
+A sidecar is only used if its format version matches, and if the csv file has not been modified
+after writing the sidecar.
+The rows of a sidecar can be sorted by one column (e.g. dep_time_ut), which then acts as an index:
+rows within a range of that column are found by binary search and read as one contiguous slice.
+"""
+
+import json
+import os
+import shutil
+
+import numpy
+
+from settings import HELSINKI_NODES_FNAME
+
+EXTRACT_FORMAT_VERSION = 2
+SIDECAR_HEADER_FNAME = "header.json"
+
+
+def get_sidecar_directory(csv_fname):
+    return os.path.splitext(csv_fname)[0] + ".bin"
+
+
+def _get_source_info(csv_fname):
+    stat = os.stat(csv_fname)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_array_directory(directory, name_to_array, header):
+    """
+    Write each array to directory/name.npy, together with a json header.
+    The directory is first written under a temporary name and then renamed in place.
+
+    Parameters
+    ----------
+    directory: str
+    name_to_array: dict
+    header: dict
+        json-serializable
+    """
+    tmp_directory = directory + ".tmp" + str(os.getpid())
+    if os.path.exists(tmp_directory):
+        shutil.rmtree(tmp_directory)
+    os.makedirs(tmp_directory)
+    for name, array in name_to_array.items():
+        numpy.save(os.path.join(tmp_directory, name + ".npy"), array)
+    with open(os.path.join(tmp_directory, SIDECAR_HEADER_FNAME), "w") as f:
+        json.dump(header, f, indent=1)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.rename(tmp_directory, directory)
+
+
+def read_array_directory(directory, names=None, mmap_mode="r"):
+    """
+    Read arrays written by write_array_directory.
+
+    Returns
+    -------
+    header: dict
+    name_to_array: dict
+        arrays are memory-mapped (read-only by default)
+    """
+    with open(os.path.join(directory, SIDECAR_HEADER_FNAME), "r") as f:
+        header = json.load(f)
+    if names is None:
+        names = header["columns"]
+    name_to_array = {name: numpy.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+                     for name in names}
+    return header, name_to_array
+
+
+def write_extract_sidecar(csv_fname, sep=",", sort_by=None):
+    """
+    Parse a csv extract once and write its columns as a binary sidecar.
+
+    Parameters
+    ----------
+    csv_fname: str
+    sep: str, optional
+    sort_by: str, optional
+        name of the column by which the rows are sorted (in increasing order).
+        Rows with equal values are stored in reverse file order, so that reading a slice backwards
+        gives the same order as a stable sort in decreasing order.
+    """
+    source_info = _get_source_info(csv_fname)
+    import pandas
+    data = pandas.read_csv(csv_fname, sep=sep)
+    if sort_by is not None:
+        order = numpy.lexsort((-numpy.arange(len(data)), data[sort_by].values))
+        data = data.iloc[order]
+    name_to_array = {}
+    for column in data.columns:
+        values = numpy.asarray(data[column])
+        if values.dtype.kind == "O":
+            # fixed-width strings, as object arrays can not be memory-mapped
+            values = values.astype(str)
+        name_to_array[column] = values
+    header = {
+        "format_version": EXTRACT_FORMAT_VERSION,
+        "source": source_info,
+        "sep": sep,
+        "n_rows": len(data),
+        "columns": list(data.columns),
+        "sorted_by": sort_by
+    }
+    write_array_directory(get_sidecar_directory(csv_fname), name_to_array, header)
+
+
+def _read_up_to_date_sidecar_header(csv_fname):
+    directory = get_sidecar_directory(csv_fname)
+    if not os.path.exists(os.path.join(directory, SIDECAR_HEADER_FNAME)):
+        return None
+    with open(os.path.join(directory, SIDECAR_HEADER_FNAME), "r") as f:
+        header = json.load(f)
+    if header["format_version"] != EXTRACT_FORMAT_VERSION:
+        return None
+    if os.path.exists(csv_fname) and header["source"] != _get_source_info(csv_fname):
+        print("Binary sidecar of " + csv_fname + " is out of date, using the csv file instead")
+        return None
+    return header
+
+
+def read_extract_sidecar(csv_fname, names=None):
+    """
+    Returns
+    -------
+    name_to_array: dict, None
+        memory-mapped columns, or None if no up-to-date sidecar exists for csv_fname
+    """
+    if _read_up_to_date_sidecar_header(csv_fname) is None:
+        return None
+    _, name_to_array = read_array_directory(get_sidecar_directory(csv_fname), names)
+    return name_to_array
+
+
+def read_extract_window(csv_fname, names, sort_column, min_value, max_value):
+    """
+    Read the rows with min_value <= sort_column <= max_value from a sorted sidecar.
+
+    Returns
+    -------
+    name_to_array: dict, None
+        memory-mapped slices of the columns (in increasing order of sort_column),
+        or None if there is no up-to-date sidecar sorted by sort_column
+    """
+    header = _read_up_to_date_sidecar_header(csv_fname)
+    if header is None or header.get("sorted_by") != sort_column:
+        return None
+    _, name_to_array = read_array_directory(get_sidecar_directory(csv_fname), set(names) | {sort_column})
+    index = name_to_array[sort_column]
+    start = numpy.searchsorted(index, min_value, side="left")
+    end = numpy.searchsorted(index, max_value, side="right")
+    return {name: name_to_array[name][start:end] for name in names}
+
+
+def read_extract_columns(csv_fname, names, sep=","):
+    """
+    Read the given columns of a csv extract, preferring its binary sidecar.
+
+    Returns
+    -------
+    name_to_array: dict
+    """
+    name_to_array = read_extract_sidecar(csv_fname, names)
+    if name_to_array is None:
+        import pandas
+        data = pandas.read_csv(csv_fname, sep=sep, usecols=names)
+        name_to_array = {name: data[name].values for name in names}
+    return name_to_array
+
+
+def read_nodes(fname=HELSINKI_NODES_FNAME):
+    """
+    Read the nodes (stops) extract.
+
+    Returns
+    -------
+    nodes: pandas.DataFrame
+    """
+    # (pandas is imported only when used, as it is slow to import)
+    import pandas
+    name_to_array = read_extract_sidecar(fname)
+    if name_to_array is None:
+        return pandas.read_csv(fname, sep=";")
+    # (columns are in the same order as in the csv file)
+    return pandas.DataFrame({name: numpy.asarray(array) for name, array in name_to_array.items()})
@@ -0,0 +1,222 @@
+"""
+Structured timing and memory records of the stages of the computation pipelines.
+
+Each stage (e.g. reading the connections, running the profiler) is measured with
+
+    with stage("profiler_run", n_targets=len(targets)) as record:
+        csp.run()
+        record["n_stops"] = len(csp.stop_profiles)
+
+which appends one json line to the instrumentation log with the wall time, CPU time and peak resident memory
+(of the whole process) of the stage, the item counts given as keyword arguments or set in the record,
+and the path of enclosing stages. Only numbers and (truncated) strings are recorded, so that large objects
+are never formatted; nothing is printed unless verbose is set.
+
+Each process (including pool workers and slurm array tasks) appends to its own file in the log directory,
+named after the host and the process id, so that no two processes (possibly on different nodes of a network
+file system) ever append to the same file. read_stage_records merges the files.
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # (not available on Windows)
+    resource = None
+
+from settings import INSTRUMENTATION_LOG_DIRECTORY
+
+_MAX_STRING_LENGTH = 200
+
+_state = {"log_directory": INSTRUMENTATION_LOG_DIRECTORY, "verbose": False}
+_write_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure(log_directory=INSTRUMENTATION_LOG_DIRECTORY, verbose=False):
+    """
+    Parameters
+    ----------
+    log_directory: str, optional
+        directory to which the records are appended (json lines, one file per process), None to not write records
+    verbose: bool, optional
+        print a one-line summary of each stage
+    """
+    _state["log_directory"] = log_directory
+    _state["verbose"] = verbose
+
+
+def get_log_fname(log_directory=None):
+    """
+    Returns
+    -------
+    log_fname: str or None
+        the file of the records of this process (None if records are not written)
+    """
+    if log_directory is None:
+        log_directory = _state["log_directory"]
+        if log_directory is None:
+            return None
+    # (the process id is read at each call, as pool workers may be forked after the module has been imported)
+    return os.path.join(log_directory, "stages_%s_%d.jsonl" % (socket.gethostname(), os.getpid()))
+
+
+def get_peak_rss_bytes():
+    """
+    Returns
+    -------
+    peak_rss_bytes: int or None
+        the peak resident set size of this process so far (None if not available)
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # (in kilobytes on Linux, in bytes on macOS)
+    return int(max_rss) if sys.platform == "darwin" else int(max_rss) * 1024
+
+
+def _to_record_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if hasattr(value, "item") and getattr(value, "ndim", None) == 0:
+        return value.item()  # numpy scalars
+    if isinstance(value, str):
+        return value[:_MAX_STRING_LENGTH]
+    return "<" + type(value).__name__ + ">"
+
+
+def _write_record(record):
+    if _state["verbose"]:
+        print("stage %s: %.3f s wall, %.3f s cpu" % (record["path"], record["wall_time"], record["cpu_time"]))
+    log_fname = get_log_fname()
+    if log_fname is None:
+        return
+    line = json.dumps(record) + "\n"
+    with _write_lock:
+        directory = _state["log_directory"]
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(log_fname, "a") as f:
+            f.write(line)
+
+
+@contextmanager
+def stage(name, **counts):
+    """
+    Measure a stage of computation (see the module docstring).
+
+    Parameters
+    ----------
+    name: str
+    counts:
+        item counts (or other short values) to record
+
+    Yields
+    ------
+    record: dict
+        values set in it (e.g. counts known only at the end of the stage) are added to the record
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(name)
+    extra = {}
+    start_wall_time = time.time()
+    start_perf_counter = time.perf_counter()
+    start_cpu_time = time.process_time()
+    start_peak_rss = get_peak_rss_bytes()
+    status = "error"
+    try:
+        yield extra
+        status = "ok"
+    finally:
+        peak_rss = get_peak_rss_bytes()
+        record = {
+            "stage": name,
+            "path": "/".join(stack),
+            "status": status,
+            "start_time": start_wall_time,
+            "wall_time": time.perf_counter() - start_perf_counter,
+            "cpu_time": time.process_time() - start_cpu_time,
+            "peak_rss_bytes": peak_rss,
+            "peak_rss_increase_bytes": peak_rss - start_peak_rss if peak_rss is not None else None,
+            "pid": os.getpid(),
+            "host": socket.gethostname()
+        }
+        stack.pop()
+        record.update({key: _to_record_value(value) for key, value in counts.items()})
+        record.update({key: _to_record_value(value) for key, value in extra.items()})
+        _write_record(record)
+
+
+def read_stage_records(log_path=INSTRUMENTATION_LOG_DIRECTORY):
+    """
+    Parameters
+    ----------
+    log_path: str, optional
+        a log directory (the records of all its processes are merged) or a single log file
+
+    Returns
+    -------
+    records: list[dict]
+        in the order of their start times
+    """
+    if os.path.isdir(log_path):
+        log_fnames = [os.path.join(log_path, fname) for fname in sorted(os.listdir(log_path))
+                      if fname.endswith(".jsonl")]
+    else:
+        log_fnames = [log_path]
+    records = []
+    for log_fname in log_fnames:
+        with open(log_fname) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # (the last line of a process that was killed while writing it)
+                    continue
+    records.sort(key=lambda record: record["start_time"])
+    return records
+
+
+def summarize_stage_records(records):
+    """
+    Total and maximum durations of each stage (path).
+
+    Returns
+    -------
+    path_to_summary: dict
+        mapping from stage path to a dict with "n", "total_wall_time", "total_cpu_time", "max_wall_time"
+        and "max_peak_rss_bytes"
+    """
+    path_to_summary = {}
+    for record in records:
+        summary = path_to_summary.setdefault(record["path"], {"n": 0, "total_wall_time": 0.0, "total_cpu_time": 0.0,
+                                                              "max_wall_time": 0.0, "max_peak_rss_bytes": None})
+        summary["n"] += 1
+        summary["total_wall_time"] += record["wall_time"]
+        summary["total_cpu_time"] += record["cpu_time"]
+        summary["max_wall_time"] = max(summary["max_wall_time"], record["wall_time"])
+        if record.get("peak_rss_bytes") is not None:
+            summary["max_peak_rss_bytes"] = max(summary["max_peak_rss_bytes"] or 0, record["peak_rss_bytes"])
+    return path_to_summary
+
+
+if __name__ == "__main__":
+    log_path = sys.argv[1] if len(sys.argv) > 1 else INSTRUMENTATION_LOG_DIRECTORY
+    path_to_summary = summarize_stage_records(read_stage_records(log_path))
+    print("%-60s %6s %12s %12s %12s %10s" % ("stage", "n", "wall (s)", "cpu (s)", "max wall (s)", "peak (MB)"))
+    for path, summary in sorted(path_to_summary.items(), key=lambda item: -item[1]["total_wall_time"]):
+        peak = summary["max_peak_rss_bytes"]
+        print("%-60s %6d %12.3f %12.3f %12.3f %10s" % (path, summary["n"], summary["total_wall_time"],
+                                                      summary["total_cpu_time"], summary["max_wall_time"],
+                                                      "%.0f" % (peak / 1024.0 ** 2) if peak is not None else "-"))
@@ -0,0 +1,78 @@
+"""
+Verification of the max_temporal_distance routing parameter on a synthetic network (see synthetic_network.py).
+
+For each cutoff and target, the node profile statistics computed with the cutoff are compared with those of
+an uncut run: the temporal distance statistics of the stops whose temporal distances are all within the cutoff
+must be identical, and the minimum temporal distances above the cutoff must remain above it.
+The cutoffs include ones shorter than any trip towards the targets, so that pruning removes all connections
+(only walking remains). An AssertionError is raised at the first difference.
+
+Usage:
+    python max_temporal_distance_verification.py
+"""
+
+import shutil
+import tempfile
+
+import numpy
+
+from compute import read_routing_inputs, ProfilingWorker, TARGET_DONE, _fill_default_params, _get_params
+from profile_stats import compute_profile_statistics
+from synthetic_network import generate_synthetic_network, write_synthetic_network, DEFAULT_START_TIME_UT
+
+TARGETS = [0, 5, 143]
+MAX_TEMPORAL_DISTANCES = [60, 300, 600, 1800]
+
+# statistics compared for the stops with the (exact) max_temporal_distance within the cutoff:
+TEMPORAL_DISTANCE_NAMES = ["min_temporal_distance", "max_temporal_distance", "mean_temporal_distance",
+                           "median_temporal_distance"]
+
+_ROUTING_START_TIME_DEP = DEFAULT_START_TIME_UT + 3600
+_ANALYSIS_DURATION = 3600
+_ROUTING_DURATION = 3 * 3600
+
+
+def verify_max_temporal_distance(targets=TARGETS, max_temporal_distances=MAX_TEMPORAL_DISTANCES):
+    work_directory = tempfile.mkdtemp()
+    try:
+        network = generate_synthetic_network(layout="grid", n_stops=144, n_routes=6, headway=600)
+        fnames = write_synthetic_network(network, work_directory)
+        stop_Is = network["nodes"]["stop_I"].values
+        params = _fill_default_params(_get_params(None, routing_start_time_dep=_ROUTING_START_TIME_DEP,
+                                                  routing_end_time_dep=_ROUTING_START_TIME_DEP + _ROUTING_DURATION))
+        connections, net = read_routing_inputs(params["routing_start_time_dep"], params["routing_end_time_dep"],
+                                               params["max_walk_distance"], events_fname=fnames["connections"],
+                                               transfers_fname=fnames["transfers"], use_cache=False)
+        worker = ProfilingWorker(params, connections, net)
+
+        def compute_stats(target, max_temporal_distance):
+            profile_data = worker.submit([target], {"max_temporal_distance": max_temporal_distance})
+            assert profile_data is not None and worker.timings[-1][1] == TARGET_DONE, \
+                "target " + str(target) + " failed with max_temporal_distance " + str(max_temporal_distance)
+            return compute_profile_statistics(profile_data["profiles"], stop_Is, _ROUTING_START_TIME_DEP,
+                                              _ROUTING_START_TIME_DEP + _ANALYSIS_DURATION)
+
+        for target in targets:
+            exact_stats = compute_stats(target, None)
+            for max_temporal_distance in max_temporal_distances:
+                cut_stats = compute_stats(target, max_temporal_distance)
+                within = numpy.asarray(exact_stats["max_temporal_distance"], dtype=float) <= max_temporal_distance
+                for name in TEMPORAL_DISTANCE_NAMES:
+                    exact_values = numpy.asarray(exact_stats[name], dtype=float)
+                    cut_values = numpy.asarray(cut_stats[name], dtype=float)
+                    assert numpy.array_equal(exact_values[within], cut_values[within]), \
+                        name + " of target " + str(target) + " differs within " + str(max_temporal_distance) + " s"
+                exact_min_values = numpy.asarray(exact_stats["min_temporal_distance"], dtype=float)
+                cut_min_values = numpy.asarray(cut_stats["min_temporal_distance"], dtype=float)
+                above = ~(exact_min_values <= max_temporal_distance)
+                assert not numpy.any(cut_min_values[above] <= max_temporal_distance), \
+                    "min_temporal_distance of target " + str(target) + " falls within " + \
+                    str(max_temporal_distance) + " s only with the cutoff"
+                print("target", target, "max_temporal_distance", max_temporal_distance, "ok")
+    finally:
+        shutil.rmtree(work_directory)
+
+
+if __name__ == "__main__":
+    verify_max_temporal_distance()
+    print("max_temporal_distance verified")
@@ -2,7 +2,6 @@ import os
 
 import matplotlib
 import numpy
-import pandas
 from matplotlib import cm
 from matplotlib import gridspec
 from matplotlib import pyplot as plt
@@ -11,11 +10,12 @@ from matplotlib.axes import Axes
 from matplotlib.colors import Normalize
 
 from gtfspy.routing.node_profile_analyzer_time_and_veh_legs import NodeProfileAnalyzerTimeAndVehLegs
-from gtfspy.util import wgs84_distance
+import plot_settings
+from extracts import read_nodes
 from plot_profiles_on_a_map import _plot_smopy
 from prepare import get_swimming_hall_data
-from settings import HELSINKI_NODES_FNAME
 from settings import RESULTS_DIRECTORY, FIGS_DIRECTORY
+from spatial_index import StopSpatialIndex
 from util import get_data_or_compute, get_smopy_map
 
 rc("text", usetex=True)
@@ -73,20 +73,10 @@ closest_stops_fname = os.path.join(RESULTS_DIRECTORY, "multiple_targets_closest_
 
 
 def get_closest_nodes():
-    closest_stops = []
-    nodes = pandas.read_csv(HELSINKI_NODES_FNAME)
-    for swimming_hall in target_locations:
-        swimming_hall_lat = swimming_hall['latitude']
-        swimming_hall_lon = swimming_hall['longitude']
-        min_distance = float('inf')
-        min_node = None
-        for node in nodes.itertuples():
-            distance = wgs84_distance(swimming_hall_lat, swimming_hall_lon, node.lat, node.lon)
-            if distance < min_distance:
-                min_distance = distance
-                min_node = node
-        closest_stops.append(min_node.stop_I)
-    return closest_stops
+    spatial_index = StopSpatialIndex.from_nodes(read_nodes())
+    closest_stop_Is, _ = spatial_index.nearest([location['latitude'] for location in target_locations],
+                                               [location['longitude'] for location in target_locations])
+    return closest_stop_Is[:, 0].tolist()
 
 
 # closest_stop_Is = get_data_or_compute(closest_stops_fname, get_closest_nodes, recompute=recompute_all)
@@ -102,20 +92,17 @@ else:
                # 7608] # kirkkonummen asema  ]
 
 
-from compute import _compute_profile_data, __compute_profile_stats_from_profiles
+from compute import get_profile_data, __compute_profile_stats_from_profiles
 
 kwargs_for_computations = {
-    "targets": targets,
     "track_vehicle_legs": True,
     "track_time": True
 }
 
 
 
-profile_data_fname = os.path.join(RESULTS_DIRECTORY, "profiles_targets_multiple_targets_" + fname_postfix + ".pickle")
 print("Compute stop profiles")
-profiles = get_data_or_compute(profile_data_fname, _compute_profile_data, recompute=False,
-                               **kwargs_for_computations)['profiles']
+profiles = get_profile_data(targets, recompute=False, **kwargs_for_computations)['profiles']
 
 print("Compute profiles")
 profile_data_fname = os.path.join(RESULTS_DIRECTORY, "profile_stats_multiple_targets_" + fname_postfix + ".pickle")
@@ -144,7 +131,7 @@ fig = plt.figure(figsize=(12, 5))
 axs = [plt.subplot(gs1[:, :4]), plt.subplot(gs2[:, :4])]
 caxs = [plt.subplot(gs1[:, 4:]), plt.subplot(gs2[:, 4:])]
 
-nodes = pandas.read_csv(HELSINKI_NODES_FNAME, sep=";")
+nodes = read_nodes()
 lats = nodes['lat'].values
 lons = nodes['lon'].values
 
@@ -1,13 +1,12 @@
 import os
-import pickle
 
 from matplotlib import pyplot as plt
 from matplotlib import rc
 
+import plot_settings
 import settings
-from compute import _compute_profile_data
+from compute import get_profile_data
 from gtfspy.routing.node_profile_analyzer_time_and_veh_legs import NodeProfileAnalyzerTimeAndVehLegs
-from util import get_data_or_compute
 
 rc("text", usetex=True)
 
@@ -29,28 +28,14 @@ else:
 
 origin_stop_I = settings.get_stop_I_by_stop_id(origin_stop_id)
 
-# Computing the profile and caching some of the data
-profile_fname = os.path.join(settings.RESULTS_DIRECTORY, profile_fname_prefix + "_profile.pickle")
-try:
-    if recompute:
-        raise RuntimeError("Recomputing!")
-    print(profile_fname)
-    profile = pickle.load(open(profile_fname, 'rb'))
-except:
-    fname = os.path.join(settings.RESULTS_DIRECTORY, "long_profiles_" + profile_fname_prefix + ".pkl")
-    params = {
-        "targets": [destination_stop_I],
-        "routing_start_time_dep": settings.DAY_START,
-        "routing_end_time_dep": settings.DAY_END
-    }
-
-    data = get_data_or_compute(fname, _compute_profile_data, recompute=recompute, **params)
-
-    print(data["params"])
-
-    profiles = data["profiles"]
-    profile = profiles[origin_stop_I]
-    pickle.dump(profile, open(profile_fname, 'wb'), -1)
+# Computing the profiles (or loading only the profile of the origin stop from the cache)
+params = {
+    "routing_start_time_dep": settings.DAY_START,
+    "routing_end_time_dep": settings.DAY_END
+}
+data = get_profile_data([destination_stop_I], recompute=recompute, stop_Is=[origin_stop_I], **params)
+print(data["params"])
+profile = data["profiles"][origin_stop_I]
 
 
 # Spawn an analyzer object, and plot the boarding-count-augmented temporal distance profile
@@ -50,6 +50,7 @@ ax.set_ylim((ylim[0], 80))
 ax.legend(loc="upper right")
 
 plt.tight_layout()
+import plot_settings
 from settings import FIGS_DIRECTORY
 fig.savefig(os.path.join(FIGS_DIRECTORY, "pareto_front_schematic.pdf"))
 plt.show()
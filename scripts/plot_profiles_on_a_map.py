@@ -3,10 +3,11 @@ import matplotlib.cm
 import matplotlib.colors
 import matplotlib.pyplot as plt
 import numpy
-import pandas
 
+import plot_settings
 from compute import get_node_profile_statistics, target_list_to_str
-from settings import HELSINKI_NODES_FNAME, DARK_TILES
+from extracts import read_nodes
+from settings import DARK_TILES
 from settings import RESULTS_DIRECTORY
 from util import get_smopy_map
 
@@ -22,7 +23,7 @@ def plot_temporal_distances():
     from settings import AALTO_STOP_ID
 
     targets = [AALTO_STOP_ID]  # [115, 3063]  # kamppi, kilo
-    nodes = pandas.read_csv(HELSINKI_NODES_FNAME)
+    nodes = read_nodes()
     data = get_node_profile_statistics(targets, recompute=True, recompute_profiles=False)
     observable_name_to_data = data
 
@@ -2,6 +2,7 @@ from gtfspy.mapviz import plot_route_network, ROUTE_TYPE_TO_ZORDER
 from gtfspy.gtfs import GTFS
 import matplotlib.pyplot as plt
 import numpy
+import plot_settings
 from settings import FIGS_DIRECTORY
 import settings
 from matplotlib import rc
@@ -34,7 +35,7 @@ ax, smopy_map = plot_route_network(g, ax, spatial_bounds=spatial_bounds, map_alp
 
 stop_lats = []
 stop_lons = []
-stop_Is = map(settings.get_stop_I_by_stop_id, [settings.AALTO_UNIVERSITY_ID, settings.ITAKESKUS_ID, settings.MUNKKIVUORI_ID])
+stop_Is = settings.get_stop_Is_by_stop_ids([settings.AALTO_UNIVERSITY_ID, settings.ITAKESKUS_ID, settings.MUNKKIVUORI_ID])
 chars = "AIM"
 for stop_I in stop_Is:
     stop_info = g.stop(stop_I)
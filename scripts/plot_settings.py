@@ -0,0 +1,9 @@
+"""
+Plotting settings, applied when this module is imported (by the plotting scripts).
+
+Kept apart from settings.py, so that the computations (e.g. compute_all_to_all_stats.py) do not import matplotlib.
+"""
+
+import matplotlib.style
+
+matplotlib.style.use('classic')
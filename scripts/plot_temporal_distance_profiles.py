@@ -1,20 +1,21 @@
 import os
 
 import numpy
-import pandas
 from matplotlib import gridspec
 from matplotlib import pyplot as plt
 from matplotlib import rc
 
-from compute import _compute_profile_data
+import plot_settings
+from compute import get_profile_data
+from extracts import read_nodes
 from gtfspy.routing.label import LabelTimeWithBoardingsCount
 from gtfspy.routing.node_profile_analyzer_time import NodeProfileAnalyzerTime
 from gtfspy.routing.node_profile_analyzer_time_and_veh_legs import NodeProfileAnalyzerTimeAndVehLegs
 from gtfspy.routing.node_profile_multiobjective import NodeProfileMultiObjective
 import settings
 from settings import FIGS_DIRECTORY, RESULTS_DIRECTORY
-from settings import HELSINKI_NODES_FNAME, ANALYSIS_START_TIME_DEP, ANALYSIS_END_TIME_DEP, TIMEZONE
-from util import make_filename_nice, make_string_latex_friendly, get_data_or_compute
+from settings import ANALYSIS_START_TIME_DEP, ANALYSIS_END_TIME_DEP, TIMEZONE
+from util import make_filename_nice, make_string_latex_friendly
 
 """
 Code for plotting the real-world temporal distance profile examples shown in the paper.
@@ -23,23 +24,8 @@ This script is somewhat unnecessarily complicated, and is probably not a good in
 
 rc("text", usetex=True)
 
-target_stop_I = settings.get_stop_I_by_stop_id(settings.AALTO_UNIVERSITY_ID)
-
-params = {
-    "targets": [target_stop_I],
-    "routing_start_time_dep": settings.ROUTING_START_TIME_DEP,
-    "routing_end_time_dep": settings.ROUTING_END_TIME_DEP
-}
-
-fname = os.path.join(RESULTS_DIRECTORY, "example_profiles.pickle")
-profile_data = get_data_or_compute(fname, _compute_profile_data, recompute=False, **params)
-
-# profile_data = get_profile_data([target_stop_I], recompute=True, track_vehicle_legs=True)
-print(profile_data["params"])
-
-nodes = pandas.read_csv(HELSINKI_NODES_FNAME, sep=";")
-
-profiles = profile_data["profiles"]
+target_stop_I, itakeskus_stop_I, munkkivuori_stop_I = settings.get_stop_Is_by_stop_ids(
+    [settings.AALTO_UNIVERSITY_ID, settings.ITAKESKUS_ID, settings.MUNKKIVUORI_ID])
 
 from_stop_Is = [
     # 123,    # Kamppi (as well)
@@ -50,10 +36,23 @@ from_stop_Is = [
     # 3101,   # lahderannanristi
     # 3373,   # Innopoli
     # 2843    # Vallikatu (Pohjois-Leppavaara)
-    settings.get_stop_I_by_stop_id(settings.ITAKESKUS_ID),
-    settings.get_stop_I_by_stop_id(settings.MUNKKIVUORI_ID)
+    itakeskus_stop_I,
+    munkkivuori_stop_I
 ]
 
+params = {
+    "routing_start_time_dep": settings.ROUTING_START_TIME_DEP,
+    "routing_end_time_dep": settings.ROUTING_END_TIME_DEP
+}
+
+profile_data = get_profile_data([target_stop_I], recompute=False, stop_Is=from_stop_Is, **params)
+
+print(profile_data["params"])
+
+nodes = read_nodes()
+
+profiles = profile_data["profiles"]
+
 target_stop_name = "Aalto University"
 # nodes[nodes["stop_I"] == target_stop_I]["name"].values[0]
 
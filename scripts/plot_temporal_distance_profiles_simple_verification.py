@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 
+import plot_settings
 import settings
 
 """
@@ -2,14 +2,15 @@ import os
 
 import matplotlib.colors
 import numpy
-import pandas
 from matplotlib import gridspec
 from matplotlib import pyplot as plt
 from matplotlib import rc
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from gtfspy.routing.node_profile_analyzer_time_and_veh_legs import NodeProfileAnalyzerTimeAndVehLegs
 
+import plot_settings
 from compute import get_node_profile_statistics
+from extracts import read_nodes
 from plot_profiles_on_a_map import _plot_smopy
 from settings import HELSINKI_NODES_FNAME, FIGS_DIRECTORY
 
@@ -24,7 +25,7 @@ colorbar_axes = []
 import settings
 targets = [settings.get_stop_I_by_stop_id(settings.AALTO_UNIVERSITY_ID)]  # [115, 3063]  # kamppi, kilo
 print(HELSINKI_NODES_FNAME)
-nodes_info = pandas.read_csv(HELSINKI_NODES_FNAME, sep=";")
+nodes_info = read_nodes()
 targets_info = nodes_info[nodes_info.stop_I.isin(targets)]
 target_lats = targets_info['lat']
 target_lons = targets_info['lon']
@@ -6,6 +6,8 @@ import requests
 from settings import DATA_DIRECTORY, EXTRA_LOCATIONS, HELSINKI_NODES_FNAME, HELSINKI_TRANSIT_CONNECTIONS_FNAME, HELSINKI_TRANSFERS_FNAME, DAY_START, DAY_END
 from gtfspy.exports import write_nodes, write_temporal_network, write_walk_transfer_edges
 from util import get_data_or_compute
+from extracts import write_extract_sidecar
+from spatial_index import StopSpatialIndex
 from gtfspy.gtfs import GTFS
 from gtfspy import import_gtfs
 
@@ -77,6 +79,25 @@ def create_extracts():
     write_nodes(g, HELSINKI_NODES_FNAME)
     write_temporal_network(g, HELSINKI_TRANSIT_CONNECTIONS_FNAME, DAY_START, DAY_END)
     write_walk_transfer_edges(g, HELSINKI_TRANSFERS_FNAME)
+    # binary (memory-mappable) copies of the extracts for fast loading:
+    write_extract_sidecar(HELSINKI_NODES_FNAME, sep=";")
+    write_extract_sidecar(HELSINKI_TRANSIT_CONNECTIONS_FNAME, sort_by="dep_time_ut")
+    write_extract_sidecar(HELSINKI_TRANSFERS_FNAME)
+
+def check_added_locations_have_nearby_stops(max_walk_distance=1000):
+    """
+    Warn about added locations (extra locations and swimming halls) without any other stop
+    within walking distance in the nodes extract, as those can not be reached by transit.
+    """
+    spatial_index = StopSpatialIndex.from_nodes()
+    locations = [(location['id'], location['lat'], location['lon']) for location in EXTRA_LOCATIONS]
+    locations += [(hall['name_en'], hall['latitude'], hall['longitude']) for hall in get_swimming_hall_data()]
+    # the nearest stop of each location is (usually) the added stop itself:
+    _, distances = spatial_index.nearest([lat for _, lat, _ in locations], [lon for _, _, lon in locations], k=2)
+    for (name, _, _), distance in zip(locations, distances[:, 1]):
+        if distance > max_walk_distance:
+            print("Warning: no stops within " + str(max_walk_distance) + " meters of the added location " + name +
+                  " (the nearest is at " + str(int(distance)) + " meters)")
 
 def clear_extract_stops():
     # DELETE FROM stops WHERE SUBSTR(stop_id, 0, 7) = "SWIMMI"
@@ -91,6 +112,7 @@ if __name__ == "__main__":
     add_extra_locations_to_stops_table()
     run_pedestrian_routing_java(osm_map_path=osm_path)
     create_extracts()
+    check_added_locations_have_nearby_stops()
 
 
 
@@ -0,0 +1,858 @@
+"""
+Batch computation of the NodeProfileAnalyzerTimeAndVehLegs measures for all stops (towards one target).
+
+The final Pareto-optimal labels of all stops are packed into flat arrays (one element per label),
+where the labels of the i'th stop are stored in the slice offsets[i]:offsets[i + 1].
+All measures are computed for all stops at once with numpy, without an analyzer object per stop:
+measures depending only on the labels (numbers of trips and boardings) are reductions over the label arrays,
+while the temporal distance and boarding measures are computed from the profile blocks of all stops,
+which are built (as flat arrays) the same way NodeProfileAnalyzerTime and FastestPathAnalyzer build them.
+The floating point operations are carried out in the same order as in the analyzers, so that the results
+are identical to theirs.
+compute_time_profile_statistics does the same for time-only profiles (NodeProfileSimple).
+"""
+
+import numpy
+
+LABEL_ARRAY_NAMES = ["departure_time", "arrival_time_target", "n_boardings", "first_leg_is_walk"]
+
+# measures computed by compute_label_statistics:
+LABEL_OBSERVABLE_NAMES = [
+    "n_pareto_optimal_trips",
+    "min_n_boardings",
+    "min_trip_n_boardings",
+    "max_trip_n_boardings",
+    "mean_trip_n_boardings",
+    "median_trip_n_boardings"
+]
+
+# measures computed by compute_temporal_distance_statistics:
+TEMPORAL_DISTANCE_OBSERVABLE_NAMES = [
+    "max_trip_duration",
+    "mean_trip_duration",
+    "median_trip_duration",
+    "min_trip_duration",
+    "max_temporal_distance",
+    "mean_temporal_distance",
+    "median_temporal_distance",
+    "min_temporal_distance",
+    "mean_temporal_distance_with_min_n_boardings",
+    "min_temporal_distance_with_min_n_boardings"
+]
+
+# measures computed by compute_fastest_path_statistics:
+FASTEST_PATH_OBSERVABLE_NAMES = [
+    "mean_n_boardings_on_shortest_paths",
+    "min_n_boardings_on_shortest_paths",
+    "max_n_boardings_on_shortest_paths",
+    "median_n_boardings_on_shortest_paths"
+]
+
+# the measures (and their order) of NodeProfileAnalyzerTime.all_measures_and_names_as_lists:
+TIME_OBSERVABLE_NAMES = [
+    "max_trip_duration",
+    "mean_trip_duration",
+    "median_trip_duration",
+    "min_trip_duration",
+    "max_temporal_distance",
+    "mean_temporal_distance",
+    "median_temporal_distance",
+    "min_temporal_distance",
+    "n_pareto_optimal_trips"
+]
+
+# the measures (and their order) of NodeProfileAnalyzerTimeAndVehLegs.all_measures_and_names_as_lists:
+PROFILE_OBSERVABLE_NAMES = TIME_OBSERVABLE_NAMES + [
+    "min_n_boardings",
+    "min_trip_n_boardings",
+    "max_trip_n_boardings",
+    "mean_trip_n_boardings",
+    "median_trip_n_boardings",
+    "mean_n_boardings_on_shortest_paths",
+    "min_n_boardings_on_shortest_paths",
+    "max_n_boardings_on_shortest_paths",
+    "median_n_boardings_on_shortest_paths",
+    "mean_temporal_distance_with_min_n_boardings",
+    "min_temporal_distance_with_min_n_boardings"
+]
+
+
+def pack_profiles(stop_I_to_profile, stop_Is, release_profiles=False):
+    """
+    Pack the final labels of (finalized) node profiles into flat arrays.
+
+    Parameters
+    ----------
+    stop_I_to_profile: dict
+        mapping from stop_I to NodeProfileMultiObjective, stops without a profile have no labels
+    stop_Is: array-like
+    release_profiles: bool, optional
+        if True, each profile is removed from stop_I_to_profile once its labels have been read
+
+    Returns
+    -------
+    name_to_array: dict
+        "stop_Is", "offsets", "walk_to_target_duration" and one array per LABEL_ARRAY_NAMES
+    """
+    stop_Is = numpy.asarray(stop_Is)
+    offsets = numpy.zeros(len(stop_Is) + 1, dtype=numpy.int64)
+    walk_to_target_durations = numpy.full(len(stop_Is), float("inf"))
+    label_lists = []
+    for i, stop_I in enumerate(stop_Is.tolist()):
+        if release_profiles:
+            profile = stop_I_to_profile.pop(stop_I, None)
+        else:
+            profile = stop_I_to_profile.get(stop_I)
+        labels = []
+        if profile is not None:
+            labels = profile.get_final_optimal_labels()
+            walk_to_target_durations[i] = profile.get_walk_to_target_duration()
+        label_lists.append(labels)
+        offsets[i + 1] = offsets[i] + len(labels)
+    labels = [label for label_list in label_lists for label in label_list]
+    return {
+        "stop_Is": stop_Is,
+        "offsets": offsets,
+        "walk_to_target_duration": walk_to_target_durations,
+        "departure_time": numpy.array([label.departure_time for label in labels], dtype=float),
+        "arrival_time_target": numpy.array([label.arrival_time_target for label in labels], dtype=float),
+        "n_boardings": numpy.array([label.n_boardings for label in labels], dtype=numpy.int64),
+        "first_leg_is_walk": numpy.array([label.first_leg_is_walk for label in labels], dtype=bool)
+    }
+
+
+def _get_segment_ids(offsets):
+    return numpy.repeat(numpy.arange(len(offsets) - 1), numpy.diff(offsets))
+
+
+def _get_offsets(segment_ids, n_segments):
+    """
+    Offsets of the segments of (sorted) segment_ids, as in pack_profiles.
+    """
+    offsets = numpy.zeros(n_segments + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(segment_ids, minlength=n_segments), out=offsets[1:])
+    return offsets
+
+
+def _segment_min(values, segment_ids, n_segments, empty_value):
+    result = numpy.full(n_segments, float("inf"))
+    numpy.minimum.at(result, segment_ids, values)
+    result[numpy.bincount(segment_ids, minlength=n_segments) == 0] = empty_value
+    return result
+
+
+def _segment_max(values, segment_ids, n_segments, empty_value):
+    result = numpy.full(n_segments, -float("inf"))
+    numpy.maximum.at(result, segment_ids, values)
+    result[numpy.bincount(segment_ids, minlength=n_segments) == 0] = empty_value
+    return result
+
+
+def _segment_median(values, segment_ids, n_segments):
+    """
+    Median of values within each segment (nan for empty segments).
+    """
+    order = numpy.lexsort((values, segment_ids))
+    sorted_values = values[order].astype(float)
+    counts = numpy.bincount(segment_ids, minlength=n_segments)
+    starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+    result = numpy.full(n_segments, float("nan"))
+    non_empty = counts > 0
+    lower = starts[non_empty] + (counts[non_empty] - 1) // 2
+    upper = starts[non_empty] + counts[non_empty] // 2
+    result[non_empty] = (sorted_values[lower] + sorted_values[upper]) / 2.0
+    return result
+
+
+def _segment_mean(values, segment_ids, n_segments, empty_value):
+    """
+    numpy.mean of the values within each segment (values sorted by segment).
+
+    The segments are averaged in groups of equal length, so that numpy sums the values of each segment
+    in the same (pairwise) order as numpy.mean of the segment alone.
+    """
+    offsets = _get_offsets(segment_ids, n_segments)
+    counts = numpy.diff(offsets)
+    result = numpy.full(n_segments, empty_value, dtype=float)
+    for count in numpy.unique(counts[counts > 0]):
+        segments = numpy.nonzero(counts == count)[0]
+        rows = values[offsets[segments][:, None] + numpy.arange(count)[None, :]]
+        result[segments] = numpy.mean(rows, axis=1)
+    return result
+
+
+def _segment_cumsum(values, offsets):
+    """
+    numpy.cumsum of the values within each segment (values sorted by segment).
+
+    The segments are padded into rows (of similar lengths), so that the values are summed sequentially
+    as by numpy.cumsum of the segment alone.
+    """
+    counts = numpy.diff(offsets)
+    result = numpy.zeros(len(values))
+    row_classes = numpy.ceil(numpy.log2(numpy.maximum(counts, 1)))
+    for row_class in numpy.unique(row_classes[counts > 0]):
+        segments = numpy.nonzero((row_classes == row_class) & (counts > 0))[0]
+        columns = numpy.arange(counts[segments].max())
+        is_value = columns[None, :] < counts[segments][:, None]
+        positions = (offsets[segments][:, None] + columns[None, :])[is_value]
+        rows = numpy.zeros(is_value.shape)
+        rows[is_value] = values[positions]
+        result[positions] = numpy.cumsum(rows, axis=1)[is_value]
+    return result
+
+
+def _segment_searchsorted(sorted_values, offsets, query_values, query_segment_ids):
+    """
+    numpy.searchsorted(side="left") of each query within the sorted values of its segment.
+
+    Returns
+    -------
+    indices: numpy.ndarray
+        index of each query within its segment
+    """
+    n_queries = len(query_values)
+    all_segment_ids = numpy.concatenate([query_segment_ids, _get_segment_ids(offsets)])
+    all_values = numpy.concatenate([query_values, sorted_values])
+    is_value = numpy.concatenate([numpy.zeros(n_queries, dtype=bool), numpy.ones(len(sorted_values), dtype=bool)])
+    # (a query is placed before the values equal to it)
+    order = numpy.lexsort((is_value, all_values, all_segment_ids))
+    n_values_before = numpy.cumsum(is_value[order]) - is_value[order]
+    indices = numpy.zeros(n_queries, dtype=numpy.int64)
+    is_query = ~is_value[order]
+    indices[order[is_query]] = n_values_before[is_query]
+    return indices - offsets[query_segment_ids]
+
+
+def _is_running_minimum(values, segment_ids, n_segments):
+    """
+    Whether each value is smaller than all the preceding values of its segment (values sorted by segment),
+    i.e. which labels are kept when labels are added to a Pareto front in this order.
+    """
+    result = numpy.ones(len(values), dtype=bool)
+    if len(values) == 0:
+        return result
+    ranks = numpy.unique(values, return_inverse=True)[1].reshape(-1).astype(numpy.int64)
+    # the keys of each segment are smaller than those of the preceding segments, which thus do not affect the minima
+    keys = (n_segments - segment_ids.astype(numpy.int64)) * (ranks.max() + 1) + ranks
+    running_minima = numpy.minimum.accumulate(keys)
+    same_segment = segment_ids[1:] == segment_ids[:-1]
+    result[1:][same_segment] = keys[1:][same_segment] < running_minima[:-1][same_segment]
+    return result
+
+
+def _get_segment_positions(segment_ids, n_segments):
+    """
+    Position of each element within its segment (segment_ids sorted).
+    """
+    return numpy.arange(len(segment_ids)) - _get_offsets(segment_ids, n_segments)[segment_ids]
+
+
+def _sort_blocks(block_parts):
+    """
+    Concatenate blocks given as (segment_ids, positions, start_times, end_times, distances_start, distances_end)
+    parts and sort them by segment and by position within the segment.
+    """
+    segment_ids, positions, start_times, end_times, distances_start, distances_end = \
+        [numpy.concatenate(arrays) for arrays in zip(*block_parts)]
+    order = numpy.lexsort((positions, segment_ids))
+    blocks = segment_ids[order], start_times[order], end_times[order], distances_start[order], distances_end[order]
+    # (as asserted by ProfileBlock)
+    assert numpy.all(blocks[1] < blocks[2])
+    return blocks
+
+
+def _compute_block_statistics(segment_ids, start_times, end_times, distances_start, distances_end, n_segments):
+    """
+    Mean, min, max and median of the profile blocks of each segment, as ProfileBlockAnalyzer computes them.
+
+    Parameters
+    ----------
+    segment_ids, start_times, end_times, distances_start, distances_end: numpy.ndarray
+        the profile blocks (as returned by _sort_blocks), each segment must have at least one block
+
+    Returns
+    -------
+    statistic_to_data: dict
+        "mean", "min", "max", "median" and "area" (the sum of block areas), each with one value per segment
+    """
+    widths = end_times - start_times
+    areas = widths * (0.5 * (distances_start + distances_end))
+    block_offsets = _get_offsets(segment_ids, n_segments)
+    first_start_times = start_times[block_offsets[:-1]]
+    last_end_times = end_times[block_offsets[1:] - 1]
+    total_areas = numpy.bincount(segment_ids, weights=areas, minlength=n_segments)
+    return {
+        "area": total_areas,
+        "mean": total_areas / (last_end_times - first_start_times),
+        "min": _segment_min(numpy.minimum(distances_end, distances_start), segment_ids, n_segments, float("inf")),
+        "max": _segment_max(numpy.maximum(distances_end, distances_start), segment_ids, n_segments, -float("inf")),
+        "median": _compute_block_medians(segment_ids, widths, distances_start, distances_end, n_segments,
+                                         last_end_times - first_start_times)
+    }
+
+
+def _compute_block_medians(segment_ids, widths, distances_start, distances_end, n_segments, total_widths):
+    """
+    ProfileBlockAnalyzer.median of the profile blocks of each segment, see _compute_block_statistics.
+    """
+    inf = float("inf")
+    medians = numpy.full(n_segments, inf)
+
+    # the ordered distance split points of each segment:
+    has_finite_start = distances_start != inf
+    point_segment_ids = numpy.concatenate([segment_ids[has_finite_start], segment_ids[has_finite_start]])
+    point_values = numpy.concatenate([distances_end[has_finite_start], distances_start[has_finite_start]])
+    order = numpy.lexsort((point_values, point_segment_ids))
+    point_segment_ids, point_values = point_segment_ids[order], point_values[order]
+    is_new = numpy.ones(len(point_values), dtype=bool)
+    is_new[1:] = (point_segment_ids[1:] != point_segment_ids[:-1]) | (point_values[1:] != point_values[:-1])
+    point_segment_ids, point_values = point_segment_ids[is_new], point_values[is_new]
+    point_offsets = _get_offsets(point_segment_ids, n_segments)
+    n_points = numpy.diff(point_offsets)
+
+    # the numbers of sloped blocks covering each interval between consecutive split points:
+    n_intervals = numpy.maximum(n_points - 1, 0)
+    interval_offsets = numpy.concatenate([[0], numpy.cumsum(n_intervals)])
+    is_sloped = distances_start != distances_end
+    sloped_segment_ids = segment_ids[is_sloped]
+    first_intervals = numpy.minimum(_segment_searchsorted(point_values, point_offsets, distances_end[is_sloped],
+                                                          sloped_segment_ids), n_intervals[sloped_segment_ids])
+    last_intervals = numpy.minimum(_segment_searchsorted(point_values, point_offsets, distances_start[is_sloped],
+                                                         sloped_segment_ids), n_intervals[sloped_segment_ids])
+    covers = first_intervals < last_intervals
+    count_changes = numpy.zeros(interval_offsets[-1] + 1, dtype=numpy.int64)
+    numpy.add.at(count_changes, interval_offsets[sloped_segment_ids[covers]] + first_intervals[covers], 1)
+    numpy.add.at(count_changes, interval_offsets[sloped_segment_ids[covers]] + last_intervals[covers], -1)
+    trip_counts = numpy.cumsum(count_changes)[:-1].astype(float)
+    is_interval = numpy.zeros(len(point_values), dtype=bool)
+    is_interval[:-1] = point_segment_ids[1:] == point_segment_ids[:-1]
+    interval_widths = point_values[1:][is_interval[:-1]] - point_values[:-1][is_interval[:-1]]
+    point_cdf = numpy.zeros(len(point_values))
+    point_cdf[1:][is_interval[:-1]] = _segment_cumsum(interval_widths * trip_counts, interval_offsets)
+
+    # the delta peaks (flat blocks) of each segment, in the order of their first appearance:
+    flat_Is = numpy.nonzero(~is_sloped)[0]
+    order = numpy.lexsort((flat_Is, distances_end[flat_Is], segment_ids[flat_Is]))
+    is_new = numpy.ones(len(flat_Is), dtype=bool)
+    is_new[1:] = (segment_ids[flat_Is][order][1:] != segment_ids[flat_Is][order][:-1]) | \
+                 (distances_end[flat_Is][order][1:] != distances_end[flat_Is][order][:-1])
+    peak_ids = numpy.zeros(len(flat_Is), dtype=numpy.int64)
+    peak_ids[order] = numpy.cumsum(is_new) - 1
+    peak_masses = numpy.bincount(peak_ids, weights=widths[flat_Is], minlength=is_new.sum())
+    peak_first_Is = flat_Is[order][is_new]
+    peak_order = numpy.argsort(peak_first_Is, kind="stable")
+    peak_masses = peak_masses[peak_order]
+    peak_segment_ids = segment_ids[peak_first_Is][peak_order]
+    peak_values = distances_end[peak_first_Is][peak_order]
+
+    # the cdf without the delta peaks must cover the rest of the time (otherwise the median is inf):
+    total_peak_masses = numpy.bincount(peak_segment_ids, weights=peak_masses, minlength=n_segments)
+    last_point_cdf = numpy.zeros(n_segments)
+    has_points = n_points > 0
+    last_point_cdf[has_points] = point_cdf[point_offsets[1:][has_points] - 1]
+    with numpy.errstate(invalid="ignore"):
+        is_valid = numpy.isclose(last_point_cdf, total_widths - total_peak_masses, atol=1E-4) & has_points
+
+    # each finite delta peak is inserted as a duplicate split point, the cdf values after it include its mass
+    # (the mass of the infinite delta peak is only included in the normalization):
+    is_finite_peak = peak_values != inf
+    infinite_peak_masses = numpy.zeros(n_segments)
+    infinite_peak_masses[peak_segment_ids[~is_finite_peak]] = peak_masses[~is_finite_peak]
+    peak_segment_ids, peak_values, peak_masses = \
+        peak_segment_ids[is_finite_peak], peak_values[is_finite_peak], peak_masses[is_finite_peak]
+    peak_point_Is = point_offsets[peak_segment_ids] + \
+        _segment_searchsorted(point_values, point_offsets, peak_values, peak_segment_ids)
+    entry_point_Is = numpy.concatenate([numpy.arange(len(point_values)), peak_point_Is])
+    entry_is_duplicate = numpy.concatenate([numpy.zeros(len(point_values), dtype=bool),
+                                            numpy.ones(len(peak_point_Is), dtype=bool)])
+    order = numpy.lexsort((~entry_is_duplicate, entry_point_Is))
+    entry_point_Is, entry_is_duplicate = entry_point_Is[order], entry_is_duplicate[order]
+    entry_segment_ids = point_segment_ids[entry_point_Is]
+    entry_values = point_values[entry_point_Is]
+    entry_cdf = point_cdf[entry_point_Is]
+    peak_ranks = _get_segment_positions(peak_segment_ids, n_segments)
+    for rank in range(peak_ranks.max() + 1 if len(peak_ranks) else 0):
+        segment_peak_values = numpy.full(n_segments, float("nan"))
+        segment_peak_masses = numpy.zeros(n_segments)
+        segment_peak_values[peak_segment_ids[peak_ranks == rank]] = peak_values[peak_ranks == rank]
+        segment_peak_masses[peak_segment_ids[peak_ranks == rank]] = peak_masses[peak_ranks == rank]
+        entry_peak_values = segment_peak_values[entry_segment_ids]
+        is_after_peak = (entry_peak_values < entry_values) | ((entry_peak_values == entry_values) & ~entry_is_duplicate)
+        entry_cdf = entry_cdf + numpy.where(is_after_peak, segment_peak_masses[entry_segment_ids], 0.0)
+
+    entry_offsets = _get_offsets(entry_segment_ids, n_segments)
+    n_entries = numpy.diff(entry_offsets)
+    last_entry_cdf = numpy.ones(n_segments)
+    last_entry_cdf[n_entries > 0] = entry_cdf[entry_offsets[1:][n_entries > 0] - 1]
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        norm_cdf = entry_cdf / (last_entry_cdf + infinite_peak_masses)[entry_segment_ids]
+    lefts = numpy.bincount(entry_segment_ids, weights=norm_cdf < 0.5, minlength=n_segments).astype(numpy.int64)
+    rights = numpy.bincount(entry_segment_ids, weights=norm_cdf <= 0.5, minlength=n_segments).astype(numpy.int64)
+    is_valid &= lefts < n_entries
+
+    is_exact = is_valid & (lefts != rights)
+    medians[is_exact] = entry_values[entry_offsets[:-1][is_exact] + lefts[is_exact]]
+    is_interpolated = is_valid & (lefts == rights)
+    upper_Is = entry_offsets[:-1][is_interpolated] + rights[is_interpolated]
+    # (a negative index refers to the last entry, as in ProfileBlockAnalyzer.median)
+    lower_Is = entry_offsets[:-1][is_interpolated] + (rights[is_interpolated] - 1) % n_entries[is_interpolated]
+    delta_y = norm_cdf[upper_Is] - norm_cdf[lower_Is]
+    assert numpy.all(delta_y > 0)
+    delta_x = entry_values[upper_Is] - entry_values[lower_Is]
+    medians[is_interpolated] = (0.5 - norm_cdf[lower_Is]) / delta_y * delta_x + entry_values[lower_Is]
+    return medians
+
+
+def _compute_time_profile_measures(segment_ids, departure_times, arrival_times, walk_to_target_durations,
+                                   n_segments, start_time_dep, end_time_dep):
+    """
+    The NodeProfileAnalyzerTime measures of the (Pareto-optimal) time profile labels of each segment.
+
+    Parameters
+    ----------
+    segment_ids, departure_times, arrival_times: numpy.ndarray
+        the labels of each segment (as in NodeProfileSimple), sorted by segment
+    walk_to_target_durations: numpy.ndarray
+        one value per segment
+    n_segments: int
+    start_time_dep: int
+    end_time_dep: int
+
+    Returns
+    -------
+    observable_name_to_data: dict
+        mapping from each of TIME_OBSERVABLE_NAMES to a numpy array (one value per segment)
+    """
+    inf = float("inf")
+    walks = walk_to_target_durations
+    label_Is = numpy.arange(len(departure_times))
+
+    # the label departing next after the time frame:
+    is_after = departure_times >= end_time_dep
+    after_order = numpy.lexsort((label_Is[is_after], arrival_times[is_after], segment_ids[is_after]))
+    after_Is = label_Is[is_after][after_order]
+    is_first = numpy.ones(len(after_Is), dtype=bool)
+    is_first[1:] = segment_ids[after_Is][1:] != segment_ids[after_Is][:-1]
+    after_Is = after_Is[is_first]
+    arrival_times_at_end = end_time_dep + walks
+    is_earlier_arrival = (departure_times[after_Is] > end_time_dep) & \
+                         (arrival_times[after_Is] < arrival_times_at_end[segment_ids[after_Is]])
+    arrival_times_at_end[segment_ids[after_Is][is_earlier_arrival]] = arrival_times[after_Is][is_earlier_arrival]
+
+    # the trips, ordered by departure time:
+    is_trip = (start_time_dep < departure_times) & (departure_times < end_time_dep)
+    is_trip[after_Is[departure_times[after_Is] == end_time_dep]] = True
+    trip_Is = label_Is[is_trip][numpy.lexsort((departure_times[is_trip], segment_ids[is_trip]))]
+    trip_segment_ids = segment_ids[trip_Is]
+    trip_departure_times = departure_times[trip_Is]
+    trip_durations = arrival_times[trip_Is] - trip_departure_times
+    trip_walks = walks[trip_segment_ids]
+    assert numpy.all(trip_walks > trip_durations)
+    trip_positions = _get_segment_positions(trip_segment_ids, n_segments)
+    previous_departure_times = numpy.full(len(trip_Is), float(start_time_dep))
+    previous_departure_times[1:] = trip_departure_times[:-1]
+    previous_departure_times[trip_positions == 0] = start_time_dep
+    walk_end_times = trip_departure_times - (trip_walks - trip_durations)
+    effective_times = numpy.where(walk_end_times > previous_departure_times, walk_end_times, previous_departure_times)
+    has_walk = effective_times > previous_departure_times
+    block_parts = [
+        (trip_segment_ids[has_walk], 2 * trip_positions[has_walk], previous_departure_times[has_walk],
+         effective_times[has_walk], trip_walks[has_walk], trip_walks[has_walk]),
+        (trip_segment_ids, 2 * trip_positions + 1, effective_times, trip_departure_times,
+         trip_durations + (trip_departure_times - effective_times), trip_durations)
+    ]
+
+    # the end of the time frame, after the last trip:
+    trip_offsets = _get_offsets(trip_segment_ids, n_segments)
+    n_trips = numpy.diff(trip_offsets)
+    last_departure_times = numpy.full(n_segments, float(start_time_dep))
+    last_departure_times[n_trips > 0] = trip_departure_times[trip_offsets[1:][n_trips > 0] - 1]
+    has_end = last_departure_times < end_time_dep
+    with numpy.errstate(invalid="ignore"):
+        waiting_times = end_time_dep - last_departure_times
+        distances_end = arrival_times_at_end - end_time_dep
+        walk_waiting_times = waiting_times - (walks - distances_end)
+        walk_waiting_times = numpy.where(walk_waiting_times < waiting_times, walk_waiting_times, waiting_times)
+        walk_waiting_times = numpy.where(walk_waiting_times > 0, walk_waiting_times, 0.0)
+    trip_waiting_times = waiting_times - walk_waiting_times
+    has_walk = has_end & (walk_waiting_times > 0)
+    end_segment_ids = numpy.arange(n_segments)
+    block_parts.append((end_segment_ids[has_walk], 2 * n_trips[has_walk], last_departure_times[has_walk],
+                        last_departure_times[has_walk] + walk_waiting_times[has_walk], walks[has_walk],
+                        walks[has_walk]))
+    trip_start_times = last_departure_times + walk_waiting_times
+    trip_end_times = trip_start_times + trip_waiting_times
+    trip_distances_start = distances_end + trip_waiting_times
+    has_trip = has_end & (trip_waiting_times > 0)
+    is_block = (trip_start_times < trip_end_times) & (distances_end <= trip_distances_start)
+    # (a trip block is left out only due to a very small waiting time)
+    assert numpy.all(trip_waiting_times[has_trip & ~is_block] < 10 ** -5)
+    has_trip &= is_block
+    block_parts.append((end_segment_ids[has_trip], 2 * n_trips[has_trip] + 1, trip_start_times[has_trip],
+                        trip_end_times[has_trip], trip_distances_start[has_trip], distances_end[has_trip]))
+
+    blocks = _sort_blocks(block_parts)
+    block_statistics = _compute_block_statistics(*blocks, n_segments=n_segments)
+    return {
+        "max_trip_duration": _segment_max(trip_durations, trip_segment_ids, n_segments, inf),
+        "mean_trip_duration": _segment_mean(trip_durations, trip_segment_ids, n_segments, inf),
+        "median_trip_duration": numpy.where(n_trips > 0, _segment_median(trip_durations, trip_segment_ids,
+                                                                          n_segments), inf),
+        "min_trip_duration": _segment_min(trip_durations, trip_segment_ids, n_segments, inf),
+        "max_temporal_distance": block_statistics["max"],
+        "mean_temporal_distance": block_statistics["area"] / (end_time_dep - start_time_dep),
+        "median_temporal_distance": block_statistics["median"],
+        "min_temporal_distance": block_statistics["min"],
+        "n_pareto_optimal_trips": n_trips.astype(float)
+    }
+
+
+def _compute_time_profile_measures_with_max_n_boardings(packed, max_n_boardings, start_time_dep, end_time_dep):
+    """
+    The NodeProfileAnalyzerTime measures of NodeProfileAnalyzerTimeAndVehLegs.get_time_profile_analyzer,
+    with a limit on the number of boardings for each stop (max_n_boardings).
+    """
+    n_stops = len(packed["stop_Is"])
+    segment_ids = _get_segment_ids(packed["offsets"])
+    departure_times = packed["departure_time"]
+    arrival_times = packed["arrival_time_target"]
+    walks = packed["walk_to_target_duration"]
+    segment_max_n_boardings = max_n_boardings[segment_ids]
+    is_candidate = (segment_max_n_boardings != 0) & (start_time_dep <= departure_times) & \
+                   (packed["n_boardings"] <= segment_max_n_boardings)
+    # the Pareto-optimal candidates (added in the order of decreasing departure time):
+    candidate_Is = numpy.nonzero(is_candidate)[0]
+    candidate_Is = candidate_Is[numpy.lexsort((arrival_times[candidate_Is], -departure_times[candidate_Is],
+                                               segment_ids[candidate_Is]))]
+    valid_Is = candidate_Is[_is_running_minimum(arrival_times[candidate_Is], segment_ids[candidate_Is], n_stops)]
+    # the labels dominated by walking are not added to the NodeProfileSimple:
+    is_walk_dominated = departure_times[valid_Is] + walks[segment_ids[valid_Is]] <= arrival_times[valid_Is]
+    valid_Is = valid_Is[~is_walk_dominated]
+    return _compute_time_profile_measures(segment_ids[valid_Is], departure_times[valid_Is], arrival_times[valid_Is],
+                                          walks, n_stops, start_time_dep, end_time_dep)
+
+
+def compute_temporal_distance_statistics(packed, start_time_dep, end_time_dep, label_statistics=None):
+    """
+    Compute the TEMPORAL_DISTANCE_OBSERVABLE_NAMES measures for all stops at once.
+
+    Parameters
+    ----------
+    packed: dict
+        as returned by pack_profiles
+    start_time_dep: int
+    end_time_dep: int
+    label_statistics: dict, optional
+        as returned by compute_label_statistics (for the same time frame)
+
+    Returns
+    -------
+    observable_name_to_data: dict
+        mapping from observable name to a numpy array (one value per stop)
+    """
+    if label_statistics is None:
+        label_statistics = compute_label_statistics(packed, start_time_dep, end_time_dep)
+    # (as in NodeProfileAnalyzerTimeAndVehLegs, temporal distances are inf for stops without journeys)
+    has_labels_in_frame = label_statistics["n_pareto_optimal_trips"] > 0
+    time_measures = _compute_time_profile_measures_with_max_n_boardings(
+        packed, label_statistics["max_trip_n_boardings"], start_time_dep, end_time_dep)
+    min_n_boardings_time_measures = _compute_time_profile_measures_with_max_n_boardings(
+        packed, label_statistics["min_n_boardings"], start_time_dep, end_time_dep)
+    observable_name_to_data = {
+        "mean_temporal_distance_with_min_n_boardings": min_n_boardings_time_measures["mean_temporal_distance"],
+        "min_temporal_distance_with_min_n_boardings": min_n_boardings_time_measures["min_temporal_distance"]
+    }
+    for observable_name in TEMPORAL_DISTANCE_OBSERVABLE_NAMES:
+        if observable_name not in observable_name_to_data:
+            observable_name_to_data[observable_name] = numpy.where(has_labels_in_frame,
+                                                                   time_measures[observable_name], float("inf"))
+    return observable_name_to_data
+
+
+def compute_fastest_path_statistics(packed, start_time_dep, end_time_dep):
+    """
+    Compute the FASTEST_PATH_OBSERVABLE_NAMES measures (numbers of boardings on the fastest paths, as computed by
+    FastestPathAnalyzer.get_prop_analyzer_flat) for all stops at once.
+
+    Parameters
+    ----------
+    packed: dict
+        as returned by pack_profiles
+    start_time_dep: int
+    end_time_dep: int
+
+    Returns
+    -------
+    observable_name_to_data: dict
+        mapping from observable name to a numpy array (one value per stop)
+    """
+    inf = float("inf")
+    n_stops = len(packed["stop_Is"])
+    segment_ids = _get_segment_ids(packed["offsets"])
+    departure_times = packed["departure_time"]
+    arrival_times = packed["arrival_time_target"]
+    n_boardings = packed["n_boardings"]
+    walks = packed["walk_to_target_duration"]
+    label_Is = numpy.arange(len(departure_times))
+
+    # the labels departing within the time frame, and the next one after it when needed:
+    is_relevant = (start_time_dep < departure_times) & (departure_times <= end_time_dep)
+    last_relevant_Is = numpy.full(n_stops, -1)
+    numpy.maximum.at(last_relevant_Is, segment_ids[is_relevant], label_Is[is_relevant])
+    has_relevant = last_relevant_Is >= 0
+    needs_after_label = ~has_relevant
+    needs_after_label[has_relevant] = departure_times[last_relevant_Is[has_relevant]] < end_time_dep
+    is_after = departure_times > end_time_dep
+    after_Is = label_Is[is_after][numpy.lexsort((label_Is[is_after], n_boardings[is_after],
+                                                 arrival_times[is_after], segment_ids[is_after]))]
+    is_first = numpy.ones(len(after_Is), dtype=bool)
+    is_first[1:] = segment_ids[after_Is][1:] != segment_ids[after_Is][:-1]
+    after_Is = after_Is[is_first]
+    after_Is = after_Is[needs_after_label[segment_ids[after_Is]]]
+
+    # the fastest paths (Pareto-optimal in departure and arrival times), ordered by departure time:
+    fp_Is = numpy.concatenate([label_Is[is_relevant], after_Is])
+    fp_Is = fp_Is[numpy.lexsort((n_boardings[fp_Is], arrival_times[fp_Is], -departure_times[fp_Is],
+                                 segment_ids[fp_Is]))]
+    fp_Is = fp_Is[_is_running_minimum(arrival_times[fp_Is], segment_ids[fp_Is], n_stops)]
+    fp_Is = fp_Is[numpy.lexsort((departure_times[fp_Is], segment_ids[fp_Is]))]
+    fp_segment_ids = segment_ids[fp_Is]
+    fp_departure_times = departure_times[fp_Is]
+    fp_durations = arrival_times[fp_Is] - fp_departure_times
+    fp_walks = walks[fp_segment_ids]
+    fp_n_boardings = n_boardings[fp_Is].astype(float)
+    fp_positions = _get_segment_positions(fp_segment_ids, n_stops)
+    end_times = numpy.where(end_time_dep < fp_departure_times, float(end_time_dep), fp_departure_times)
+    previous_end_times = numpy.full(len(fp_Is), float(start_time_dep))
+    previous_end_times[1:] = end_times[:-1]
+    previous_end_times[fp_positions == 0] = start_time_dep
+    is_used = previous_end_times < end_time_dep
+    temporal_distances_start = fp_durations + (fp_departure_times - previous_end_times)
+    is_walk_faster = is_used & (temporal_distances_start > fp_walks)
+    split_times = fp_departure_times - (fp_walks - fp_durations)
+    split_times = numpy.where(end_times < split_times, end_times, split_times)
+    has_walk = is_walk_faster & (previous_end_times < split_times)
+    has_trip = is_walk_faster & (split_times < end_times)
+    is_journey = is_used & ~is_walk_faster
+    block_parts = [
+        (fp_segment_ids[has_walk], 3 * fp_positions[has_walk], previous_end_times[has_walk], split_times[has_walk],
+         fp_walks[has_walk], fp_walks[has_walk], fp_n_boardings[has_walk]),
+        (fp_segment_ids[has_trip], 3 * fp_positions[has_trip] + 1, split_times[has_trip], end_times[has_trip],
+         fp_durations[has_trip] + (end_times[has_trip] - split_times[has_trip]), fp_durations[has_trip],
+         fp_n_boardings[has_trip]),
+        (fp_segment_ids[is_journey], 3 * fp_positions[is_journey] + 2, previous_end_times[is_journey],
+         end_times[is_journey], temporal_distances_start[is_journey],
+         temporal_distances_start[is_journey] - (end_times[is_journey] - previous_end_times[is_journey]),
+         fp_n_boardings[is_journey])
+    ]
+
+    # walking (or waiting without a next journey) until the end of the time frame:
+    fp_offsets = _get_offsets(fp_segment_ids[is_used], n_stops)
+    n_used = numpy.diff(fp_offsets)
+    last_end_times = numpy.full(n_stops, float(start_time_dep))
+    last_end_times[n_used > 0] = end_times[is_used][fp_offsets[1:][n_used > 0] - 1]
+    has_end = last_end_times < end_time_dep
+    block_parts.append((numpy.arange(n_stops)[has_end], 3 * n_used[has_end], last_end_times[has_end],
+                        numpy.full(has_end.sum(), float(end_time_dep)), walks[has_end], walks[has_end],
+                        numpy.full(has_end.sum(), inf)))
+
+    block_segment_ids, block_positions, block_start_times, block_end_times, block_distances_start, \
+        block_distances_end, block_n_boardings = [numpy.concatenate(arrays) for arrays in zip(*block_parts)]
+    # the number of boardings of each block (flat blocks are walking, or waiting without a next journey):
+    is_walk = (block_distances_end == walks[block_segment_ids]) & (block_distances_end != inf)
+    values = numpy.where(block_distances_start == block_distances_end, numpy.where(is_walk, 0.0, inf),
+                         block_n_boardings)
+    blocks = _sort_blocks([(block_segment_ids, block_positions, block_start_times, block_end_times, values, values)])
+    block_statistics = _compute_block_statistics(*blocks, n_segments=n_stops)
+    return {
+        "mean_n_boardings_on_shortest_paths": block_statistics["mean"],
+        "min_n_boardings_on_shortest_paths": block_statistics["min"],
+        "max_n_boardings_on_shortest_paths": block_statistics["max"],
+        "median_n_boardings_on_shortest_paths": block_statistics["median"]
+    }
+
+
+def compute_label_statistics(packed, start_time_dep, end_time_dep):
+    """
+    Compute the LABEL_OBSERVABLE_NAMES measures for all stops at once.
+
+    Parameters
+    ----------
+    packed: dict
+        as returned by pack_profiles
+    start_time_dep: int
+    end_time_dep: int
+
+    Returns
+    -------
+    observable_name_to_data: dict
+        mapping from observable name to a numpy array (one value per stop)
+    """
+    n_stops = len(packed["stop_Is"])
+    segment_ids = _get_segment_ids(packed["offsets"])
+    departure_times = packed["departure_time"]
+    n_boardings = packed["n_boardings"]
+    walk_is_finite = packed["walk_to_target_duration"] < float("inf")
+
+    # labels departing within the time frame:
+    in_frame = (start_time_dep <= departure_times) & (departure_times <= end_time_dep)
+    in_frame_ids = segment_ids[in_frame]
+    in_frame_n_boardings = n_boardings[in_frame]
+    n_in_frame = numpy.bincount(in_frame_ids, minlength=n_stops)
+    has_labels_in_frame = n_in_frame > 0
+    # (as in NodeProfileAnalyzerTimeAndVehLegs, boarding statistics are nan for stops without journeys)
+    no_labels_value = float("nan")
+
+    min_trip_n_boardings = _segment_min(in_frame_n_boardings, in_frame_ids, n_stops, no_labels_value)
+    max_trip_n_boardings = _segment_max(in_frame_n_boardings, in_frame_ids, n_stops, no_labels_value)
+    sum_n_boardings = numpy.bincount(in_frame_ids, weights=in_frame_n_boardings, minlength=n_stops)
+    mean_trip_n_boardings = numpy.full(n_stops, no_labels_value)
+    mean_trip_n_boardings[has_labels_in_frame] = sum_n_boardings[has_labels_in_frame] / n_in_frame[has_labels_in_frame]
+    median_trip_n_boardings = _segment_median(in_frame_n_boardings, in_frame_ids, n_stops)
+    median_trip_n_boardings[~has_labels_in_frame] = no_labels_value
+
+    # labels departing within the time frame, or after it:
+    not_before = start_time_dep <= departure_times
+    min_n_boardings = _segment_min(n_boardings[not_before], segment_ids[not_before], n_stops, float("inf"))
+    min_n_boardings[walk_is_finite] = 0
+
+    return {
+        "n_pareto_optimal_trips": n_in_frame.astype(float),
+        "min_n_boardings": min_n_boardings,
+        "min_trip_n_boardings": min_trip_n_boardings,
+        "max_trip_n_boardings": max_trip_n_boardings,
+        "mean_trip_n_boardings": mean_trip_n_boardings,
+        "median_trip_n_boardings": median_trip_n_boardings
+    }
+
+
+def _assert_results_are_positive_or_infs_or_nans(array):
+    """
+    Parameters
+    ----------
+    array: numpy.ndarray
+
+    Raises
+    ------
+    AssertionError
+        if some of the results are not positive or infs or nans
+    """
+    is_nan = numpy.isnan(array)
+    is_inf = numpy.isinf(array)
+    is_not_negative = (array >= 0)
+    assert (is_nan | is_inf | is_not_negative).all()
+
+
+def get_analysis_windows(start_time_dep, end_time_dep, window_duration=3600):
+    """
+    Split [start_time_dep, end_time_dep] into consecutive analysis windows (e.g. each hour of the day).
+
+    Returns
+    -------
+    windows: list[tuple]
+        (window_start_time_dep, window_end_time_dep) pairs
+    """
+    window_starts = range(int(start_time_dep), int(end_time_dep), int(window_duration))
+    return [(window_start, min(window_start + window_duration, end_time_dep)) for window_start in window_starts]
+
+
+def compute_profile_statistics(stop_I_to_profile, stop_Is, start_time_dep, end_time_dep, release_profiles=False):
+    """
+    Compute all measures of NodeProfileAnalyzerTimeAndVehLegs.all_measures_and_names_as_lists for all stops.
+
+    Parameters
+    ----------
+    stop_I_to_profile: dict
+        mapping from stop_I to a (finalized) NodeProfileMultiObjective
+    stop_Is: array-like
+        stops for which the measures are computed (stops without a profile are not reachable)
+    start_time_dep: int
+    end_time_dep: int
+    release_profiles: bool, optional
+        see compute_profile_statistics_for_windows
+
+    Returns
+    -------
+    observable_name_to_data: dict
+        mapping from observable name to a numpy array with one value per stop in stop_Is
+    """
+    data, observable_names = compute_profile_statistics_for_windows(stop_I_to_profile, stop_Is,
+                                                                    [(start_time_dep, end_time_dep)],
+                                                                    release_profiles=release_profiles)
+    return {observable_name: data[0, :, k] for k, observable_name in enumerate(observable_names)}
+
+
+def compute_profile_statistics_for_windows(stop_I_to_profile, stop_Is, windows, release_profiles=False):
+    """
+    Compute all measures of NodeProfileAnalyzerTimeAndVehLegs.all_measures_and_names_as_lists for all stops
+    and several analysis windows, from one set of profiles (covering all of the windows).
+
+    Parameters
+    ----------
+    stop_I_to_profile: dict
+        mapping from stop_I to a (finalized) NodeProfileMultiObjective
+    stop_Is: array-like
+        stops for which the measures are computed (stops without a profile are not reachable)
+    windows: list[tuple]
+        (start_time_dep, end_time_dep) pairs, see get_analysis_windows
+    release_profiles: bool, optional
+        if True, each profile is removed from stop_I_to_profile (e.g. the live profiles of a profiler)
+        as soon as its labels have been packed, so that the memory of the profiles is released
+        while packing, instead of all profiles being kept until the end
+
+    Returns
+    -------
+    data: numpy.ndarray
+        shape (n_windows, n_stops, n_observables)
+    observable_names: list[str]
+        PROFILE_OBSERVABLE_NAMES
+    """
+    packed = pack_profiles(stop_I_to_profile, stop_Is, release_profiles=release_profiles)
+    data = numpy.full((len(windows), len(packed["stop_Is"]), len(PROFILE_OBSERVABLE_NAMES)), float("nan"))
+    for w, (start_time_dep, end_time_dep) in enumerate(windows):
+        observable_name_to_data = compute_label_statistics(packed, start_time_dep, end_time_dep)
+        observable_name_to_data.update(compute_temporal_distance_statistics(packed, start_time_dep, end_time_dep,
+                                                                            observable_name_to_data))
+        observable_name_to_data.update(compute_fastest_path_statistics(packed, start_time_dep, end_time_dep))
+        for k, observable_name in enumerate(PROFILE_OBSERVABLE_NAMES):
+            data[w, :, k] = observable_name_to_data[observable_name]
+    _assert_results_are_positive_or_infs_or_nans(data)
+    return data, list(PROFILE_OBSERVABLE_NAMES)
+
+
+def compute_time_profile_statistics(stop_I_to_profile, stop_Is, start_time_dep, end_time_dep):
+    """
+    Compute all measures of NodeProfileAnalyzerTime.all_measures_and_names_as_lists for all stops.
+
+    Parameters
+    ----------
+    stop_I_to_profile: dict
+        mapping from stop_I to NodeProfileSimple (e.g. from BatchConnectionScanProfiler)
+    stop_Is: array-like
+    start_time_dep: int
+    end_time_dep: int
+
+    Returns
+    -------
+    observable_name_to_data: dict
+        mapping from observable name to a numpy array with one value per stop in stop_Is
+    """
+    stop_Is = numpy.asarray(stop_Is)
+    offsets = numpy.zeros(len(stop_Is) + 1, dtype=numpy.int64)
+    walk_to_target_durations = numpy.full(len(stop_Is), float("inf"))
+    labels = []
+    for i, stop_I in enumerate(stop_Is.tolist()):
+        profile = stop_I_to_profile.get(stop_I)
+        if profile is not None:
+            labels.extend(profile.get_final_optimal_labels())
+            walk_to_target_durations[i] = profile.get_walk_to_target_duration()
+        offsets[i + 1] = len(labels)
+    observable_name_to_data = _compute_time_profile_measures(
+        _get_segment_ids(offsets),
+        numpy.array([label.departure_time for label in labels], dtype=float),
+        numpy.array([label.arrival_time_target for label in labels], dtype=float),
+        walk_to_target_durations, len(stop_Is), start_time_dep, end_time_dep)
+    for observable_name in TIME_OBSERVABLE_NAMES:
+        _assert_results_are_positive_or_infs_or_nans(observable_name_to_data[observable_name])
+    return {observable_name: observable_name_to_data[observable_name] for observable_name in TIME_OBSERVABLE_NAMES}
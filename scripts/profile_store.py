@@ -0,0 +1,131 @@
+"""
+A compact binary format for (finalized) node profiles with time and boarding count labels.
+
+The final Pareto-optimal labels of all stops are stored as flat arrays (see profile_stats.pack_profiles)
+in an array directory (see extracts.write_array_directory), sorted by stop_I.
+The arrays are memory-mapped when read, and NodeProfileMultiObjective objects are rebuilt only for
+the stops that are asked for, so loading the profiles of a few stops does not require reading the whole file.
+"""
+
+import numpy
+
+from gtfspy.routing.label import LabelTimeWithBoardingsCount
+from gtfspy.routing.node_profile_multiobjective import NodeProfileMultiObjective
+
+from extracts import write_array_directory, read_array_directory
+from profile_stats import pack_profiles, LABEL_ARRAY_NAMES
+
+PROFILE_STORE_FORMAT_VERSION = 1
+PROFILE_STORE_ARRAY_NAMES = ["stop_Is", "offsets", "walk_to_target_duration"] + LABEL_ARRAY_NAMES
+
+
+def write_profile_store(directory, stop_I_to_profile, params=None):
+    """
+    Parameters
+    ----------
+    directory: str
+    stop_I_to_profile: dict
+        mapping from stop_I to a finalized NodeProfileMultiObjective (with LabelTimeWithBoardingsCount labels)
+    params: dict, optional
+        routing parameters (json-serializable) stored in the header
+    """
+    stop_Is = numpy.array(sorted(stop_I_to_profile.keys()), dtype=numpy.int64)
+    packed = pack_profiles(stop_I_to_profile, stop_Is)
+    header = {
+        "format_version": PROFILE_STORE_FORMAT_VERSION,
+        "columns": PROFILE_STORE_ARRAY_NAMES,
+        "params": params
+    }
+    write_array_directory(directory, {name: packed[name] for name in PROFILE_STORE_ARRAY_NAMES}, header)
+
+
+def _rebuild_profile(labels, walk_to_target_duration):
+    """
+    Rebuild a finalized NodeProfileMultiObjective with the given final labels (through its public methods).
+
+    The labels starting with a vehicle leg are entered with update(), in decreasing order of departure time,
+    and the labels starting with a walk are joined in finalize() as the labels of a neighbor at zero walking
+    duration. As the labels form a Pareto front, they are the final labels of the rebuilt profile.
+    """
+    vehicle_labels = [label for label in labels if not label.first_leg_is_walk]
+    walk_labels = [label for label in labels if label.first_leg_is_walk]
+    departure_time_to_labels = {}
+    for label in vehicle_labels:
+        departure_time_to_labels.setdefault(label.departure_time, []).append(label)
+    departure_times = sorted(departure_time_to_labels)
+    profile = NodeProfileMultiObjective(dep_times=departure_times, walk_to_target_duration=walk_to_target_duration,
+                                        label_class=LabelTimeWithBoardingsCount)
+    for departure_time in reversed(departure_times):
+        profile.update(departure_time_to_labels[departure_time])
+    profile.finalize([walk_labels], [0], [(None, None)])
+    return profile
+
+
+class ProfileStore:
+
+    def __init__(self, directory):
+        """
+        Open profiles written by write_profile_store.
+
+        Parameters
+        ----------
+        directory: str
+        """
+        header, self._name_to_array = read_array_directory(directory, PROFILE_STORE_ARRAY_NAMES)
+        assert header["format_version"] == PROFILE_STORE_FORMAT_VERSION
+        self.directory = directory
+        self.params = header["params"]
+        self.stop_Is = numpy.asarray(self._name_to_array["stop_Is"])
+
+    def __len__(self):
+        return len(self.stop_Is)
+
+    def __contains__(self, stop_I):
+        return self._get_index(stop_I) is not None
+
+    def _get_index(self, stop_I):
+        i = int(numpy.searchsorted(self.stop_Is, stop_I))
+        if i < len(self.stop_Is) and self.stop_Is[i] == stop_I:
+            return i
+        return None
+
+    def get_profile(self, stop_I):
+        """
+        Returns
+        -------
+        profile: NodeProfileMultiObjective or None
+            None if stop_I has no profile
+        """
+        i = self._get_index(stop_I)
+        if i is None:
+            return None
+        arrays = self._name_to_array
+        start, end = int(arrays["offsets"][i]), int(arrays["offsets"][i + 1])
+        labels = [LabelTimeWithBoardingsCount(departure_time, arrival_time_target, n_boardings, first_leg_is_walk)
+                  for departure_time, arrival_time_target, n_boardings, first_leg_is_walk in
+                  zip(arrays["departure_time"][start:end].tolist(),
+                      arrays["arrival_time_target"][start:end].tolist(),
+                      arrays["n_boardings"][start:end].tolist(),
+                      arrays["first_leg_is_walk"][start:end].tolist())]
+        return _rebuild_profile(labels, float(arrays["walk_to_target_duration"][i]))
+
+    def get_profiles(self, stop_Is=None):
+        """
+        Parameters
+        ----------
+        stop_Is: list-like, optional
+            by default, all stops with a profile
+
+        Returns
+        -------
+        stop_I_to_profile: dict
+            stops without a profile are left out
+        """
+        if stop_Is is None:
+            stop_Is = self.stop_Is.tolist()
+        stop_I_to_profile = {}
+        for stop_I in stop_Is:
+            profile = self.get_profile(stop_I)
+            if profile is not None:
+                stop_I_to_profile[stop_I] = profile
+        return stop_I_to_profile
@@ -0,0 +1,261 @@
+"""
+Approximate node profile statistics from earliest arrival journeys at sampled departure times.
+
+Instead of Pareto-optimal profiles, only the earliest arrival times at the targets are computed,
+for all origins and a sample of departure times (a regular grid or uniformly random times within the analysis
+window). All (origin, departure time) pairs of a block are routed with one forward connection scan,
+where the per-stop and per-trip state is stored as vectors with one element per pair.
+The routing rules are those of MultiObjectivePseudoCSAProfiler (walking before the first boarding and between
+vehicles, transfer margins after each vehicle, whole seconds of walking).
+
+The temporal distance measures are estimated from the sampled temporal distances, the other measures
+(trip durations and boarding counts) can not be estimated from earliest arrival times and are nan.
+The running time grows with the number of samples, and the error estimates of the measures shrink with it.
+"""
+
+import numpy
+
+# measures of NodeProfileAnalyzerTimeAndVehLegs estimated by compute_sampled_profile_statistics:
+SAMPLED_OBSERVABLE_NAMES = [
+    "max_temporal_distance",
+    "mean_temporal_distance",
+    "median_temporal_distance",
+    "min_temporal_distance"
+]
+
+DEPARTURE_TIME_SAMPLINGS = ["grid", "random"]
+
+
+def get_sample_departure_times(start_time_dep, end_time_dep, n_samples, sampling="grid", random_seed=None):
+    """
+    Parameters
+    ----------
+    start_time_dep: int
+    end_time_dep: int
+    n_samples: int
+    sampling: str, optional
+        "grid": the midpoints of n_samples equally long intervals,
+        "random": independent uniformly distributed departure times
+    random_seed: int, optional
+
+    Returns
+    -------
+    departure_times: numpy.ndarray
+        in increasing order
+    """
+    if sampling == "grid":
+        step = (end_time_dep - start_time_dep) / float(n_samples)
+        return start_time_dep + step * (numpy.arange(n_samples) + 0.5)
+    if sampling == "random":
+        random_state = numpy.random.RandomState(random_seed)
+        return numpy.sort(random_state.uniform(start_time_dep, end_time_dep, n_samples))
+    raise ValueError("unknown departure time sampling " + str(sampling) + ", use one of " +
+                     str(DEPARTURE_TIME_SAMPLINGS))
+
+
+class SampledConnectionScan:
+    """
+    Earliest arrival times at a set of targets from many (origin, departure time) pairs at once.
+    """
+
+    def __init__(self, connections, targets, transfer_margin=0, walk_network=None, walk_speed=1.5):
+        """
+        Parameters
+        ----------
+        connections: connection_store.ConnectionStore
+            ordered by DECREASING departure time
+        targets: list[int]
+        transfer_margin: int, optional
+        walk_network: walk_network.CSRWalkNetwork, optional
+        walk_speed: float, optional
+            walking speed between stops in meters / second
+        """
+        self._transfer_margin = transfer_margin
+        # scanned in the order of increasing departure time:
+        self._columns = [connections.from_stop_I[::-1].tolist(), connections.to_stop_I[::-1].tolist(),
+                         connections.dep_time_ut[::-1].tolist(), connections.arr_time_ut[::-1].tolist(),
+                         connections.trip_I[::-1].tolist()]
+        self._dep_times = connections.dep_time_ut[::-1]
+
+        max_stop_I = max([int(numpy.max(connections.from_stop_I, initial=0)),
+                          int(numpy.max(connections.to_stop_I, initial=0))] + [int(t) for t in targets])
+        self._stop_to_neighbors = {}
+        if walk_network is not None:
+            walk_network.set_walking_speed(walk_speed)
+            if len(walk_network) > 0:
+                max_stop_I = max(max_stop_I, int(walk_network.nodes_array[-1]))
+            for stop in walk_network.nodes_array.tolist():
+                neighbors, _, walk_durations = walk_network.neighbor_arrays(stop)
+                self._stop_to_neighbors[stop] = list(zip(neighbors.tolist(), walk_durations.tolist()))
+        self._n_stops = max_stop_I + 1
+
+        # (as in MultiObjectivePseudoCSAProfiler, the walking duration to the closest target)
+        self._walk_to_target_durations = numpy.full(self._n_stops, float("inf"))
+        for target in targets:
+            for neighbor, walk_duration in self._stop_to_neighbors.get(target, []):
+                self._walk_to_target_durations[neighbor] = min(self._walk_to_target_durations[neighbor],
+                                                               walk_duration)
+        self._walk_to_target_durations[list(targets)] = 0
+
+    def run(self, origins, departure_times):
+        """
+        Parameters
+        ----------
+        origins: array-like
+            stop_I of each (origin, departure time) pair
+        departure_times: array-like
+            departure time of each pair
+
+        Returns
+        -------
+        arrival_times: numpy.ndarray
+            earliest arrival time at any of the targets for each pair (inf if no target can be reached)
+        """
+        origins = numpy.asarray(origins, dtype=int)
+        departure_times = numpy.asarray(departure_times, dtype=float)
+        n_pairs = len(origins)
+        pairs = numpy.arange(n_pairs)
+        infs = numpy.full(n_pairs, float("inf"))
+        transfer_margin = self._transfer_margin
+        walk_to_target_durations = self._walk_to_target_durations
+        stop_to_neighbors = self._stop_to_neighbors
+
+        # the earliest time of boarding a vehicle at each stop, and the minimum over all pairs:
+        board_times = numpy.full((self._n_stops, n_pairs), float("inf"))
+        board_times[origins, pairs] = departure_times
+        for pair, (origin, departure_time) in enumerate(zip(origins.tolist(), departure_times.tolist())):
+            for neighbor, walk_duration in stop_to_neighbors.get(origin, []):
+                board_times[neighbor, pair] = min(board_times[neighbor, pair], departure_time + walk_duration)
+        min_board_times = board_times.min(axis=1).tolist()
+        arrival_times = departure_times + walk_to_target_durations[origins]
+        latest_arrival_time = arrival_times.max()
+        trip_reached = {}
+
+        start = int(numpy.searchsorted(self._dep_times, departure_times.min(), side="left"))
+        for dep_stop, arr_stop, dep_time, arr_time, trip_I in zip(*[column[start:] for column in self._columns]):
+            if dep_time >= latest_arrival_time:
+                break
+            on_trip = trip_reached.get(trip_I)
+            if min_board_times[dep_stop] <= dep_time:
+                reached = board_times[dep_stop] <= dep_time
+                if on_trip is not None:
+                    reached |= on_trip
+            elif on_trip is None:
+                continue
+            else:
+                reached = on_trip
+            # pairs that have already arrived at a target can not improve:
+            reached = reached & (arr_time < arrival_times)
+            trip_reached[trip_I] = reached
+            if not reached.any():
+                continue
+
+            if walk_to_target_durations[arr_stop] < float("inf"):
+                numpy.minimum(arrival_times, numpy.where(reached, arr_time + walk_to_target_durations[arr_stop], infs),
+                              out=arrival_times)
+                latest_arrival_time = arrival_times.max()
+            transfer_times = numpy.where(reached, arr_time + transfer_margin, infs)
+            numpy.minimum(board_times[arr_stop], transfer_times, out=board_times[arr_stop])
+            min_board_times[arr_stop] = min(min_board_times[arr_stop], arr_time + transfer_margin)
+            for neighbor, walk_duration in stop_to_neighbors.get(arr_stop, []):
+                numpy.minimum(board_times[neighbor], transfer_times + walk_duration, out=board_times[neighbor])
+                min_board_times[neighbor] = min(min_board_times[neighbor], arr_time + transfer_margin + walk_duration)
+        return arrival_times
+
+
+def compute_sampled_arrival_times(scan, origins, departure_times, max_block_size=2048):
+    """
+    Earliest arrival times from all origins at all departure times.
+
+    Parameters
+    ----------
+    scan: SampledConnectionScan
+    origins: array-like
+    departure_times: array-like
+    max_block_size: int, optional
+        maximum number of (origin, departure time) pairs routed at once
+        (the memory use is proportional to the number of stops times max_block_size)
+
+    Returns
+    -------
+    arrival_times: numpy.ndarray
+        shape (n_departure_times, n_origins)
+    """
+    origins = numpy.asarray(origins, dtype=int)
+    departure_times = numpy.asarray(departure_times, dtype=float)
+    # pairs in the order of departure time, so that each block covers a short time span:
+    pair_origins = numpy.tile(origins, len(departure_times))
+    pair_departure_times = numpy.repeat(departure_times, len(origins))
+    arrival_times = numpy.zeros(len(pair_origins))
+    for block_start in range(0, len(pair_origins), max_block_size):
+        block = slice(block_start, block_start + max_block_size)
+        arrival_times[block] = scan.run(pair_origins[block], pair_departure_times[block])
+    return arrival_times.reshape(len(departure_times), len(origins))
+
+
+def _estimate_measures(temporal_distances):
+    with numpy.errstate(invalid="ignore"):
+        return {
+            "max_temporal_distance": numpy.max(temporal_distances, axis=0),
+            "mean_temporal_distance": numpy.mean(temporal_distances, axis=0),
+            "median_temporal_distance": numpy.median(temporal_distances, axis=0),
+            "min_temporal_distance": numpy.min(temporal_distances, axis=0)
+        }
+
+
+def compute_sampled_profile_statistics(departure_times, arrival_times, sampling="grid"):
+    """
+    Estimate the measures of NodeProfileAnalyzerTimeAndVehLegs.all_measures_and_names_as_lists for all origins
+    from sampled earliest arrival times.
+
+    The error of each estimate is estimated as half of the difference between the estimates from two halves
+    of the samples (the even and odd departure times of a grid, or a random split of random samples),
+    except for the mean temporal distance of random samples, whose error is estimated by the standard error
+    of the mean.
+    These are estimates, not bounds: e.g. the maximum temporal distance is underestimated by sampling.
+
+    Parameters
+    ----------
+    departure_times: numpy.ndarray
+        shape (n_departure_times,)
+    arrival_times: numpy.ndarray
+        shape (n_departure_times, n_origins), see compute_sampled_arrival_times
+    sampling: str, optional
+        how the departure times were sampled, see get_sample_departure_times
+
+    Returns
+    -------
+    observable_name_to_data: dict
+        mapping from observable name to a numpy array with one value per origin
+        (nan for measures that can not be estimated)
+    observable_name_to_error: dict
+        mapping from each of SAMPLED_OBSERVABLE_NAMES to a numpy array with the estimated absolute errors
+        (nan where the estimate is not finite)
+    """
+    from gtfspy.routing.node_profile_analyzer_time_and_veh_legs import NodeProfileAnalyzerTimeAndVehLegs
+    _, profile_observable_names = NodeProfileAnalyzerTimeAndVehLegs.all_measures_and_names_as_lists()
+    temporal_distances = arrival_times - numpy.asarray(departure_times, dtype=float)[:, numpy.newaxis]
+    n_origins = temporal_distances.shape[1]
+    estimates = _estimate_measures(temporal_distances)
+    observable_name_to_data = {name: estimates.get(name, numpy.full(n_origins, float("nan")))
+                               for name in profile_observable_names}
+
+    if sampling == "random":
+        # (the sorted random departure times are split randomly, as neighboring samples are correlated)
+        half_order = numpy.random.RandomState(0).permutation(len(temporal_distances))
+    else:
+        half_order = numpy.concatenate([numpy.arange(0, len(temporal_distances), 2),
+                                        numpy.arange(1, len(temporal_distances), 2)])
+    n_first_half = (len(temporal_distances) + 1) // 2
+    first_half_estimates = _estimate_measures(temporal_distances[half_order[:n_first_half]])
+    second_half_estimates = _estimate_measures(temporal_distances[half_order[n_first_half:]])
+    observable_name_to_error = {}
+    with numpy.errstate(invalid="ignore"):
+        for name in SAMPLED_OBSERVABLE_NAMES:
+            observable_name_to_error[name] = numpy.abs(first_half_estimates[name] - second_half_estimates[name]) / 2.0
+        if sampling == "random" and len(temporal_distances) > 1:
+            observable_name_to_error["mean_temporal_distance"] = \
+                numpy.std(temporal_distances, axis=0, ddof=1) / numpy.sqrt(len(temporal_distances))
+        for name, errors in observable_name_to_error.items():
+            errors[~numpy.isfinite(estimates[name])] = float("nan")
+    return observable_name_to_data, observable_name_to_error
@@ -0,0 +1,110 @@
+"""
+Comparison of a timetable scenario with the baseline timetable.
+
+Both timetables are given as connections (connection_store.ConnectionStore) whose trip_Is refer to the same trips
+(e.g. extracts of the same imported database, where the scenario adds, removes or re-times some trips).
+get_changed_trip_Is finds the trips whose connections differ, and find_possibly_affected_targets bounds
+the set of targets whose profiles can depend on any of the connections of those trips.
+"""
+
+import numpy
+
+
+def _get_trip_signatures(connections):
+    """
+    Returns
+    -------
+    trip_I_to_signature: dict
+        mapping from trip_I to the bytes of its (from_stop_I, to_stop_I, dep_time_ut, arr_time_ut) rows,
+        ordered by departure time
+    """
+    trip_Is = numpy.asarray(connections.trip_I)
+    order = numpy.lexsort((connections.seq, connections.dep_time_ut, trip_Is))
+    rows = numpy.column_stack([connections.from_stop_I, connections.to_stop_I,
+                               connections.dep_time_ut, connections.arr_time_ut]).astype(numpy.int64)[order]
+    sorted_trip_Is = trip_Is[order]
+    trip_starts = numpy.nonzero(numpy.concatenate([[True], sorted_trip_Is[1:] != sorted_trip_Is[:-1]]))[0]
+    trip_ends = numpy.concatenate([trip_starts[1:], [len(sorted_trip_Is)]])
+    return {int(sorted_trip_Is[start]): rows[start:end].tobytes()
+            for start, end in zip(trip_starts.tolist(), trip_ends.tolist())}
+
+
+def get_changed_trip_Is(baseline_connections, scenario_connections):
+    """
+    Trips that have been added, removed or modified in the scenario.
+
+    Returns
+    -------
+    changed_trip_Is: set[int]
+    """
+    baseline_signatures = _get_trip_signatures(baseline_connections)
+    scenario_signatures = _get_trip_signatures(scenario_connections)
+    return {trip_I for trip_I in set(baseline_signatures) | set(scenario_signatures)
+            if baseline_signatures.get(trip_I) != scenario_signatures.get(trip_I)}
+
+
+def _get_reachable_stops(connections, net, source_stop_to_time, walk_speed):
+    """
+    All stops reachable (by transit and walking) from any of the sources, when starting from
+    each source stop at the given time (a forward earliest arrival connection scan from all sources at once).
+    Transfer margins are ignored, so that the result is a superset of the truly reachable stops.
+    """
+    earliest_arrival_times = {}
+    reached_trip_Is = set()
+
+    def reach(stop, time):
+        if time < earliest_arrival_times.get(stop, float("inf")):
+            earliest_arrival_times[stop] = time
+            if stop in net:
+                neighbors, d_walks, _ = net.neighbor_arrays(stop)
+                for neighbor, d_walk in zip(neighbors.tolist(), d_walks.tolist()):
+                    walk_arrival_time = time + d_walk / walk_speed
+                    if walk_arrival_time < earliest_arrival_times.get(neighbor, float("inf")):
+                        earliest_arrival_times[neighbor] = walk_arrival_time
+
+    for stop, time in source_stop_to_time.items():
+        reach(stop, time)
+    # connections are stored by decreasing departure time:
+    columns = [connections.from_stop_I[::-1].tolist(), connections.to_stop_I[::-1].tolist(),
+               connections.dep_time_ut[::-1].tolist(), connections.arr_time_ut[::-1].tolist(),
+               connections.trip_I[::-1].tolist()]
+    for dep_stop, arr_stop, dep_time, arr_time, trip_I in zip(*columns):
+        if trip_I in reached_trip_Is or earliest_arrival_times.get(dep_stop, float("inf")) <= dep_time:
+            reached_trip_Is.add(trip_I)
+            reach(arr_stop, arr_time)
+    return set(earliest_arrival_times)
+
+
+def find_possibly_affected_targets(baseline_connections, scenario_connections, net, changed_trip_Is, walk_speed):
+    """
+    Targets whose profiles may differ between the baseline and the scenario.
+
+    A journey to a target can only use a connection of a changed trip if the target is reachable
+    from the arrival of that connection, so all other targets have identical profiles.
+    Reachability is computed in the baseline for the changed trips of the baseline, and in the scenario for
+    the changed trips of the scenario.
+
+    Parameters
+    ----------
+    baseline_connections: connection_store.ConnectionStore
+    scenario_connections: connection_store.ConnectionStore
+    net: walk_network.CSRWalkNetwork
+    changed_trip_Is: set[int]
+        see get_changed_trip_Is
+    walk_speed: float
+        in meters / second
+
+    Returns
+    -------
+    affected_target_Is: set[int]
+    """
+    affected_target_Is = set()
+    for connections in [baseline_connections, scenario_connections]:
+        is_changed = numpy.isin(connections.trip_I, list(changed_trip_Is))
+        source_stop_to_time = {}
+        for arr_stop, arr_time in zip(connections.to_stop_I[is_changed].tolist(),
+                                      connections.arr_time_ut[is_changed].tolist()):
+            source_stop_to_time[arr_stop] = min(arr_time, source_stop_to_time.get(arr_stop, float("inf")))
+        if source_stop_to_time:
+            affected_target_Is |= _get_reachable_stops(connections, net, source_stop_to_time, walk_speed)
+    return affected_target_Is
@@ -1,3 +1,4 @@
+import plot_settings
 import settings
 from gtfspy.routing.label import LabelTimeSimple, LabelTimeWithBoardingsCount
 from gtfspy.routing.node_profile_analyzer_time import NodeProfileAnalyzerTime
@@ -133,6 +133,7 @@ handles = []
 for name in ["green", "red"]:
     color = name_to_color[name]
 
+import plot_settings
 from settings import FIGS_DIRECTORY
 fig.savefig(os.path.join(FIGS_DIRECTORY, "temporal_network_base.svg"), format="svg")
 plt.show()
\ No newline at end of file
@@ -1,6 +1,6 @@
 # -*- coding: latin-1 -*-
 import os
-import pytz
+import sqlite3
 
 RESULTS_DIRECTORY = "../results/"
 DATA_DIRECTORY = "../data/"
@@ -15,6 +15,19 @@ HELSINKI_NODES_FNAME = HELSINKI_DATA_BASEDIR + "main.day.nodes.csv"
 HELSINKI_TRANSIT_CONNECTIONS_FNAME = os.path.join(HELSINKI_DATA_BASEDIR, "main.day.temporal_network.csv")
 HELSINKI_TRANSFERS_FNAME = os.path.join(HELSINKI_DATA_BASEDIR, "main.day.transfers.csv")
 
+# Cache for parsed and filtered routing inputs (connections + walk network), see compute.read_routing_inputs
+INPUT_CACHE_DIRECTORY = os.path.join(RESULTS_DIRECTORY, "input_cache")
+INPUT_CACHE_MAX_BYTES = 4 * 1024 ** 3
+# Content-addressed cache for computed results (profiles, statistics), see compute.get_cached_result
+RESULT_CACHE_DIRECTORY = os.path.join(RESULTS_DIRECTORY, "result_cache")
+RESULT_CACHE_MAX_BYTES = 16 * 1024 ** 3
+# Structured timing and memory records of the computation stages (json lines), see instrumentation.py
+INSTRUMENTATION_LOG_DIRECTORY = os.path.join(RESULTS_DIRECTORY, "instrumentation")
+# All-to-all statistics, and the store of the default routing parameters (written by compute.py, served by
+# stats_server.py), see compute.get_all_to_all_directory
+ALL_TO_ALL_STATS_DIRECTORY = os.path.join(RESULTS_DIRECTORY, "all_to_all_stats")
+ALL_TO_ALL_STATS_STORE_DIRECTORY = os.path.join(ALL_TO_ALL_STATS_DIRECTORY, "store")
+
 
 DEFAULT_TILES = "CartoDB positron"
 DARK_TILES = "CartoDB dark_matter"
@@ -38,7 +51,7 @@ ROUTING_END_TIME_DEP = ROUTING_START_TIME_DEP + 3 * 3600
 # MUNKKIVUORI_STOP_ID = 1161
 # # 1161,1304137,1396,Munkkivuori,Huopalahdentie,60.20595,24.87998,,0,2,1161
 
-TIMEZONE = pytz.timezone("Europe/Helsinki")
+TIMEZONE_NAME = "Europe/Helsinki"
 
 # from jinja2 import defaults
 # defaults.LSTRIP_BLOCKS = True
@@ -72,24 +85,78 @@ LONG_DISTANCE_STOPS = [
 ]
 
 
-def get_stop_I_by_stop_id(stop_id):
-    from gtfspy.gtfs import GTFS
-    g = GTFS(IMPORTED_DATABASE_PATH)
-    query = "SELECT stop_I FROM stops WHERE stop_id='" + str(stop_id) + "';"
-    print(stop_id)
-    stop_I = g.execute_custom_query(query).fetchone()[0]
-    return stop_I
+# The stops table of the imported database, opened once (read-only) and cached, see get_stop_Is_by_stop_ids
+_stop_lookup = {"connection": None, "stop_id_to_stop_I": {}, "all_loaded": False}
+
+
+def _get_database_connection():
+    if _stop_lookup["connection"] is None:
+        _stop_lookup["connection"] = sqlite3.connect("file:" + os.path.abspath(IMPORTED_DATABASE_PATH) + "?mode=ro",
+                                                     uri=True, check_same_thread=False)
+    return _stop_lookup["connection"]
+
+
+def get_stop_id_to_stop_I():
+    """
+    Returns
+    -------
+    stop_id_to_stop_I: dict
+        all stops of the imported database (loaded with one query on the first call)
+    """
+    if not _stop_lookup["all_loaded"]:
+        rows = _get_database_connection().execute("SELECT stop_id, stop_I FROM stops").fetchall()
+        _stop_lookup["stop_id_to_stop_I"].update(rows)
+        _stop_lookup["all_loaded"] = True
+    return _stop_lookup["stop_id_to_stop_I"]
+
+
+def get_stop_Is_by_stop_ids(stop_ids):
+    """
+    Resolve stop_ids to stop_Is, with one (parameterized) query for the stop_ids not yet cached.
+
+    Parameters
+    ----------
+    stop_ids: list[str]
+
+    Returns
+    -------
+    stop_Is: list[int]
+
+    Raises
+    ------
+    KeyError
+        if some of the stop_ids are not in the database
+    """
+    stop_ids = [str(stop_id) for stop_id in stop_ids]
+    stop_id_to_stop_I = _stop_lookup["stop_id_to_stop_I"]
+    missing = sorted(set(stop_id for stop_id in stop_ids if stop_id not in stop_id_to_stop_I))
+    if missing and not _stop_lookup["all_loaded"]:
+        # (in chunks below the default limit of sqlite for the number of query parameters)
+        for chunk_start in range(0, len(missing), 900):
+            chunk = missing[chunk_start:chunk_start + 900]
+            query = "SELECT stop_id, stop_I FROM stops WHERE stop_id IN (" + ",".join("?" * len(chunk)) + ")"
+            stop_id_to_stop_I.update(_get_database_connection().execute(query, chunk).fetchall())
+    return [stop_id_to_stop_I[stop_id] for stop_id in stop_ids]
 
-def get_swimming_hall_stop_Is():
-    from gtfspy.gtfs import GTFS
-    g = GTFS(IMPORTED_DATABASE_PATH)
-    query = 'SELECT stop_I FROM stops WHERE SUBSTR(stop_id, 0, 7)="SWIMMI";'
-    stop_Is = [el[0] for el in g.execute_custom_query(query).fetchall()]
-    return stop_Is
 
-import matplotlib as mpl
-mpl.style.use('classic')
+def get_stop_I_by_stop_id(stop_id):
+    return get_stop_Is_by_stop_ids([stop_id])[0]
 
-import smopy
-smopy.TILE_SERVER = "https://cartodb-basemaps-1.global.ssl.fastly.net/dark_all/{z}/{x}/{y}.png"
 
+def get_swimming_hall_stop_Is():
+    query = "SELECT stop_I FROM stops WHERE SUBSTR(stop_id, 1, ?) = ?"
+    rows = _get_database_connection().execute(query, (len(SWIMMING_HALL_ID_PREFIX), SWIMMING_HALL_ID_PREFIX))
+    return [row[0] for row in rows.fetchall()]
+
+# used by util.get_smopy_map (the matplotlib style is set in plot_settings.py, so that importing
+# the settings does not import any plotting or mapping libraries)
+SMOPY_TILE_SERVER = "https://cartodb-basemaps-1.global.ssl.fastly.net/dark_all/{z}/{x}/{y}.png"
+
+
+def __getattr__(name):
+    # TIMEZONE (a pytz time zone) is created on first use, as pytz is only needed for plotting
+    if name == "TIMEZONE":
+        import pytz
+        globals()["TIMEZONE"] = pytz.timezone(TIMEZONE_NAME)
+        return globals()["TIMEZONE"]
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
@@ -0,0 +1,86 @@
+"""
+Nearest-stop lookups with a KD-tree.
+
+The coordinates are projected to a local plane (equirectangular projection around the mean latitude of the stops),
+where euclidean distances are within a fraction of a percent of the great-circle distances
+over the extent of one city.
+"""
+
+import numpy
+from scipy.spatial import cKDTree
+
+from extracts import read_nodes
+
+EARTH_RADIUS = 6378137.0  # meters, as in gtfspy.util.wgs84_distance
+
+
+class StopSpatialIndex:
+
+    def __init__(self, stop_Is, lats, lons):
+        """
+        Parameters
+        ----------
+        stop_Is: array-like
+        lats: array-like
+        lons: array-like
+        """
+        self.stop_Is = numpy.asarray(stop_Is)
+        lats = numpy.asarray(lats, dtype=float)
+        lons = numpy.asarray(lons, dtype=float)
+        self._cos_lat0 = numpy.cos(numpy.radians(numpy.mean(lats))) if len(lats) else 1.0
+        self._tree = cKDTree(self._project(lats, lons))
+
+    @classmethod
+    def from_nodes(cls, nodes=None):
+        """
+        Parameters
+        ----------
+        nodes: pandas.DataFrame, optional
+            with columns stop_I, lat and lon, by default the nodes extract
+        """
+        if nodes is None:
+            nodes = read_nodes()
+        return cls(nodes['stop_I'].values, nodes['lat'].values, nodes['lon'].values)
+
+    def _project(self, lats, lons):
+        lats = numpy.radians(numpy.atleast_1d(numpy.asarray(lats, dtype=float)))
+        lons = numpy.radians(numpy.atleast_1d(numpy.asarray(lons, dtype=float)))
+        return numpy.column_stack([EARTH_RADIUS * lons * self._cos_lat0, EARTH_RADIUS * lats])
+
+    def nearest(self, lats, lons, k=1):
+        """
+        The k nearest stops of each location.
+
+        Parameters
+        ----------
+        lats: float or array-like
+        lons: float or array-like
+        k: int, optional
+
+        Returns
+        -------
+        stop_Is: numpy.ndarray
+            shape (n_locations, k)
+        distances: numpy.ndarray
+            shape (n_locations, k), in meters
+        """
+        k = min(k, len(self.stop_Is))
+        distances, indices = self._tree.query(self._project(lats, lons), k=k)
+        distances = numpy.asarray(distances).reshape(-1, k)
+        indices = numpy.asarray(indices).reshape(-1, k)
+        return self.stop_Is[indices], distances
+
+    def within_radius(self, lat, lon, radius):
+        """
+        All stops within radius (in meters) of a location, ordered by distance.
+
+        Returns
+        -------
+        stop_Is: numpy.ndarray
+        distances: numpy.ndarray
+        """
+        point = self._project(lat, lon)[0]
+        indices = numpy.array(self._tree.query_ball_point(point, radius), dtype=int)
+        distances = numpy.hypot(*(self._tree.data[indices] - point).T) if len(indices) else numpy.zeros(0)
+        order = numpy.argsort(distances, kind="mergesort")
+        return self.stop_Is[indices[order]], distances[order]
@@ -0,0 +1,247 @@
+"""
+A local HTTP server answering queries on the all-to-all statistics (see stats_store.py), e.g. for dashboards.
+
+The statistics are read from the memory-mapped store, so rows written by running all-to-all shards
+become visible as soon as they are completed, and a store that is re-created is reopened automatically.
+All responses are json, with non-finite values (unreachable / undefined) as null.
+While the store does not exist (or can not be read), the endpoints respond with status 503; while a store
+is being replaced, the previously opened store is used.
+
+Endpoints (origin and target are stop_Is):
+    /observables
+    /status
+    /point?observable=<name>&origin=<stop_I>&target=<stop_I>
+    /to_target?observable=<name>&target=<stop_I>        (values from all origins)
+    /from_origin?observable=<name>&origin=<stop_I>      (values to all completed targets)
+    /top_k?observable=<name>&origin=<stop_I>&k=<k>      (or target=<stop_I>: the k smallest finite values)
+
+Usage:
+    python stats_server.py [port] [store_directory]
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+import numpy
+
+from stats_store import AllToAllStatsStore
+from settings import ALL_TO_ALL_STATS_STORE_DIRECTORY
+
+DEFAULT_PORT = 8732
+
+
+def _to_json_values(values):
+    values = numpy.asarray(values, dtype=float)
+    return [value if numpy.isfinite(value) else None for value in values.tolist()]
+
+
+class StatsQueries:
+    """
+    Queries on an AllToAllStatsStore, reopening the store if it has been re-created.
+    """
+
+    def __init__(self, directory=ALL_TO_ALL_STATS_STORE_DIRECTORY, reload_interval=1.0):
+        """
+        Parameters
+        ----------
+        directory: str
+        reload_interval: float, optional
+            minimum number of seconds between checks of whether the store has been re-created
+        """
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._store = None
+        self._store_stat = None
+        self._last_check_time = 0
+        try:
+            self.reload_if_changed(force=True)
+        except OSError as e:
+            print("The statistics store " + directory + " is not available (" + str(e) + ")")
+
+    def _get_store_stat(self):
+        header_stat = os.stat(os.path.join(self.directory, "header.json"))
+        return header_stat.st_ino, header_stat.st_mtime_ns
+
+    def reload_if_changed(self, force=False):
+        """
+        Returns
+        -------
+        store: AllToAllStatsStore
+
+        Raises
+        ------
+        OSError
+            if the store can not be opened, and no earlier version of it has been opened
+        """
+        now = time.time()
+        if not force and self._store is not None and now - self._last_check_time < self.reload_interval:
+            return self._store
+        with self._lock:
+            self._last_check_time = now
+            try:
+                store_stat = self._get_store_stat()
+                if force or self._store is None or store_stat != self._store_stat:
+                    self._store = AllToAllStatsStore(self.directory)
+                    self._store_stat = store_stat
+                    print("Opened the statistics store " + self.directory)
+            except OSError:
+                # (e.g. the store is being replaced: the previously opened store remains readable)
+                if self._store is None:
+                    raise
+        return self._store
+
+    def _get_matrix(self, observable_name):
+        store = self.reload_if_changed()
+        if observable_name not in store.observable_names:
+            raise KeyError("unknown observable " + str(observable_name))
+        _, matrix = store.read_observable_matrix(observable_name, only_completed=False)
+        return store, matrix
+
+    def _get_completed_row(self, store, target_I):
+        if not store.is_completed(target_I):
+            raise KeyError("target " + str(target_I) + " has not been computed")
+        return store.get_index(target_I)
+
+    def observables(self):
+        return {"observables": self.reload_if_changed().observable_names}
+
+    def status(self):
+        store = self.reload_if_changed()
+        return {"n_stops": len(store.stop_Is), "n_completed_targets": len(store.get_completed_target_Is())}
+
+    def point(self, observable_name, origin_I, target_I):
+        store, matrix = self._get_matrix(observable_name)
+        row = self._get_completed_row(store, target_I)
+        return {"origin": origin_I, "target": target_I,
+                "value": _to_json_values([matrix[row, store.get_index(origin_I)]])[0]}
+
+    def to_target(self, observable_name, target_I):
+        store, matrix = self._get_matrix(observable_name)
+        row = self._get_completed_row(store, target_I)
+        return {"target": target_I, "origins": store.stop_Is.tolist(), "values": _to_json_values(matrix[row])}
+
+    def from_origin(self, observable_name, origin_I):
+        store, matrix = self._get_matrix(observable_name)
+        completed_rows = numpy.nonzero(store.get_completed_mask())[0]
+        values = matrix[completed_rows, store.get_index(origin_I)]
+        return {"origin": origin_I, "targets": store.stop_Is[completed_rows].tolist(),
+                "values": _to_json_values(values)}
+
+    def top_k(self, observable_name, k, origin_I=None, target_I=None):
+        """
+        The k stops with the smallest finite values from origin_I (to completed targets) or to target_I.
+        """
+        if (origin_I is None) == (target_I is None):
+            raise ValueError("give either origin or target")
+        if origin_I is not None:
+            result = self.from_origin(observable_name, origin_I)
+            stop_Is, values = result["targets"], result["values"]
+        else:
+            result = self.to_target(observable_name, target_I)
+            stop_Is, values = result["origins"], result["values"]
+        values = numpy.array([value if value is not None else float("inf") for value in values])
+        k = max(0, min(k, int(numpy.isfinite(values).sum())))
+        nearest = numpy.argpartition(values, k)[:k] if k < len(values) else numpy.arange(len(values))
+        nearest = nearest[numpy.argsort(values[nearest], kind="mergesort")]
+        return {"stops": [stop_Is[i] for i in nearest.tolist()], "values": values[nearest].tolist()}
+
+
+def _get_query_param(query, name, default=None):
+    if name in query:
+        return query[name]
+    if default is not None:
+        return default
+    raise ValueError("missing query parameter " + name)
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        queries = self.server.queries
+        try:
+            if url.path == "/observables":
+                data = queries.observables()
+            elif url.path == "/status":
+                data = queries.status()
+            elif url.path == "/point":
+                data = queries.point(_get_query_param(query, "observable"),
+                                     int(_get_query_param(query, "origin")),
+                                     int(_get_query_param(query, "target")))
+            elif url.path == "/to_target":
+                data = queries.to_target(_get_query_param(query, "observable"),
+                                         int(_get_query_param(query, "target")))
+            elif url.path == "/from_origin":
+                data = queries.from_origin(_get_query_param(query, "observable"),
+                                           int(_get_query_param(query, "origin")))
+            elif url.path == "/top_k":
+                origin_I = int(query["origin"]) if "origin" in query else None
+                target_I = int(query["target"]) if "target" in query else None
+                data = queries.top_k(_get_query_param(query, "observable"),
+                                     int(_get_query_param(query, "k", 10)), origin_I, target_I)
+            else:
+                self._send_json(404, {"error": "unknown path " + url.path})
+                return
+        except KeyError as e:
+            self._send_json(404, {"error": "not found: " + str(e)})
+            return
+        except OSError as e:
+            self._send_json(503, {"error": "statistics store not available: " + str(e)})
+            return
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(200, data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class StatsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=DEFAULT_PORT, directory=ALL_TO_ALL_STATS_STORE_DIRECTORY, host="127.0.0.1",
+                 verbose=False):
+        """
+        Parameters
+        ----------
+        port: int, optional
+            0 for any free port (see self.server_address)
+        directory: str, optional
+        host: str, optional
+            by default, only local connections are accepted
+        verbose: bool, optional
+            log each request
+        """
+        self.queries = StatsQueries(directory)
+        self.verbose = verbose
+        HTTPServer.__init__(self, (host, port), StatsRequestHandler)
+
+
+if __name__ == "__main__":
+    port = DEFAULT_PORT
+    directory = ALL_TO_ALL_STATS_STORE_DIRECTORY
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        directory = sys.argv[2]
+    server = StatsServer(port, directory)
+    print("Serving the all-to-all statistics on http://%s:%d" % server.server_address)
+    server.serve_forever()
@@ -0,0 +1,226 @@
+"""
+A consolidated, memory-mappable store for all-to-all statistics.
+
+The store is a directory containing one (targets x origins) float32 matrix per observable
+(<observable_name>.npy), the stop_Is giving the order of both the rows and the columns (stop_Is.npy),
+a vector marking the rows that have been computed (completed.npy) and a json header.
+Each row is contiguous on disk, so that reading one observable is one sequential read.
+
+Shards computing different targets (possibly on different nodes) write their rows into the same files.
+Rows and completion flags are therefore written with os.pwrite (only their own bytes) under an exclusive lock
+of the store's lock file, and synced before the lock is released: writing through memory maps would write back
+whole pages, which on network file systems (NFS, Lustre) can overwrite rows or flags written by another node.
+Reading uses memory maps.
+"""
+
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # (not available on Windows)
+    fcntl = None
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from extracts import SIDECAR_HEADER_FNAME
+
+STATS_STORE_FORMAT_VERSION = 1
+STATS_STORE_DTYPE = numpy.float32
+STATS_STORE_LOCK_FNAME = "write.lock"
+
+
+class AllToAllStatsStore:
+
+    def __init__(self, directory, mmap_mode="r"):
+        """
+        Open an existing store.
+
+        Parameters
+        ----------
+        directory: str
+        mmap_mode: str, optional
+            mode of the memory maps used for reading (rows are not written through them, see write_row)
+        """
+        with open(os.path.join(directory, SIDECAR_HEADER_FNAME), "r") as f:
+            self.header = json.load(f)
+        assert self.header["format_version"] == STATS_STORE_FORMAT_VERSION
+        self.directory = directory
+        self.observable_names = self.header["observable_names"]
+        self.params = self.header["params"]
+        self.stop_Is = numpy.load(os.path.join(directory, "stop_Is.npy"))
+        self._stop_I_to_index = {stop_I: i for i, stop_I in enumerate(self.stop_Is.tolist())}
+        self._mmap_mode = mmap_mode
+        self._matrices = {}
+        self._completed = None
+        self._data_offsets = {}
+
+    @classmethod
+    def create(cls, directory, stop_Is, observable_names, params=None):
+        """
+        Create an empty store (if it does not yet exist), and open it for writing.
+
+        Concurrent calls are safe: the store is first created under a temporary name and then renamed in place,
+        and if some other process has created the store first, that store is used instead.
+
+        Parameters
+        ----------
+        directory: str
+        stop_Is: array-like
+            order of both the targets (rows) and the origins (columns)
+        observable_names: list[str]
+        params: dict, optional
+            routing parameters (json-serializable) stored in the header
+
+        Returns
+        -------
+        store: AllToAllStatsStore
+        """
+        if not os.path.exists(directory):
+            stop_Is = numpy.asarray(stop_Is, dtype=numpy.int64)
+            n_stops = len(stop_Is)
+            tmp_directory = directory + ".tmp" + str(os.getpid())
+            if os.path.exists(tmp_directory):
+                shutil.rmtree(tmp_directory)
+            os.makedirs(tmp_directory)
+            numpy.save(os.path.join(tmp_directory, "stop_Is.npy"), stop_Is)
+            # (the matrices are sparse files, only the computed rows take up disk space)
+            for observable_name in observable_names:
+                matrix = open_memmap(os.path.join(tmp_directory, observable_name + ".npy"), mode="w+",
+                                     dtype=STATS_STORE_DTYPE, shape=(n_stops, n_stops))
+                del matrix
+            completed = open_memmap(os.path.join(tmp_directory, "completed.npy"), mode="w+",
+                                    dtype=numpy.uint8, shape=(n_stops,))
+            del completed
+            header = {
+                "format_version": STATS_STORE_FORMAT_VERSION,
+                "observable_names": list(observable_names),
+                "params": params
+            }
+            with open(os.path.join(tmp_directory, SIDECAR_HEADER_FNAME), "w") as f:
+                json.dump(header, f, indent=1)
+            try:
+                os.rename(tmp_directory, directory)
+            except OSError:
+                # another process was faster
+                shutil.rmtree(tmp_directory)
+        return cls(directory)
+
+    def _get_matrix(self, observable_name):
+        if observable_name not in self._matrices:
+            self._matrices[observable_name] = numpy.load(os.path.join(self.directory, observable_name + ".npy"),
+                                                         mmap_mode=self._mmap_mode)
+        return self._matrices[observable_name]
+
+    def _get_completed(self):
+        if self._completed is None:
+            self._completed = numpy.load(os.path.join(self.directory, "completed.npy"), mmap_mode=self._mmap_mode)
+        return self._completed
+
+    @contextmanager
+    def _write_lock(self):
+        fd = os.open(os.path.join(self.directory, STATS_STORE_LOCK_FNAME), os.O_RDWR | os.O_CREAT)
+        try:
+            if fcntl is not None:
+                # (POSIX record locks, which also work between the nodes of NFS and Lustre clients)
+                fcntl.lockf(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # (releases the lock)
+
+    def _write_bytes(self, fname, position_data_pairs):
+        """
+        Write bytes into a .npy file of the store, and sync the file.
+
+        Parameters
+        ----------
+        fname: str
+        position_data_pairs: list
+            (position in bytes from the start of the array data, bytes) pairs
+        """
+        if fname not in self._data_offsets:
+            self._data_offsets[fname] = numpy.load(os.path.join(self.directory, fname), mmap_mode="r").offset
+        fd = os.open(os.path.join(self.directory, fname), os.O_WRONLY)
+        try:
+            for position, data in position_data_pairs:
+                n_written = os.pwrite(fd, data, self._data_offsets[fname] + position)
+                assert n_written == len(data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def get_index(self, stop_I):
+        return self._stop_I_to_index[int(stop_I)]
+
+    def write_row(self, target_I, observable_name_to_data):
+        """
+        Write the statistics from all origins to one target, and mark the row completed.
+
+        Parameters
+        ----------
+        target_I: int
+        observable_name_to_data: dict
+            mapping from observable name to values for each origin (in the order of self.stop_Is)
+        """
+        row = self.get_index(target_I)
+        n_stops = len(self.stop_Is)
+        row_n_bytes = n_stops * numpy.dtype(STATS_STORE_DTYPE).itemsize
+        rows = []
+        for observable_name in self.observable_names:
+            values = numpy.asarray(observable_name_to_data[observable_name], dtype=float).astype(STATS_STORE_DTYPE)
+            assert values.shape == (n_stops,)
+            rows.append((observable_name, values.tobytes()))
+        with self._write_lock():
+            for observable_name, data in rows:
+                self._write_bytes(observable_name + ".npy", [(row * row_n_bytes, data)])
+            # (the rows are synced before the row is marked completed)
+            self._write_bytes("completed.npy", [(row, b"\x01")])
+
+    def mark_completed(self, target_Is):
+        """
+        Mark rows completed without writing them (rows never written are all zeros).
+        """
+        with self._write_lock():
+            rows = sorted(self.get_index(target_I) for target_I in target_Is)
+            self._write_bytes("completed.npy", [(row, b"\x01") for row in rows])
+
+    def get_completed_mask(self):
+        """
+        Returns
+        -------
+        completed: numpy.ndarray
+            bool array, True for rows (in the order of self.stop_Is) that have been computed
+        """
+        return numpy.asarray(self._get_completed(), dtype=bool)
+
+    def get_completed_target_Is(self):
+        return self.stop_Is[self.get_completed_mask()]
+
+    def is_completed(self, target_I):
+        return bool(self._get_completed()[self.get_index(target_I)])
+
+    def read_observable_matrix(self, observable_name, only_completed=True):
+        """
+        Parameters
+        ----------
+        observable_name: str
+        only_completed: bool, optional
+            if True, only the rows of the completed targets are returned (as a new array)
+            otherwise the whole memory-mapped matrix is returned (rows of not completed targets are undefined)
+
+        Returns
+        -------
+        target_Is: numpy.ndarray
+            stop_Is corresponding to the rows of the matrix
+        matrix: numpy.ndarray
+        """
+        matrix = self._get_matrix(observable_name)
+        if not only_completed:
+            return self.stop_Is, matrix
+        completed = self.get_completed_mask()
+        if completed.all():
+            return self.stop_Is, matrix
+        return self.stop_Is[completed], matrix[completed]
@@ -0,0 +1,152 @@
+"""
+Synthetic temporal networks for testing and benchmarking the routing, without the Helsinki extracts.
+
+Stops are laid out on a grid (routes along the rows and columns) or radially (routes along the spokes, through
+the center), with a fixed headway of trips in both directions of each route, and walking transfers between
+(a fraction of) the stops within walking distance of each other.
+write_synthetic_network writes the network in the format of the extracts (see prepare.create_extracts),
+so that it can be read with compute.read_routing_inputs and extracts.read_nodes.
+"""
+
+import os
+
+import numpy
+import pandas
+from scipy.spatial import cKDTree
+
+LAYOUTS = ["grid", "radial"]
+
+# an arbitrary unix time (2016-10-03 08:00 in Helsinki)
+DEFAULT_START_TIME_UT = 1475470800
+
+_EARTH_RADIUS = 6378137.0
+_CENTER_LAT = 60.17
+_CENTER_LON = 24.94
+
+
+def _get_grid_layout(n_stops, n_routes, stop_spacing):
+    side = max(2, int(round(numpy.sqrt(n_stops))))
+    rows, cols = numpy.divmod(numpy.arange(side * side), side)
+    xs, ys = cols * stop_spacing, rows * stop_spacing
+    n_horizontal = (n_routes + 1) // 2
+    n_vertical = n_routes // 2
+    routes = []
+    for k in range(n_horizontal):
+        row = int((k + 0.5) * side / n_horizontal)
+        routes.append([row * side + col for col in range(side)])
+    for k in range(n_vertical):
+        col = int((k + 0.5) * side / n_vertical)
+        routes.append([row * side + col for row in range(side)])
+    return xs.astype(float), ys.astype(float), routes
+
+
+def _get_radial_layout(n_stops, n_routes, stop_spacing):
+    n_spokes = 2 * max(1, n_routes)
+    n_rings = max(1, int(round((n_stops - 1) / float(n_spokes))))
+    angles = numpy.repeat(numpy.arange(n_spokes) * 2 * numpy.pi / n_spokes, n_rings)
+    radii = numpy.tile(numpy.arange(1, n_rings + 1) * stop_spacing, n_spokes)
+    xs = numpy.concatenate([[0.0], radii * numpy.cos(angles)])
+    ys = numpy.concatenate([[0.0], radii * numpy.sin(angles)])
+
+    def spoke_stops(spoke):
+        return [1 + spoke * n_rings + ring for ring in range(n_rings)]
+
+    # each route runs from the end of one spoke through the center to the end of the opposite spoke:
+    routes = [spoke_stops(spoke)[::-1] + [0] + spoke_stops(spoke + n_spokes // 2)
+              for spoke in range(n_spokes // 2)]
+    return xs, ys, routes
+
+
+def generate_synthetic_network(layout="grid", n_stops=100, n_routes=4, headway=600, service_duration=4 * 3600,
+                               start_time_ut=DEFAULT_START_TIME_UT, stop_spacing=400, vehicle_speed=8.0,
+                               walk_edge_density=0.5, max_walk_distance=1000, walk_detour_factor=1.25, seed=0):
+    """
+    Parameters
+    ----------
+    layout: str, optional
+        "grid": stops on a square lattice (n_stops is rounded to a square number), routes along evenly spread
+        rows and columns, or
+        "radial": one central stop and 2 * n_routes spokes (n_stops is rounded to fill the spokes evenly),
+        each route running along two opposite spokes
+    n_stops: int, optional
+    n_routes: int, optional
+    headway: int, optional
+        seconds between consecutive trips of a route (in each direction)
+    service_duration: int, optional
+        seconds from start_time_ut during which trips depart from their first stop
+    start_time_ut: int, optional
+    stop_spacing: float, optional
+        meters between neighboring stops
+    vehicle_speed: float, optional
+        meters / second, dwell times of 0 or 30 seconds are added randomly
+    walk_edge_density: float, optional
+        fraction of the stop pairs within max_walk_distance that are connected by a walking transfer
+    max_walk_distance: float, optional
+        maximum straight line distance of walking transfers (in meters)
+    walk_detour_factor: float, optional
+        ratio of the walking distance (d_walk) to the straight line distance (d)
+    seed: int, optional
+
+    Returns
+    -------
+    network: dict
+        "nodes", "connections" and "transfers" (pandas.DataFrame with the columns of the extracts)
+    """
+    random_state = numpy.random.RandomState(seed)
+    if layout == "grid":
+        xs, ys, routes = _get_grid_layout(n_stops, n_routes, stop_spacing)
+    elif layout == "radial":
+        xs, ys, routes = _get_radial_layout(n_stops, n_routes, stop_spacing)
+    else:
+        raise ValueError("unknown layout " + str(layout) + ", use one of " + str(LAYOUTS))
+
+    lats = _CENTER_LAT + numpy.degrees(ys / _EARTH_RADIUS)
+    lons = _CENTER_LON + numpy.degrees(xs / (_EARTH_RADIUS * numpy.cos(numpy.radians(_CENTER_LAT))))
+    nodes = pandas.DataFrame({"stop_I": numpy.arange(len(xs)), "lat": lats, "lon": lons,
+                              "desc": ["synthetic stop " + str(i) for i in range(len(xs))]})
+
+    connection_rows = []
+    trip_I = 0
+    for route_I, route_stops in enumerate(routes):
+        for stops in [route_stops, route_stops[::-1]]:
+            link_durations = numpy.hypot(numpy.diff(xs[stops]), numpy.diff(ys[stops])) / vehicle_speed
+            first_departure = start_time_ut + random_state.randint(0, headway)
+            for trip_start in range(first_departure, start_time_ut + service_duration, headway):
+                trip_I += 1
+                dep_time = trip_start
+                for seq, (from_stop_I, to_stop_I) in enumerate(zip(stops[:-1], stops[1:])):
+                    arr_time = dep_time + int(round(link_durations[seq]))
+                    connection_rows.append((from_stop_I, to_stop_I, dep_time, arr_time, 3, trip_I, seq + 1, route_I))
+                    dep_time = arr_time + int(random_state.choice([0, 30]))
+    connections = pandas.DataFrame(connection_rows, columns=["from_stop_I", "to_stop_I", "dep_time_ut", "arr_time_ut",
+                                                             "route_type", "trip_I", "seq", "route_I"])
+    connections = connections.sort_values("dep_time_ut", kind="mergesort").reset_index(drop=True)
+
+    pairs = numpy.array(sorted(cKDTree(numpy.column_stack([xs, ys])).query_pairs(max_walk_distance)), dtype=int)
+    pairs = pairs.reshape(-1, 2)[random_state.uniform(size=len(pairs)) < walk_edge_density]
+    distances = numpy.hypot(xs[pairs[:, 0]] - xs[pairs[:, 1]], ys[pairs[:, 0]] - ys[pairs[:, 1]])
+    transfers = pandas.DataFrame({"from_stop_I": pairs[:, 0], "to_stop_I": pairs[:, 1],
+                                  "d": distances.astype(int), "d_walk": (distances * walk_detour_factor).astype(int)})
+    return {"nodes": nodes, "connections": connections, "transfers": transfers}
+
+
+def write_synthetic_network(network, directory):
+    """
+    Write a network (see generate_synthetic_network) as csv extracts.
+
+    Returns
+    -------
+    fnames: dict
+        paths of the "nodes", "connections" and "transfers" extracts
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    fnames = {
+        "nodes": os.path.join(directory, "main.day.nodes.csv"),
+        "connections": os.path.join(directory, "main.day.temporal_network.csv"),
+        "transfers": os.path.join(directory, "main.day.transfers.csv")
+    }
+    network["nodes"].to_csv(fnames["nodes"], sep=";", index=False)
+    network["connections"].to_csv(fnames["connections"], index=False)
+    network["transfers"].to_csv(fnames["transfers"], index=False)
+    return fnames
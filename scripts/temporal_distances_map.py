@@ -2,15 +2,16 @@ import os
 
 import matplotlib.colors
 import numpy
-import pandas
 from matplotlib import gridspec
 from matplotlib import pyplot as plt
 from matplotlib import rc
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
+import plot_settings
 from compute import get_node_profile_statistics
+from extracts import read_nodes
 from plot_profiles_on_a_map import _plot_smopy
-from settings import HELSINKI_NODES_FNAME, FIGS_DIRECTORY
+from settings import FIGS_DIRECTORY
 
 """
 Code for plotting temporal distance maps, and their differences.
@@ -21,7 +22,7 @@ rc("text", usetex=True)
 
 import settings
 targets = [settings.get_stop_I_by_stop_id(settings.AALTO_UNIVERSITY_ID)]
-nodes = pandas.read_csv(HELSINKI_NODES_FNAME, sep=";")
+nodes = read_nodes()
 
 targets_info = nodes[nodes.stop_I.isin(targets)]
 target_lats = targets_info['lat']
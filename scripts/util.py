@@ -1,6 +1,17 @@
+import glob
+import hashlib
+import heapq
+import inspect
+import json
+import os
 import pickle
 import multiprocessing
-import smopy
+import shutil
+
+import numpy
+
+from instrumentation import stage
+from settings import SMOPY_TILE_SERVER
 
 def run_in_parallel(work_func, arg_list, n_cpus, chunksize=1):
     """
@@ -47,6 +58,33 @@ def split_into_equal_length_parts(array, n_splits):
     return lists
 
 
+def split_into_balanced_parts(array, costs, n_splits):
+    """
+    Split array into n_splits parts with roughly equal total cost,
+    by greedily assigning the most costly remaining element to the currently cheapest part.
+
+    Parameters
+    ----------
+    array : list-like
+    costs : list-like
+        estimated cost of each element of array
+    n_splits : int
+
+    Returns
+    -------
+    parts : list of lists
+        within each part, elements are in decreasing order of cost
+    """
+    parts = [[] for _ in range(n_splits)]
+    heap = [(0.0, i) for i in range(n_splits)]
+    order = sorted(range(len(array)), key=lambda i: -costs[i])
+    for i in order:
+        part_cost, part_i = heapq.heappop(heap)
+        parts[part_i].append(array[i])
+        heapq.heappush(heap, (part_cost + costs[i], part_i))
+    return parts
+
+
 def make_filename_nice(fname):
     fname = fname.replace(" ", "_")
     fname = fname.replace("'", "")
@@ -89,21 +127,179 @@ def get_data_or_compute(fname, comp_func, *args, recompute=False, **kwargs):
     try:
         if recompute:
             raise RuntimeError("Recompute!")
-        with open(fname, "rb") as f:
+        with open(fname, "rb") as f, stage("pickle_load", n_bytes=os.path.getsize(fname)):
             print("Loading data")
             data = pickle.load(f)
-    except (RuntimeError, TypeError, EOFError, IOError) as e:
+    except (RuntimeError, TypeError, EOFError, IOError, pickle.UnpicklingError) as e:
         print("Tried to load data from disk, but failed. This is expected if the data has not been yet computed)")
         print("The provided error message was: " + str(e))
-        with open(fname, "wb") as f:
-            data = comp_func(*args, **kwargs)
+        data = comp_func(*args, **kwargs)
+        pickle_dump_atomically(data, fname)
+    return data
+
+
+def pickle_dump_atomically(data, fname):
+    """
+    Pickle data to fname through a temporary file, so that fname is either complete or does not exist
+    (also if the process crashes, or if other processes write the same file concurrently).
+    """
+    directory = os.path.dirname(os.path.abspath(fname))
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    tmp_fname = fname + ".tmp" + str(os.getpid())
+    try:
+        with open(tmp_fname, "wb") as f, stage("pickle_dump") as record:
             pickle.dump(data, f, -1)
+            f.flush()
+            os.fsync(f.fileno())
+            record["n_bytes"] = f.tell()
+        os.replace(tmp_fname, fname)
+    finally:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+
+
+def _cache_key_default(obj):
+    # json serialization of the values that json does not support natively
+    if isinstance(obj, numpy.ndarray):
+        return {"dtype": str(obj.dtype), "shape": list(obj.shape),
+                "sha1": hashlib.sha1(numpy.ascontiguousarray(obj).tobytes()).hexdigest()}
+    if isinstance(obj, numpy.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    return repr(obj)
+
+
+def get_cache_key(comp_func, args=(), kwargs=None, key_params=None, input_fnames=()):
+    """
+    A hash identifying the result of comp_func(*args, **kwargs).
+
+    The key covers the identity of comp_func (its module, name and source code), all arguments,
+    any additional parameters the result depends on (key_params), and the fingerprints of the input files.
+
+    Returns
+    -------
+    key: str
+    """
+    try:
+        source = inspect.getsource(comp_func)
+    except (OSError, TypeError):
+        source = None
+    key = {
+        "function": [getattr(comp_func, "__module__", None), getattr(comp_func, "__qualname__", repr(comp_func))],
+        "source_sha1": hashlib.sha1(source.encode("utf-8")).hexdigest() if source is not None else None,
+        "args": list(args),
+        "kwargs": kwargs if kwargs is not None else {},
+        "key_params": key_params,
+        "inputs": [file_fingerprint(fname) for fname in input_fnames]
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=_cache_key_default).encode("utf-8")).hexdigest()
+
+
+def get_data_or_compute_cached(cache_directory, comp_func, *args, recompute=False, key_params=None, input_fnames=(),
+                               max_cache_bytes=None, **kwargs):
+    """
+    A content-addressed pickle cache: like get_data_or_compute, but the cache file name is derived from
+    get_cache_key, so that changing any argument, key_params or input file results in a recomputation.
+
+    Parameters
+    ----------
+    cache_directory : str
+    comp_func : callable
+    recompute : bool, optional
+    key_params : dict, optional
+        parameters the result depends on that are not arguments of comp_func (e.g. defaults filled in by comp_func)
+    input_fnames : list[str], optional
+        files the result depends on
+    max_cache_bytes : int, optional
+        least recently used cache entries are removed once the cache grows larger than this
+    args:
+        positional arguments to be passed to comp_func
+    kwargs:
+        keyword arguments to be passed to comp_func
+
+    Returns
+    -------
+    data: object
+    """
+    key = get_cache_key(comp_func, args, kwargs, key_params, input_fnames)
+    fname = os.path.join(cache_directory, getattr(comp_func, "__name__", "result").strip("_") + "_" + key + ".pickle")
+    if not recompute and os.path.exists(fname):
+        try:
+            with open(fname, "rb") as f, stage("pickle_load", n_bytes=os.path.getsize(fname)):
+                data = pickle.load(f)
+            os.utime(fname, None)  # mark as recently used
+            print("Loaded cached data from " + fname)
+            return data
+        except (EOFError, IOError, pickle.UnpicklingError) as e:
+            print("Could not read cached data, recomputing: " + str(e))
+    data = comp_func(*args, **kwargs)
+    pickle_dump_atomically(data, fname)
+    if max_cache_bytes is not None:
+        evict_least_recently_used_files(cache_directory, max_cache_bytes)
     return data
 
 
+def file_fingerprint(fname, n_bytes_hashed=2 ** 20):
+    """
+    A cheap fingerprint of a (possibly large) file for cache keys:
+    size, modification time, and a sha1 hash of the first and last n_bytes_hashed bytes.
+
+    Returns
+    -------
+    fingerprint: dict
+    """
+    stat = os.stat(fname)
+    sha1 = hashlib.sha1()
+    with open(fname, "rb") as f:
+        sha1.update(f.read(n_bytes_hashed))
+        if stat.st_size > n_bytes_hashed:
+            f.seek(max(n_bytes_hashed, stat.st_size - n_bytes_hashed))
+            sha1.update(f.read(n_bytes_hashed))
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": sha1.hexdigest()}
+
+
+def _get_size_in_bytes(fname):
+    if not os.path.isdir(fname):
+        return os.stat(fname).st_size
+    return sum(os.stat(os.path.join(dirpath, name)).st_size
+               for dirpath, _, names in os.walk(fname) for name in names)
+
+
+def evict_least_recently_used_files(directory, max_bytes, pattern="*"):
+    """
+    Remove the least recently used (by modification time) files (or directories) in directory
+    until their total size is at most max_bytes.
+    Temporary files and directories (with ".tmp" in their name) are not touched.
+    """
+    fnames = [fname for fname in glob.glob(os.path.join(directory, pattern)) if ".tmp" not in os.path.basename(fname)]
+    fname_stats = []
+    for fname in fnames:
+        try:
+            fname_stats.append((fname, os.stat(fname).st_mtime, _get_size_in_bytes(fname)))
+        except OSError:
+            continue
+    fname_stats.sort(key=lambda fname_stat: fname_stat[1])
+    total_bytes = sum(size for _, _, size in fname_stats)
+    for fname, _, size in fname_stats:
+        if total_bytes <= max_bytes:
+            break
+        try:
+            if os.path.isdir(fname):
+                shutil.rmtree(fname)
+            else:
+                os.remove(fname)
+            total_bytes -= size
+        except OSError:
+            pass
+
+
 def get_smopy_map(lat_min, lat_max, lon_min, lon_max, z):
     args = (lat_min, lat_max, lon_min, lon_max, z)
     if args not in get_smopy_map.maps:
+        import smopy
+        smopy.TILE_SERVER = SMOPY_TILE_SERVER
         smopy.Map.get_allowed_zoom = lambda self, z: z
         get_smopy_map.maps[args] = smopy.Map((lat_min, lon_min, lat_max, lon_max), z=z)
     return get_smopy_map.maps[args]
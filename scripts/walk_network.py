@@ -0,0 +1,237 @@
+"""
+Walking transfers between stops as a compressed-sparse-row (CSR) network.
+"""
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import numpy
+
+
+class CSRWalkNetwork:
+    """
+    An undirected walk network stored as three flat arrays (CSR format):
+    the neighbors of the i'th node (self.nodes_array[i]) are
+    self.indices[self.indptr[i]:self.indptr[i + 1]] (in increasing order of stop_I),
+    and the walking distances to them are stored in the same slice of self.d_walk.
+
+    The class also implements the (networkx 1.x) Graph methods used by the gtfspy routing algorithms
+    so that it can be passed to those as the walk_network.
+    The CSR arrays and the precomputed walk durations are scanned directly only by the scanners of this repository
+    (sampled_profiler, batch_profiler and the final footpath scan of csr_profiler); the other footpath scans of
+    MultiObjectivePseudoCSAProfiler go through the networkx-compatible methods, and are no faster than with
+    a networkx.Graph.
+    """
+
+    def __init__(self, from_stop_I, to_stop_I, d_walk, walking_speed=None):
+        """
+        Parameters
+        ----------
+        from_stop_I, to_stop_I, d_walk: array-like
+            one element per (undirected) edge
+            if an edge is given multiple times, the last given d_walk is used (as with networkx.Graph.add_edge)
+        walking_speed: float, optional
+            walking speed in meters / second, used for precomputing walk durations
+        """
+        from_stop_I = numpy.asarray(from_stop_I, dtype=numpy.int64)
+        to_stop_I = numpy.asarray(to_stop_I, dtype=numpy.int64)
+        d_walk = numpy.asarray(d_walk, dtype=numpy.int32)
+        u = numpy.minimum(from_stop_I, to_stop_I)
+        v = numpy.maximum(from_stop_I, to_stop_I)
+
+        # keep only the last occurrence of each edge:
+        n_edges = len(u)
+        _, last_indices = numpy.unique(numpy.stack([u[::-1], v[::-1]], axis=1), axis=0, return_index=True)
+        last_indices = n_edges - 1 - last_indices
+        u, v, d_walk = u[last_indices], v[last_indices], d_walk[last_indices]
+
+        # both directions of each edge (self-loops only once):
+        not_loop = u != v
+        rows = numpy.concatenate([u, v[not_loop]])
+        cols = numpy.concatenate([v, u[not_loop]])
+        d_walk = numpy.concatenate([d_walk, d_walk[not_loop]])
+        order = numpy.lexsort((cols, rows))
+        rows, cols, d_walk = rows[order], cols[order], d_walk[order]
+
+        self.nodes_array = numpy.unique(numpy.concatenate([rows, cols]))
+        self.indptr = numpy.searchsorted(rows, self.nodes_array, side="left")
+        self.indptr = numpy.append(self.indptr, len(rows)).astype(numpy.int64)
+        self.indices = cols
+        self.d_walk = d_walk
+        self.walking_speed = None
+        self.walk_durations = None
+        if walking_speed is not None:
+            self.set_walking_speed(walking_speed)
+        self.graph = {}
+
+    @classmethod
+    def from_csr_arrays(cls, nodes_array, indptr, indices, d_walk, walking_speed=None):
+        """
+        Create a network directly from the arrays returned by csr_arrays().
+        """
+        net = cls.__new__(cls)
+        net.nodes_array = numpy.asarray(nodes_array)
+        net.indptr = numpy.asarray(indptr)
+        net.indices = numpy.asarray(indices)
+        net.d_walk = numpy.asarray(d_walk)
+        net.walking_speed = None
+        net.walk_durations = None
+        if walking_speed is not None:
+            net.set_walking_speed(walking_speed)
+        net.graph = {}
+        return net
+
+    def csr_arrays(self):
+        """
+        Returns
+        -------
+        name_to_array: dict
+            the arrays needed for CSRWalkNetwork.from_csr_arrays
+        """
+        return {"nodes_array": self.nodes_array, "indptr": self.indptr, "indices": self.indices, "d_walk": self.d_walk}
+
+    def set_walking_speed(self, walking_speed):
+        """
+        Precompute walk durations (in whole seconds, as in the gtfspy routing algorithms),
+        returned by neighbor_arrays.
+        """
+        self.walking_speed = walking_speed
+        self.walk_durations = (self.d_walk / float(walking_speed)).astype(numpy.int64)
+
+    def _node_index(self, stop_I):
+        index = numpy.searchsorted(self.nodes_array, stop_I)
+        if index < len(self.nodes_array) and self.nodes_array[index] == stop_I:
+            return index
+        return None
+
+    def _row_slice(self, stop_I):
+        index = self._node_index(stop_I)
+        if index is None:
+            return slice(0, 0)
+        return slice(self.indptr[index], self.indptr[index + 1])
+
+    def neighbor_arrays(self, stop_I):
+        """
+        Returns
+        -------
+        neighbors: numpy.ndarray
+        d_walks: numpy.ndarray
+        walk_durations: numpy.ndarray, None
+            None if walking speed has not been set
+        """
+        row = self._row_slice(stop_I)
+        walk_durations = None
+        if self.walk_durations is not None:
+            walk_durations = self.walk_durations[row]
+        return self.indices[row], self.d_walk[row], walk_durations
+
+    def number_of_edges(self):
+        n_loops = numpy.count_nonzero(self.indices == numpy.repeat(self.nodes_array, numpy.diff(self.indptr)))
+        return (len(self.indices) + n_loops) // 2
+
+    # networkx.Graph compatible interface:
+
+    def is_directed(self):
+        return False
+
+    def is_multigraph(self):
+        return False
+
+    def nodes(self):
+        return self.nodes_array.tolist()
+
+    @property
+    def node(self):
+        return _CSRNodeView(self)
+
+    @property
+    def adj(self):
+        return _CSRAdjacencyView(self)
+
+    def has_node(self, n):
+        return self._node_index(n) is not None
+
+    def __contains__(self, n):
+        return self.has_node(n)
+
+    def __iter__(self):
+        return iter(self.nodes())
+
+    def __len__(self):
+        return len(self.nodes_array)
+
+    def neighbors(self, n):
+        return self.indices[self._row_slice(n)].tolist()
+
+    def neighbors_iter(self, n):
+        return iter(self.neighbors(n))
+
+    def has_edge(self, u, v):
+        row_neighbors = self.indices[self._row_slice(u)]
+        index = numpy.searchsorted(row_neighbors, v)
+        return index < len(row_neighbors) and row_neighbors[index] == v
+
+    def get_edge_data(self, u, v, default=None):
+        row = self._row_slice(u)
+        row_neighbors = self.indices[row]
+        index = numpy.searchsorted(row_neighbors, v)
+        if index < len(row_neighbors) and row_neighbors[index] == v:
+            return {"d_walk": int(self.d_walk[row][index])}
+        return default
+
+    def edges_iter(self, nbunch=None, data=False):
+        if nbunch is None:
+            nbunch = self.nodes_array.tolist()
+            only_once = True
+        else:
+            only_once = False
+        for u in nbunch:
+            row = self._row_slice(u)
+            for v, d_walk in zip(self.indices[row].tolist(), self.d_walk[row].tolist()):
+                if only_once and v < u:
+                    continue
+                if data:
+                    yield u, v, {"d_walk": d_walk}
+                else:
+                    yield u, v
+
+    def edges(self, nbunch=None, data=False):
+        return list(self.edges_iter(nbunch, data))
+
+
+class _CSRNodeView(Mapping):
+    """
+    Read-only stand-in for networkx.Graph.node (nodes have no attributes).
+    """
+
+    def __init__(self, net):
+        self._net = net
+
+    def __getitem__(self, n):
+        if not self._net.has_node(n):
+            raise KeyError(n)
+        return {}
+
+    def __contains__(self, n):
+        return self._net.has_node(n)
+
+    def __iter__(self):
+        return iter(self._net.nodes())
+
+    def __len__(self):
+        return len(self._net)
+
+
+class _CSRAdjacencyView(_CSRNodeView):
+    """
+    Read-only stand-in for networkx.Graph.adj: maps u -> {v: {"d_walk": d_walk}}.
+    """
+
+    def __getitem__(self, u):
+        if not self._net.has_node(u):
+            raise KeyError(u)
+        row = self._net._row_slice(u)
+        return {v: {"d_walk": d_walk} for v, d_walk in
+                zip(self._net.indices[row].tolist(), self._net.d_walk[row].tolist())}